@@ -1,28 +1,20 @@
-import inspect
 import sys
-import typing
 
-from pydantic import BaseModel
-
-from quack2tex.pyqt import (
-    QApplication, Qt, QIcon, QFile, QPalette, QColor, QCursor, QFontDatabase,QIODevice
-)
 from modihub.llm import LLM
-from .resources import * # noqa
-from .utils import GuiUtils
-from .windows import MainWindow
-from quack2tex.repository.db.sync_session import init_db
+from .latex import latify, alatify, Quack2TexWrappedFunctionResult
+
+# the GUI is imported when the application runs, so the headless commands and the library load without Qt
 
-class Quack2TexWrappedFunctionResult(BaseModel):
-      result: typing.Any
-      latex: str 
 
-def apply_theme(app: QApplication) -> None:
+def apply_theme(app: "QApplication") -> None:
     """
     Apply the theme to the application
     :param app:
     :return:
     """
+    from quack2tex.pyqt import QApplication, QIcon, QFile, QPalette, QColor, QFontDatabase, QIODevice
+    from . import resources  # noqa: F401
+
     app.setStyle("Fusion")
     QFontDatabase.addApplicationFont(":/fonts/Roboto/Roboto-Regular.ttf")
     app.setWindowIcon(QIcon(":icons/rubber-duck.png"))
@@ -47,29 +39,16 @@ def apply_theme(app: QApplication) -> None:
     QApplication.setPalette(palette)
 
 
-# create quack2tex decorator
-def latify(model: str = None):
-    """
-    Decorator to convert a function to LaTeX using the LLM model
-    :param kwargs:
-    :return:
-    """
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            llm = LLM.create(model or "models/gemini-1.5-flash-latest")
-            func_code = inspect.getsource(func)
-            prompt = kwargs.get("prompt", "Generate a LaTeX representation of the following function in markdown format:")
-            response = llm(prompt + "\n\n" + func_code)
-            result = func(*args, **kwargs)
-            return Quack2TexWrappedFunctionResult(result=result, latex=response)
-        return wrapper
-    return decorator
-
 def run_app() -> None:
     """
     Run the application.
     :return:
     """
+    from quack2tex.pyqt import QApplication, Qt, QCursor
+    from . import resources  # noqa: F401
+    from .windows import MainWindow
+    from quack2tex.repository.db.sync_session import init_db
+
     app = QApplication(sys.argv)
     # apply_theme(app)
     init_db()
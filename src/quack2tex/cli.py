@@ -1,4 +1,8 @@
+import contextlib
 import os
+import sys
+import typing
+from pathlib import Path
 
 import typer
 from dotenv import load_dotenv, find_dotenv
@@ -8,18 +12,16 @@ import quack2tex
 app = typer.Typer(invoke_without_command=True)
 
 
-@app.command()
-def start(
-    gemini_api_key: str = typer.Option(None, envvar="GEMINI_API_KEY", help="Google Gemini API key"),
-    openai_api_key: str = typer.Option(None, envvar="OPENAI_API_KEY", help="OpenAI API key"),
-    anthropic_api_key: str = typer.Option(None, envvar="ANTHROPIC_API_KEY", help="Anthropic API key"),
-    groq_api_key: str = typer.Option(None, envvar="GROQ_API_KEY", help="Groq API key"),
-):
+GeminiApiKey = typer.Option(None, envvar="GEMINI_API_KEY", help="Google Gemini API key")
+OpenAIApiKey = typer.Option(None, envvar="OPENAI_API_KEY", help="OpenAI API key")
+AnthropicApiKey = typer.Option(None, envvar="ANTHROPIC_API_KEY", help="Anthropic API key")
+GroqApiKey = typer.Option(None, envvar="GROQ_API_KEY", help="Groq API key")
+
+
+def set_api_keys(gemini_api_key: str, openai_api_key: str, anthropic_api_key: str, groq_api_key: str):
     """
-    Start the Quack2Tex application with optional LLM API keys.
-    You can provide keys via command-line or environment variables.
+    Set the API keys given on the command line in the environment.
     """
-    # Set API keys in environment if provided
     api_keys = {
         "GEMINI_API_KEY": gemini_api_key,
         "OPENAI_API_KEY": openai_api_key,
@@ -31,10 +33,215 @@ def start(
         if value:
             os.environ[key] = value
 
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    gemini_api_key: str = GeminiApiKey,
+    openai_api_key: str = OpenAIApiKey,
+    anthropic_api_key: str = AnthropicApiKey,
+    groq_api_key: str = GroqApiKey,
+):
+    """
+    Quack2Tex, the application is started when no command is given.
+    """
+    set_api_keys(gemini_api_key, openai_api_key, anthropic_api_key, groq_api_key)
+    if ctx.invoked_subcommand is None:
+        quack2tex.run_app()
+
+
+@app.command()
+def start(
+    gemini_api_key: str = GeminiApiKey,
+    openai_api_key: str = OpenAIApiKey,
+    anthropic_api_key: str = AnthropicApiKey,
+    groq_api_key: str = GroqApiKey,
+):
+    """
+    Start the Quack2Tex application with optional LLM API keys.
+    You can provide keys via command-line or environment variables.
+    """
+    # Set API keys in environment if provided
+    set_api_keys(gemini_api_key, openai_api_key, anthropic_api_key, groq_api_key)
+
     # Start the main app
     quack2tex.run_app()
 
 
+@app.command()
+def batch(
+    inputs: typing.List[str] = typer.Argument(..., help="Image or text files, directories or glob patterns"),
+    action: str = typer.Option(None, help="Name of a saved menu action"),
+    models: str = typer.Option(None, help="Comma separated models, overrides the ones of the action"),
+    system_instruction: str = typer.Option(None, help="System instruction, overrides the one of the action"),
+    guidance_prompt: str = typer.Option(None, help="Guidance prompt, overrides the one of the action"),
+    strategy: str = typer.Option(None, help="Inference strategy: all, race or cascade"),
+    validators: str = typer.Option(
+        None, help="Acceptance checks of the race and cascade strategies, separated by new lines, e.g. latex_parsable"
+    ),
+    use_cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse cached responses for identical inputs"),
+    output: Path = typer.Option(None, "--output", "-o", help="JSONL file receiving the results, stdout by default"),
+    workers: int = typer.Option(4, help="Number of files processed at the same time"),
+):
+    """
+    Run an action on many images or text files without opening the application.
+    The results are written as one JSON line per file as soon as each file is done.
+    """
+    from quack2tex.enums import InferenceStrategy
+    from quack2tex.inference import BatchRunner, OutputValidator, PromptProcessor
+    from quack2tex.repository import MenuItemRepository
+    from quack2tex.repository.db.sync_session import init_db, get_db_session
+
+    # the model calls are recorded in the database even without saved action
+    init_db()
+    prompt_data = {"action": action, "capture_mode": "batch", "strategy": InferenceStrategy.ALL.value}
+    if action:
+        with get_db_session() as session:
+            menu_item = MenuItemRepository.fetch_item_by_name(session, action)
+            if menu_item is None:
+                raise typer.BadParameter(f"No saved action named {action!r}", param_hint="--action")
+            prompt_data = PromptProcessor.get_prompt_data(menu_item)
+    overrides = {
+        "models": models,
+        "system_instruction": system_instruction,
+        "guidance_prompt": guidance_prompt,
+        "strategy": strategy,
+        "validators": validators,
+    }
+    prompt_data.update({key: value for key, value in overrides.items() if value is not None})
+    prompt_data["use_cache"] = prompt_data.get("use_cache", True) and use_cache
+    if not prompt_data.get("models"):
+        raise typer.BadParameter("No models given, use --action or --models", param_hint="--models")
+    try:
+        OutputValidator.from_spec(prompt_data.get("validators"))
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--validators")
+
+    paths = BatchRunner.collect_inputs(inputs)
+    if not paths:
+        raise typer.BadParameter("No image or text file found", param_hint="INPUTS")
+    typer.echo(f"Processing {len(paths)} files with {prompt_data['models']}", err=True)
+
+    runner = BatchRunner(max_workers=workers)
+    with open(output, "a", encoding="utf-8") if output else contextlib.nullcontext(sys.stdout) as stream:
+        failures = runner.run(paths, prompt_data, stream)
+    typer.echo(f"Done, {len(paths) - failures} succeeded, {failures} failed", err=True)
+    raise typer.Exit(code=1 if failures else 0)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(8765, help="Port to listen on"),
+):
+    """
+    Serve the inference pipeline over a local HTTP API, without opening the application.
+    Editors and scripts share the warm clients, queues and caches of this process.
+    """
+    import logging
+    from quack2tex.repository.db.sync_session import init_db
+    from quack2tex.server import InferenceServer
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    init_db()
+    server = InferenceServer((host, port))
+    typer.echo(f"Serving on {server.url}, press Ctrl+C to stop", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.prompt_processor.scheduler.shutdown(wait=False, cancel_pending=True)
+
+
+@app.command()
+def stats(
+    window: int = typer.Option(100, help="Number of recent calls considered per model"),
+    models: str = typer.Option(None, help="Comma separated models, all the recorded ones by default"),
+):
+    """
+    Show the latency percentiles and error rate of every model over its recent calls.
+    """
+    from quack2tex.inference import InferenceStats
+    from quack2tex.repository.db.sync_session import init_db
+
+    init_db()
+    model_stats = InferenceStats().get_model_stats(window, models.split(",") if models else None)
+    if not model_stats:
+        typer.echo("No model call recorded yet", err=True)
+        return
+
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+
+    header = f"{'model':<40} {'calls':>6} {'errors':>7} {'ttft p50':>9} {'ttft p95':>9} {'p50':>8} {'p95':>8}"
+    typer.echo(header)
+    for model, model_stat in sorted(model_stats.items()):
+        typer.echo(
+            f"{model:<40} {model_stat['calls']:>6} {model_stat['error_rate']:>7.1%} "
+            f"{seconds(model_stat['ttft_p50']):>9} {seconds(model_stat['ttft_p95']):>9} "
+            f"{seconds(model_stat['latency_p50']):>8} {seconds(model_stat['latency_p95']):>8}"
+        )
+
+
+@app.command(name="latify")
+def latify_package(
+    path: Path = typer.Argument(..., exists=True, help="Package directory or Python file"),
+    output: Path = typer.Option(
+        None, "--output", "-o", help="Document receiving the LaTeX, markdown or .tex by suffix, stdout by default"
+    ),
+    model: str = typer.Option(None, help="Model generating the LaTeX, QUACK2TEX_LATIFY_MODEL by default"),
+    prompt: str = typer.Option(None, help="Instruction applied to every function"),
+    decorated_only: bool = typer.Option(False, "--decorated-only", help="Only the functions decorated with latify"),
+    batch_size: int = typer.Option(8, help="Maximum number of functions sent in one request"),
+    translator: bool = typer.Option(
+        True, "--translator/--no-translator", help="Translate the arithmetic functions offline first"
+    ),
+):
+    """
+    Convert every function of a package to LaTeX, as a single document.
+    Only the functions whose source changed since the last run are sent to the model.
+    """
+    from quack2tex.latex import PackageLatifier
+    from quack2tex.repository.db.sync_session import init_db
+
+    # the model calls are recorded in the database
+    init_db()
+    functions = PackageLatifier.collect_functions(path, decorated_only=decorated_only)
+    if not functions:
+        raise typer.BadParameter("No function found", param_hint="PATH")
+    output_format = "tex" if output is not None and output.suffix == ".tex" else "markdown"
+    latifier = PackageLatifier(
+        model=model, prompt=prompt, batch_size=batch_size, use_translator=translator, output_format=output_format
+    )
+    counters = latifier.run(functions)
+    title = path.stem if path.is_file() else path.resolve().name
+    document = (
+        PackageLatifier.to_tex(functions, title)
+        if output_format == "tex"
+        else PackageLatifier.to_markdown(functions, title)
+    )
+    if output is None:
+        sys.stdout.write(document)
+    else:
+        output.write_text(document, encoding="utf-8")
+    typer.echo(
+        f"{len(functions)} functions: {counters['translated']} translated offline, {counters['stored']} unchanged, "
+        f"{counters['sent']} sent in {counters['requests']} requests, {counters['failed']} failed",
+        err=True,
+    )
+    compile_error = None
+    if output_format == "tex":
+        try:
+            compile_error = PackageLatifier.compile_tex(document)
+        except FileNotFoundError:
+            typer.echo("pdflatex not found, the document was not compiled", err=True)
+        if compile_error:
+            typer.echo(f"The document does not compile: {compile_error}", err=True)
+    raise typer.Exit(code=1 if counters["failed"] or compile_error else 0)
+
+
 def run():
     """
     Entry point: Load environment variables and invoke CLI app.
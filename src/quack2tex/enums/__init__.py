@@ -1 +1,2 @@
-from .capture_mode import CaptureMode
\ No newline at end of file
+from .capture_mode import CaptureMode
+from .inference_strategy import InferenceStrategy
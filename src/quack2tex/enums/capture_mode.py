@@ -6,4 +6,5 @@ class CaptureMode(str, Enum):
     CLIPBOARD = "clipboard"
     VOICE = "voice"
     TEXT = "text"
+    WATCH = "watch"
 
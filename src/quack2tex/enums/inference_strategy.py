@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class InferenceStrategy(str, Enum):
+    ALL = "all"
+    RACE = "race"
+    CASCADE = "cascade"
@@ -0,0 +1,14 @@
+from .response_cache import ResponseCache
+from .llm_stream import LLMStream
+from .client_pool import LLMClientPool
+from .scheduler import InferenceScheduler
+from .output_validator import OutputValidator
+from .request_coalescer import RequestCoalescer
+from .rate_limiter import RateLimiter
+from .prompt_processor import PromptProcessor
+from .batch_runner import BatchRunner
+from .image_preprocessor import ImagePreprocessor
+from .near_duplicate_index import NearDuplicateIndex
+from .cassette import Cassette, CassetteMiss, ReplayedError
+from .inference_stats import InferenceStats
+from .model_router import ModelRouter
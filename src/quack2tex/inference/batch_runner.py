@@ -0,0 +1,113 @@
+import glob
+import json
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from quack2tex.utils import PromptPayload
+from .prompt_processor import PromptProcessor
+
+
+class BatchRunner:
+    """
+    Applies an action to many files without the application windows.
+
+    Files are processed by a bounded pool of workers, every file being one prompt request whose
+    model calls go through the shared scheduler, and a JSON line is written for each file as soon
+    as it is done, so a long run can be followed and resumed from its output.
+    """
+
+    IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+    TEXT_SUFFIXES = {".txt", ".md", ".tex"}
+
+    def __init__(self, prompt_processor: PromptProcessor = None, max_workers: int = 4):
+        """
+        Initialize the batch runner.
+
+        :param prompt_processor:
+        :param max_workers: Number of files processed at the same time
+        """
+        self.prompt_processor = prompt_processor or PromptProcessor(show_progress=False)
+        self.max_workers = max_workers
+
+    @classmethod
+    def collect_inputs(cls, patterns: typing.List[str]) -> typing.List[Path]:
+        """
+        Get the supported files from files, directories and glob patterns.
+        :param patterns:
+        :return: The files sorted by path, without duplicates
+        """
+        suffixes = cls.IMAGE_SUFFIXES | cls.TEXT_SUFFIXES
+        files = set()
+        for pattern in patterns:
+            path = Path(pattern)
+            if path.is_dir():
+                candidates = path.rglob("*")
+            elif path.is_file():
+                candidates = [path]
+            else:
+                candidates = map(Path, glob.glob(pattern, recursive=True))
+            files.update(file for file in candidates if file.is_file() and file.suffix.lower() in suffixes)
+        return sorted(files)
+
+    @classmethod
+    def load_input(cls, path: Path) -> typing.Union[str, PromptPayload]:
+        """
+        Load a file as a prompt input.
+        :param path:
+        :return: An image payload reusing the file bytes for images, the text otherwise
+        """
+        if path.suffix.lower() in cls.IMAGE_SUFFIXES:
+            return PromptPayload.from_bytes(path.read_bytes())
+        return path.read_text(encoding="utf-8")
+
+    def process_file(self, path: Path, prompt_data: dict) -> dict:
+        """
+        Run the action on a single file.
+        :param path:
+        :param prompt_data:
+        :return: The JSON record of the file, with an error when the file or one of the models failed
+        """
+        started_at = time.perf_counter()
+        record = {"input": str(path), "action": prompt_data.get("action"), "results": {}, "error": None}
+        try:
+            prompt_input = self.load_input(path)
+            record["results"] = self.prompt_processor.process_prompt_request(prompt_data, prompt_input)
+            # the failed models are reported as error outputs, not raised
+            failed_models = [
+                model for model, output in record["results"].items() if PromptProcessor.is_error_output(output)
+            ]
+            if failed_models:
+                record["error"] = f"Failed models: {', '.join(failed_models)}"
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["elapsed"] = round(time.perf_counter() - started_at, 3)
+        return record
+
+    def run(
+        self,
+        paths: typing.List[Path],
+        prompt_data: dict,
+        output: typing.TextIO,
+        on_record: typing.Callable[[dict], None] = None,
+    ) -> int:
+        """
+        Run the action on all the files, writing one JSON line per file in completion order.
+        :param paths:
+        :param prompt_data:
+        :param output: Text stream receiving the JSON lines
+        :param on_record: optional callback receiving every record once written
+        :return: The number of files that failed
+        """
+        failures = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quack2tex-batch") as executor:
+            futures = [executor.submit(self.process_file, path, prompt_data) for path in paths]
+            for future in as_completed(futures):
+                record = future.result()
+                failures += record["error"] is not None
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                if on_record is not None:
+                    on_record(record)
+        return failures
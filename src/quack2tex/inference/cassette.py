@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import time
+import typing
+from collections import defaultdict
+from pathlib import Path
+from threading import Lock
+
+from quack2tex.utils import LibUtils, Singleton
+from .response_cache import ResponseCache
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode by a model call that was never recorded.
+    """
+
+
+class ReplayedError(RuntimeError):
+    """
+    Raised in replay mode by a model call that failed when it was recorded.
+    """
+
+
+class Cassette(metaclass=Singleton):
+    """
+    Record and replay of the model calls, to run the inference pipeline without API keys.
+
+    In record mode every call is forwarded to the model and its fingerprint, the chunks it
+    streamed with their offsets from the start of the call, and its error if it failed, are
+    appended to a JSON lines file. In replay mode no client is created, the call is served from
+    the file with the recorded timings, scaled by `latency_scale`, so latency regressions of the
+    pipeline can be reproduced offline. Calls recorded several times, e.g. retried after a
+    rate limit, are replayed in the order they were recorded.
+
+    The mode is set with QUACK2TEX_CASSETTE_MODE, off, record or replay, for the application and
+    the headless commands alike.
+    """
+
+    MODES = ("off", "record", "replay")
+
+    def __init__(self, mode: str = None, cassette_file: typing.Union[str, Path] = None, latency_scale: float = None):
+        """
+        Initialize the cassette.
+
+        :param mode: off, record or replay
+        :param cassette_file: JSON lines file holding the recorded calls
+        :param latency_scale: Factor applied to the recorded timings on replay, 0 to replay instantly
+        """
+        self.mode = (mode or os.getenv("QUACK2TEX_CASSETTE_MODE", "off")).lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unsupported cassette mode {self.mode}, expected one of {self.MODES}")
+        self.cassette_file = Path(cassette_file or LibUtils.get_cassette_file())
+        if latency_scale is None:
+            latency_scale = float(os.getenv("QUACK2TEX_CASSETTE_LATENCY_SCALE", 1.0))
+        self.latency_scale = latency_scale
+        self._lock = Lock()
+        self._entries: typing.Optional[typing.Dict[str, typing.List[dict]]] = None
+        self._replayed: typing.Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def fingerprint(model: str, system_instruction: str, prompt: typing.Any) -> str:
+        """
+        Identify a model call by its model, system instruction and the content of its prompt parts.
+        :param model:
+        :param system_instruction:
+        :param prompt: A string, a PIL image, an image payload or a list of them
+        :return:
+        """
+        digest = hashlib.sha256()
+        parts = prompt if isinstance(prompt, list) else [prompt]
+        for part in (model, system_instruction or "", *(ResponseCache.hash_input(part) for part in parts)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def iter_chunks(
+        self,
+        model: str,
+        system_instruction: str,
+        prompt: typing.Any,
+        generate: typing.Callable[[], typing.Iterator[str]],
+    ) -> typing.Iterator[str]:
+        """
+        Generate the response of a model call according to the mode.
+        :param model:
+        :param system_instruction:
+        :param prompt:
+        :param generate: Starts the live call, not called in replay mode
+        :return:
+        """
+        if self.mode == "replay":
+            yield from self.replay(self.fingerprint(model, system_instruction, prompt))
+        elif self.mode == "record":
+            yield from self.record(self.fingerprint(model, system_instruction, prompt), model, generate)
+        else:
+            yield from generate()
+
+    def record(self, fingerprint: str, model: str, generate: typing.Callable[[], typing.Iterator[str]]):
+        """
+        Forward a call to the model and store it once done or failed.
+        :param fingerprint:
+        :param model:
+        :param generate:
+        :return:
+        """
+        started_at = time.perf_counter()
+        chunks = []
+        entry = {"fingerprint": fingerprint, "model": model, "chunks": chunks, "error": None}
+        # a generator closed by its consumer exits on GeneratorExit, so a call stopped midway is not stored
+        try:
+            for chunk in generate():
+                chunks.append([round(time.perf_counter() - started_at, 4), chunk])
+                yield chunk
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+            entry["elapsed"] = round(time.perf_counter() - started_at, 4)
+            self.save(entry)
+            raise
+        entry["elapsed"] = round(time.perf_counter() - started_at, 4)
+        self.save(entry)
+
+    def replay(self, fingerprint: str) -> typing.Iterator[str]:
+        """
+        Serve a recorded call with its recorded timings.
+        :param fingerprint:
+        :return:
+        """
+        entry = self.next_entry(fingerprint)
+        if entry is None:
+            raise CassetteMiss(f"No recorded call matches fingerprint {fingerprint} in {self.cassette_file}")
+        started_at = time.perf_counter()
+        for offset, chunk in entry["chunks"]:
+            self._sleep_until(started_at, offset)
+            yield chunk
+        if entry.get("error"):
+            self._sleep_until(started_at, entry.get("elapsed", 0.0))
+            raise ReplayedError(entry["error"])
+
+    def _sleep_until(self, started_at: float, offset: float) -> None:
+        delay = offset * self.latency_scale - (time.perf_counter() - started_at)
+        if delay > 0:
+            time.sleep(delay)
+
+    def save(self, entry: dict) -> None:
+        """
+        Append a recorded call to the cassette file.
+        :param entry:
+        :return:
+        """
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self.cassette_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cassette_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            if self._entries is not None:
+                self._entries[entry["fingerprint"]].append(entry)
+
+    def next_entry(self, fingerprint: str) -> typing.Optional[dict]:
+        """
+        Get the next recording of a call, the last one is served again once all were replayed.
+        :param fingerprint:
+        :return: None when the call was never recorded
+        """
+        with self._lock:
+            if self._entries is None:
+                self._entries = self.load()
+            entries = self._entries.get(fingerprint)
+            if not entries:
+                return None
+            index = min(self._replayed[fingerprint], len(entries) - 1)
+            self._replayed[fingerprint] += 1
+            return entries[index]
+
+    def load(self) -> typing.Dict[str, typing.List[dict]]:
+        """
+        Read the recorded calls, grouped by fingerprint in the order they were recorded.
+        :return:
+        """
+        entries = defaultdict(list)
+        if not self.cassette_file.exists():
+            return entries
+        with open(self.cassette_file, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["fingerprint"]].append(entry)
+        return entries
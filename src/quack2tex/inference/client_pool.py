@@ -0,0 +1,214 @@
+import logging
+import os
+import time
+import typing
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+from modihub.llm import LLM, LLMClient
+
+from quack2tex.utils import Singleton, Tracer
+
+logger = logging.getLogger(__name__)
+
+class LLMClientPool(metaclass=Singleton):
+    """
+    Process-wide pool of model clients keyed by (model, system instruction).
+
+    Building a modihub client lists the provider models and opens a new HTTP client, so clients
+    are kept alive and reused across requests. Clients idle for longer than `max_idle_time`, or the
+    least recently used ones once the pool holds more than `max_size` clients, are closed.
+
+    Clients can be warmed up ahead of a request, while the user is still capturing its input, so
+    the request starts with a built client and an open connection.
+    """
+
+    def __init__(self, max_idle_time: float = None, max_size: int = None, warm_interval: float = None):
+        """
+        Initialize the client pool.
+
+        :param max_idle_time: Seconds a client can stay unused before being evicted
+        :param max_size: Maximum number of pooled clients
+        :param warm_interval: Seconds a client used or warmed up is considered to still have an open connection
+        """
+        self.max_idle_time = float(max_idle_time or os.getenv("QUACK2TEX_CLIENT_POOL_IDLE_TIMEOUT", 600))
+        self.max_size = int(max_size or os.getenv("QUACK2TEX_CLIENT_POOL_MAX_SIZE", 32))
+        self.warm_interval = float(warm_interval or os.getenv("QUACK2TEX_CLIENT_POOL_WARM_INTERVAL", 30))
+        self._clients: OrderedDict[tuple, typing.Tuple[LLMClient, float]] = OrderedDict()
+        self._warmed_at: typing.Dict[tuple, float] = {}
+        self._warm_up_executor: typing.Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model: str, system_instruction: str = None) -> LLMClient:
+        """
+        Get a pooled client, creating it on a miss.
+        :param model:
+        :param system_instruction:
+        :return:
+        """
+        key = (model, system_instruction or "")
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._pop_idle_clients(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._clients[key] = (entry[0], now)
+                self._clients.move_to_end(key)
+        self._close_clients(evicted)
+        if entry is not None:
+            return entry[0]
+
+        # Built outside the lock, creating a client takes several network round trips
+        client = LLM.create(model, system_instruction=system_instruction)
+        with self._lock:
+            self.misses += 1
+            entry = self._clients.get(key)
+            if entry is not None:
+                # another thread created the same client in the meantime
+                evicted = [client]
+                client = entry[0]
+            else:
+                self._clients[key] = (client, time.monotonic())
+                evicted = self._pop_overflow_clients()
+        self._close_clients(evicted)
+        return client
+
+    def warm_up(self, model: str, system_instruction: str = None) -> None:
+        """
+        Build the pooled client of a model and open its connection with a request listing the
+        provider models, unless it was used or warmed up within the warm interval.
+        :param model:
+        :param system_instruction: The system instruction of the request, clients are pooled by it
+        :return:
+        """
+        key = (model, system_instruction or "")
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            last_used = max(entry[1] if entry is not None else 0.0, self._warmed_at.get(key, 0.0))
+            if last_used and now - last_used < self.warm_interval:
+                return
+            self._warmed_at[key] = now
+        with Tracer.span("warm up client", "inference", model=model):
+            # building a client lists the models with a throwaway API client, the pooled one is still cold
+            client = self.get(model, system_instruction)
+            api_client = getattr(client, "api_client", None)
+            models = getattr(api_client, "models", None)
+            list_models = getattr(models, "list", None) or getattr(api_client, "list", None)
+            if callable(list_models):
+                list_models()
+
+    def warm_up_async(self, models: typing.List[str], system_instruction: str = None) -> typing.List[Future]:
+        """
+        Warm up the clients of several models in the background, failures are logged and ignored.
+        :param models:
+        :param system_instruction:
+        :return: One future per model
+        """
+        with self._lock:
+            if self._warm_up_executor is None:
+                self._warm_up_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="quack2tex-warm-up")
+        return [
+            self._warm_up_executor.submit(self._warm_up_quietly, model, system_instruction)
+            for model in dict.fromkeys(models)
+        ]
+
+    def _warm_up_quietly(self, model: str, system_instruction: str = None) -> None:
+        try:
+            self.warm_up(model, system_instruction)
+        except Exception as e:
+            # the request reports the error, if it is not a transient one
+            logger.debug("Could not warm up the client of model %s: %s", model, e)
+
+    def _pop_idle_clients(self, now: float) -> typing.List[LLMClient]:
+        """
+        Remove the clients unused for longer than the idle timeout, must be called holding the lock.
+        :param now:
+        :return: The removed clients
+        """
+        idle_keys = [key for key, (_, last_used) in self._clients.items() if now - last_used > self.max_idle_time]
+        self.evictions += len(idle_keys)
+        return [self._clients.pop(key)[0] for key in idle_keys]
+
+    def _pop_overflow_clients(self) -> typing.List[LLMClient]:
+        """
+        Remove the least recently used clients over the pool size, must be called holding the lock.
+        :return: The removed clients
+        """
+        evicted = []
+        while len(self._clients) > self.max_size:
+            _, (client, _) = self._clients.popitem(last=False)
+            evicted.append(client)
+            self.evictions += 1
+        return evicted
+
+    def _close_clients(self, clients: typing.List[LLMClient]) -> None:
+        """
+        Close the HTTP connections of evicted clients.
+        :param clients:
+        :return:
+        """
+        for client in clients:
+            close = getattr(getattr(client, "api_client", None), "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    def get_provider(self, model: str) -> str:
+        """
+        Get the provider serving a model, e.g. google, openai, anthropic, groq or ollama.
+        The client class is used once the model has a pooled client, the model name otherwise.
+        :param model:
+        :return: The provider name, "default" when it can not be inferred
+        """
+        with self._lock:
+            client = next((client for (name, _), (client, _) in self._clients.items() if name == model), None)
+        if client is not None:
+            for provider, client_class in LLM._clients.items():
+                if isinstance(client, client_class):
+                    return provider
+
+        name = model.lower()
+        if name.startswith(("models/", "gemini", "tunedmodels/")):
+            return "google"
+        if name.startswith("claude"):
+            return "anthropic"
+        if name.startswith(("gpt", "chatgpt", "o1", "o3", "o4", "text-embedding", "dall-e", "tts-")):
+            return "openai"
+        if ":" in name:
+            # ollama lists its models with their tag, e.g. llava:latest
+            return "ollama"
+        return "default"
+
+    def clear(self) -> None:
+        """
+        Close and remove all the pooled clients.
+        :return:
+        """
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+            self._warmed_at.clear()
+        self._close_clients(clients)
+
+    def stats(self) -> dict:
+        """
+        Get the pool usage counters.
+        :return:
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
@@ -0,0 +1,163 @@
+import atexit
+import logging
+import os
+import queue
+import typing
+from threading import Lock, Thread
+
+from PIL.Image import Image as PILImage
+
+from quack2tex.repository import InferenceCallRepository
+from quack2tex.repository.models import InferenceCall
+from quack2tex.repository.db.sync_session import get_db_session
+from quack2tex.utils import PromptPayload, Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceStats(metaclass=Singleton):
+    """
+    Records the outcome of every model call in the `inference_call` table.
+
+    The calls are queued and written in batches by a background thread, so recording never adds
+    a database round trip to the latency of a request. Failing to record is logged and ignored.
+    """
+
+    def __init__(self, enabled: bool = None, batch_size: int = 32):
+        """
+        Initialize the recorder.
+
+        :param enabled: Record the calls, QUACK2TEX_INFERENCE_STATS turns it off with 0
+        :param batch_size: Maximum number of calls written in one transaction
+        """
+        if enabled is None:
+            enabled = os.getenv("QUACK2TEX_INFERENCE_STATS", "1").lower() not in ("0", "false", "no", "off")
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[InferenceCall]" = queue.Queue()
+        self._lock = Lock()
+        self._writer: typing.Optional[Thread] = None
+
+    @staticmethod
+    def get_input_size(prompt: typing.Any) -> int:
+        """
+        Get the size of a prompt, the encoded bytes of images and the UTF-8 bytes of texts.
+        :param prompt: A string, a PIL image, an image payload or a list of them
+        :return:
+        """
+        size = 0
+        for part in prompt if isinstance(prompt, list) else [prompt]:
+            if isinstance(part, PromptPayload):
+                size += len(part.data)
+            elif isinstance(part, PILImage):
+                size += part.width * part.height * len(part.getbands())
+            elif isinstance(part, str):
+                size += len(part.encode("utf-8"))
+        return size
+
+    @staticmethod
+    def get_input_type(prompt: typing.Any) -> str:
+        """
+        Get the type of a prompt, image when any part is an image, text otherwise.
+        :param prompt: A string, a PIL image, an image payload or a list of them
+        :return:
+        """
+        parts = prompt if isinstance(prompt, list) else [prompt]
+        return "image" if any(isinstance(part, (PromptPayload, PILImage)) for part in parts) else "text"
+
+    def record(
+        self,
+        model: str,
+        provider: str = None,
+        action: str = None,
+        input_type: str = None,
+        input_size: int = 0,
+        time_to_first_token: float = None,
+        latency: float = 0.0,
+        output_length: int = 0,
+        error: BaseException = None,
+    ) -> None:
+        """
+        Queue the outcome of a model call.
+        :param model:
+        :param provider:
+        :param action: Name of the action the call was made for
+        :param input_type: See `get_input_type`
+        :param input_size: See `get_input_size`
+        :param time_to_first_token: Seconds until the first chunk, None when none arrived
+        :param latency: Seconds until the call returned or failed
+        :param output_length: Number of characters generated
+        :param error: The exception raised by the call
+        :return:
+        """
+        if not self.enabled:
+            return
+        self._queue.put(InferenceCall(
+            model=model,
+            provider=provider,
+            action=action,
+            input_type=input_type,
+            input_size=input_size,
+            time_to_first_token=time_to_first_token,
+            latency=latency,
+            output_length=output_length,
+            error_class=type(error).__name__ if error is not None else None,
+        ))
+        self._ensure_writer()
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = Thread(target=self._write_loop, name="quack2tex-inference-stats", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        """
+        Writer thread loop, batches the calls queued meanwhile.
+        :return:
+        """
+        while True:
+            calls = [self._queue.get()]
+            while len(calls) < self.batch_size:
+                try:
+                    calls.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(calls)
+            for _ in calls:
+                self._queue.task_done()
+
+    def _write(self, calls: typing.List[InferenceCall]) -> None:
+        try:
+            with get_db_session() as session:
+                InferenceCallRepository.add_calls(session, calls)
+        except Exception as e:
+            logger.warning("Could not record %d model calls: %s", len(calls), e)
+
+    def flush(self) -> None:
+        """
+        Wait until the queued calls are written.
+        :return:
+        """
+        if self._writer is not None:
+            self._queue.join()
+
+    def get_model_stats(
+        self,
+        window: int = 100,
+        models: typing.List[str] = None,
+        action: str = None,
+        input_type: str = None,
+    ) -> typing.Dict[str, dict]:
+        """
+        Get the rolling statistics of the models over their last calls, see `InferenceCallRepository.get_model_stats`.
+        :param window: Number of calls considered per model
+        :param models: optional models to restrict to
+        :param action: optional action to restrict to
+        :param input_type: optional input type to restrict to, image or text
+        :return:
+        """
+        self.flush()
+        with get_db_session() as session:
+            return InferenceCallRepository.get_model_stats(session, window, models, action, input_type)
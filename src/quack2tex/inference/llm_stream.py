@@ -0,0 +1,218 @@
+import typing
+
+from PIL.Image import Image as PILImage
+
+from modihub.llm import GeminiClient, OpenAIClient, OllamaClient, AnthropicClient, LLMClient
+from modihub.llm.groq_client import GroqClient
+
+from quack2tex.utils import PromptPayload
+from .rate_limiter import RateLimiter
+
+
+class LLMStream:
+    """
+    Incremental generation on top of the modihub clients.
+
+    modihub only exposes blocking `generate` calls, so the streaming endpoint of the provider SDK
+    wrapped by each client is used instead. The requests are built here from the pre-encoded
+    image payloads, so an image is never encoded again per model. When a client or a prompt is not
+    supported, or the provider rejects the streaming request itself, the blocking call is used and
+    its response is yielded as a single chunk. Other failures are raised, so rate limited or
+    overloaded providers are retried with backoff by the `RateLimiter` instead of called again.
+    """
+
+    # rejections of the streaming request, by an SDK or an endpoint not supporting it
+    STREAM_UNSUPPORTED_STATUS_CODES = {400, 404, 405, 501}
+
+    @classmethod
+    def iter_chunks(cls, llm: LLMClient, prompt: typing.Any) -> typing.Iterator[str]:
+        """
+        Generate the model response chunk by chunk.
+        :param llm: The model client returned by `LLM.create`
+        :param prompt: A string, a PIL image, an image payload or a list of them
+        :return:
+        """
+        stream_fn = cls.get_stream_fn(llm, prompt)
+        if stream_fn is None:
+            yield llm(cls.to_client_prompt(prompt))
+            return
+
+        started = False
+        try:
+            for chunk in stream_fn(llm, prompt):
+                if chunk:
+                    started = True
+                    yield chunk
+        except Exception as ex:
+            if started or not cls.is_stream_unsupported(ex):
+                raise
+            yield llm(cls.to_client_prompt(prompt))
+
+    @classmethod
+    def is_stream_unsupported(cls, ex: BaseException) -> bool:
+        """
+        Check a stream failed because streaming is not supported, the blocking call may then succeed.
+        :param ex:
+        :return:
+        """
+        if RateLimiter.is_retryable(ex):
+            return False
+        if isinstance(ex, (NotImplementedError, AttributeError, TypeError)):
+            return True
+        return RateLimiter.get_status_code(ex) in cls.STREAM_UNSUPPORTED_STATUS_CODES
+
+    @classmethod
+    def get_stream_fn(
+        cls, llm: LLMClient, prompt: typing.Any
+    ) -> typing.Optional[typing.Callable[[LLMClient, typing.Any], typing.Iterator[str]]]:
+        """
+        Get the streaming function matching the client, None if the request can not be streamed.
+        :param llm:
+        :param prompt:
+        :return:
+        """
+        if isinstance(llm, GeminiClient):
+            return cls._stream_gemini
+        if isinstance(llm, OpenAIClient):
+            return cls._stream_openai
+        if isinstance(llm, OllamaClient):
+            return cls._stream_ollama
+        if isinstance(llm, AnthropicClient):
+            return cls._stream_anthropic
+        # the groq client only supports text prompts in modihub
+        if isinstance(llm, GroqClient) and cls.is_text_prompt(prompt):
+            return cls._stream_groq
+        return None
+
+    @staticmethod
+    def get_parts(prompt: typing.Any) -> typing.List[typing.Union[str, PromptPayload]]:
+        """
+        Get the non empty parts of the prompt, images being encoded as payloads.
+        :param prompt:
+        :return:
+        """
+        parts = prompt if isinstance(prompt, list) else [prompt]
+        return [
+            PromptPayload.from_image(part) if isinstance(part, PILImage) else part
+            for part in parts
+            if part is not None and part != ""
+        ]
+
+    @staticmethod
+    def to_client_prompt(prompt: typing.Any) -> typing.Any:
+        """
+        Get the prompt in the form the modihub clients expect, payloads being passed as PIL images.
+        :param prompt:
+        :return:
+        """
+        if isinstance(prompt, list):
+            return [part.image if isinstance(part, PromptPayload) else part for part in prompt if part is not None]
+        return prompt.image if isinstance(prompt, PromptPayload) else prompt
+
+    @staticmethod
+    def is_text_prompt(prompt: typing.Any) -> bool:
+        """
+        Check if the prompt does not hold any image.
+        :param prompt:
+        :return:
+        """
+        parts = prompt if isinstance(prompt, list) else [prompt]
+        return not any(isinstance(part, (PILImage, PromptPayload)) for part in parts)
+
+    @staticmethod
+    def prompt_to_text(prompt: typing.Any) -> str:
+        """
+        Join the text parts of the prompt.
+        :param prompt:
+        :return:
+        """
+        parts = prompt if isinstance(prompt, list) else [prompt]
+        return "\n\n".join(part for part in parts if isinstance(part, str) and part)
+
+    @classmethod
+    def to_gemini_contents(cls, prompt: typing.Any) -> list:
+        """
+        Pass the images as encoded parts, the SDK would otherwise re-encode them as PNG.
+        :param prompt:
+        :return:
+        """
+        from google.genai.types import Part
+
+        return [
+            Part.from_bytes(data=part.data, mime_type=part.mime_type) if isinstance(part, PromptPayload) else part
+            for part in cls.get_parts(prompt)
+        ]
+
+    @classmethod
+    def to_openai_content(cls, prompt: typing.Any) -> typing.List[dict]:
+        return [
+            {"type": "image_url", "image_url": {"url": part.base64_url}}
+            if isinstance(part, PromptPayload) else {"type": "text", "text": part}
+            for part in cls.get_parts(prompt)
+        ]
+
+    @classmethod
+    def to_anthropic_content(cls, prompt: typing.Any) -> typing.List[dict]:
+        return [
+            {"type": "image", "source": {"type": "base64", "media_type": part.mime_type, "data": part.base64}}
+            if isinstance(part, PromptPayload) else {"type": "text", "text": part}
+            for part in cls.get_parts(prompt)
+        ]
+
+    @classmethod
+    def to_ollama_message(cls, prompt: typing.Any) -> dict:
+        parts = cls.get_parts(prompt)
+        message = {"role": "user", "content": "".join(part for part in parts if isinstance(part, str))}
+        images = [part.base64 for part in parts if isinstance(part, PromptPayload)]
+        if images:
+            message["images"] = images
+        return message
+
+    @classmethod
+    def _stream_gemini(cls, llm: GeminiClient, prompt: typing.Any) -> typing.Iterator[str]:
+        from google.genai.types import GenerateContentConfig
+
+        config = GenerateContentConfig(system_instruction=llm.system_instruction or None)
+        for chunk in llm.api_client.models.generate_content_stream(
+            model=llm.model_name, contents=cls.to_gemini_contents(prompt), config=config
+        ):
+            yield chunk.text
+
+    @classmethod
+    def _stream_openai(cls, llm: OpenAIClient, prompt: typing.Any) -> typing.Iterator[str]:
+        messages = [{"role": "system", "content": llm.system_instruction}] if llm.system_instruction else []
+        messages.append({"role": "user", "content": cls.to_openai_content(prompt)})
+        for event in llm.api_client.chat.completions.create(
+            model=llm.model_name, messages=messages, stream=True
+        ):
+            if event.choices:
+                yield event.choices[0].delta.content
+
+    @classmethod
+    def _stream_groq(cls, llm: GroqClient, prompt: typing.Any) -> typing.Iterator[str]:
+        messages = [{"role": "system", "content": llm.system_instruction}] if llm.system_instruction else []
+        messages.append({"role": "user", "content": cls.prompt_to_text(prompt)})
+        for event in llm.api_client.chat.completions.create(
+            model=llm.model_name, messages=messages, stream=True
+        ):
+            if event.choices:
+                yield event.choices[0].delta.content
+
+    @classmethod
+    def _stream_anthropic(cls, llm: AnthropicClient, prompt: typing.Any) -> typing.Iterator[str]:
+        request = {
+            "model": llm.model_name,
+            "messages": [{"role": "user", "content": cls.to_anthropic_content(prompt)}],
+            "max_tokens": 1024,
+        }
+        if llm.system_instruction:
+            request["system"] = llm.system_instruction
+        with llm.api_client.messages.stream(**request) as stream:
+            yield from stream.text_stream
+
+    @classmethod
+    def _stream_ollama(cls, llm: OllamaClient, prompt: typing.Any) -> typing.Iterator[str]:
+        messages = [{"role": "system", "content": llm.system_instruction}] if llm.system_instruction else []
+        messages.append(cls.to_ollama_message(prompt))
+        for chunk in llm.api_client.chat(model=llm.model_name, messages=messages, stream=True):
+            yield chunk.get("message", {}).get("content", "")
@@ -0,0 +1,126 @@
+import logging
+import os
+import random
+import time
+import typing
+from threading import Lock
+
+from quack2tex.utils import Singleton
+from .inference_stats import InferenceStats
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter(metaclass=Singleton):
+    """
+    Picks the model answering an "auto" action, from the latency and error rate recorded by `InferenceStats`.
+
+    The candidates are the other models listed with "auto" on the action, or every model having
+    recorded calls for the input type when "auto" is listed alone. The healthy candidates, those
+    whose error rate over their last calls stays under `max_error_rate`, are ranked by median
+    latency on the same action and input type, falling back to all the actions of the input type
+    for the models with too few calls on the action. Candidates with fewer than `min_calls` calls
+    are tried first, and with probability `exploration` another candidate is picked instead of
+    the fastest, so a provider that became slow, or recovered, is noticed.
+    """
+
+    AUTO = "auto"
+
+    def __init__(
+        self,
+        exploration: float = None,
+        max_error_rate: float = None,
+        min_calls: int = None,
+        window: int = None,
+        stats_ttl: float = None,
+    ):
+        """
+        Initialize the router.
+
+        :param exploration: Probability of picking another candidate than the fastest
+        :param max_error_rate: Error rate above which a model is not picked while a healthy one exists
+        :param min_calls: Number of calls under which a model is tried before ranking it
+        :param window: Number of calls considered per model
+        :param stats_ttl: Seconds the statistics are reused before being read again
+        """
+        self.exploration = float(exploration if exploration is not None
+                                 else os.getenv("QUACK2TEX_AUTO_EXPLORATION", 0.1))
+        self.max_error_rate = float(max_error_rate if max_error_rate is not None
+                                    else os.getenv("QUACK2TEX_AUTO_MAX_ERROR_RATE", 0.25))
+        self.min_calls = int(min_calls if min_calls is not None else os.getenv("QUACK2TEX_AUTO_MIN_CALLS", 3))
+        self.window = int(window or os.getenv("QUACK2TEX_AUTO_WINDOW", 50))
+        self.stats_ttl = float(stats_ttl if stats_ttl is not None else os.getenv("QUACK2TEX_AUTO_STATS_TTL", 30))
+        self._stats: typing.Dict[tuple, typing.Tuple[float, typing.Dict[str, dict]]] = {}
+        self._lock = Lock()
+
+    @classmethod
+    def is_auto(cls, models: typing.List[str]) -> bool:
+        return cls.AUTO in models
+
+    def get_stats(self, action: typing.Optional[str], input_type: str) -> typing.Dict[str, dict]:
+        """
+        Get the statistics of the models for an action, or all the actions when None, and an input type.
+        :param action:
+        :param input_type:
+        :return:
+        """
+        key = (action, input_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._stats.get(key)
+        if entry is not None and now - entry[0] < self.stats_ttl:
+            return entry[1]
+        stats = InferenceStats().get_model_stats(self.window, action=action, input_type=input_type)
+        with self._lock:
+            self._stats[key] = (now, stats)
+        return stats
+
+    def route(self, action: str, input_type: str, candidates: typing.List[str] = None) -> dict:
+        """
+        Pick the model of a request.
+        :param action:
+        :param input_type: image or text, see `InferenceStats.get_input_type`
+        :param candidates: The models to pick from, the models with recorded calls for the input type when empty
+        :return: a dict with the picked model, the reason it was picked and its statistics
+        """
+        type_stats = self.get_stats(None, input_type)
+        action_stats = self.get_stats(action, input_type) if action else {}
+        candidates = list(dict.fromkeys(candidates or sorted(type_stats)))
+        if not candidates:
+            raise ValueError(
+                f"The auto model needs candidate models, or recorded {input_type} calls, to pick from"
+            )
+        stats = {
+            model: (
+                action_stats[model]
+                if action_stats.get(model, {}).get("calls", 0) >= self.min_calls
+                else type_stats.get(model, {"calls": 0})
+            )
+            for model in candidates
+        }
+
+        untried = [model for model in candidates if stats[model]["calls"] < self.min_calls]
+        if untried:
+            model = random.choice(untried)
+            return self._make_route(model, f"exploring, {stats[model]['calls']} recorded calls", stats[model])
+
+        healthy = [
+            model for model in candidates
+            if stats[model]["error_rate"] <= self.max_error_rate and stats[model]["latency_p50"] is not None
+        ]
+        if healthy:
+            model = min(healthy, key=lambda name: stats[name]["latency_p50"])
+            reason = f"fastest healthy model, median latency {stats[model]['latency_p50']:.2f}s"
+        else:
+            model = min(candidates, key=lambda name: stats[name]["error_rate"])
+            reason = f"no healthy model, lowest error rate {stats[model]['error_rate']:.0%}"
+        others = [name for name in candidates if name != model]
+        if others and random.random() < self.exploration:
+            model = random.choice(others)
+            reason = "exploring"
+        return self._make_route(model, reason, stats[model])
+
+    @staticmethod
+    def _make_route(model: str, reason: str, stats: dict) -> dict:
+        logger.info("Auto model picked %s: %s", model, reason)
+        return {"model": model, "reason": reason, "stats": stats}
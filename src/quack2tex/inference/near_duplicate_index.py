@@ -0,0 +1,139 @@
+import logging
+import os
+import typing
+from threading import Lock
+
+from quack2tex.repository import PromptRepository
+from quack2tex.repository.db.sync_session import get_db_session
+from quack2tex.utils import BKTree, ImageUtils, PromptPayload, Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class NearDuplicateIndex(metaclass=Singleton):
+    """
+    Index of the image prompts of the history by perceptual hash, one BK-tree per action.
+
+    Two captures of the same equation are almost never byte-identical, they differ by a few pixels
+    of margin, by the display scale or by the encoding, so they miss the response cache. Their
+    perceptual hashes stay within a few bits though, so a capture close enough to a saved one of
+    the same action can be answered with the saved responses without calling any model.
+
+    Equations differing by one symbol also hash within a few bits, so the hash only selects the
+    candidates, and a candidate is served once its saved image matches the capture at pixel level.
+    """
+
+    def __init__(self, max_distance: int = None, max_pixel_difference: int = None):
+        """
+        Initialize the index, the history is loaded on first lookup.
+
+        :param max_distance: Maximum Hamming distance between the hashes of near-duplicate
+            captures, out of 256 bits, negative to disable the lookup
+        :param max_pixel_difference: Maximum brightness difference of a cell between near-duplicate
+            captures, see `ImageUtils.content_difference`
+        """
+        if max_distance is None:
+            max_distance = int(os.getenv("QUACK2TEX_NEAR_DUPLICATE_DISTANCE", 4))
+        if max_pixel_difference is None:
+            max_pixel_difference = int(os.getenv("QUACK2TEX_NEAR_DUPLICATE_PIXEL_DIFFERENCE", 96))
+        self.max_distance = max_distance
+        self.max_pixel_difference = max_pixel_difference
+        self._trees: typing.Dict[str, BKTree] = {}
+        self._loaded = False
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0
+
+    def load(self) -> None:
+        """
+        Index the image prompts of the history, once.
+        :return:
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            with get_db_session() as session:
+                rows = PromptRepository.get_image_prompt_hashes(session)
+            for prompt_id, action, perceptual_hash in rows:
+                if action:
+                    self._add(action, int(perceptual_hash, 16), prompt_id)
+            self._loaded = True
+
+    def _add(self, action: str, perceptual_hash: int, prompt_id: int) -> None:
+        if action not in self._trees:
+            self._trees[action] = BKTree(ImageUtils.hamming_distance)
+        self._trees[action].add(perceptual_hash, prompt_id)
+
+    def add(self, action: str, perceptual_hash: int, prompt_id: int) -> None:
+        """
+        Index a prompt just saved to the history.
+        :param action:
+        :param perceptual_hash:
+        :param prompt_id:
+        :return:
+        """
+        if not action or perceptual_hash is None:
+            return
+        with self._lock:
+            # prompts saved before the history is loaded are picked up by the load
+            if self._loaded:
+                self._add(action, perceptual_hash, prompt_id)
+
+    def find(self, action: str, perceptual_hash: int) -> typing.List[typing.Tuple[int, int]]:
+        """
+        Find the saved prompts of an action whose hash is within the maximum distance.
+        :param action:
+        :param perceptual_hash:
+        :return: (distance, prompt id) tuples, the closest first and the most recent first on ties
+        """
+        if not self.enabled:
+            return []
+        self.load()
+        with self._lock:
+            tree = self._trees.get(action)
+            matches = tree.search(perceptual_hash, self.max_distance) if tree is not None else []
+        return sorted(matches, key=lambda match: (match[0], -match[1]))
+
+    def is_same_content(self, prompt_input: PromptPayload, saved_input: bytes) -> bool:
+        """
+        Confirm at pixel level that a capture shows the content of a saved image prompt.
+        :param prompt_input:
+        :param saved_input: The encoded image of the saved prompt
+        :return:
+        """
+        try:
+            saved_image = ImageUtils.decode_image(saved_input)
+        except Exception as e:
+            logger.warning("Could not decode a saved capture: %s", e)
+            return False
+        return ImageUtils.content_difference(prompt_input.image, saved_image) <= self.max_pixel_difference
+
+    def lookup(self, action: str, prompt_input: typing.Any) -> typing.Optional[dict]:
+        """
+        Get the saved responses of the closest near-duplicate of an image prompt.
+        :param action:
+        :param prompt_input:
+        :return: a dict with the prompt id, the distance and the saved result by model,
+            None when the input is not an image or has no near-duplicate
+        """
+        if not isinstance(prompt_input, PromptPayload) or not action or not self.enabled:
+            return None
+        matches = self.find(action, prompt_input.perceptual_hash)
+        if not matches:
+            return None
+        with get_db_session() as session:
+            for distance, prompt_id in matches:
+                # prompts deleted from the history stay in the index until the next start
+                prompt = PromptRepository.get_prompt_by_id(session, prompt_id)
+                if prompt is None or not self.is_same_content(prompt_input, prompt.prompt_input):
+                    continue
+                responses = PromptRepository.get_responses_for_prompt(session, prompt_id)
+                if responses:
+                    return {
+                        "prompt_id": prompt_id,
+                        "distance": distance,
+                        "prompt_result": {response.model: response.output for response in responses},
+                    }
+        return None
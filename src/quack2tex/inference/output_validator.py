@@ -0,0 +1,155 @@
+import re
+import typing
+
+
+class OutputValidator:
+    """
+    Checks deciding whether a model output is good enough to be used.
+    """
+
+    LATEX_DELIMITERS_PATTERN = re.compile(
+        r"\$\$.+?\$\$|\$[^$\n]+\$|\\\[.+?\\\]|\\\(.+?\\\)|\\begin\{\w+\*?\}|```(?:latex|tex)\b",
+        re.DOTALL,
+    )
+    MATH_BLOCK_PATTERN = re.compile(
+        r"```(?:latex|tex)\b(.*?)```|\$\$(.+?)\$\$|\$([^$\n]+)\$|\\\[(.+?)\\\]|\\\((.+?)\\\)"
+        r"|(\\begin\{(\w+\*?)\}.*?\\end\{\7\})",
+        re.DOTALL,
+    )
+    # a backslash and the character after it are read as one token, so \{ and \\ are not taken as braces
+    LATEX_TOKEN_PATTERN = re.compile(
+        r"\\begin\{(\w+\*?)\}|\\end\{(\w+\*?)\}|\\left(?![a-zA-Z])|\\right(?![a-zA-Z])|\\.|[{}]"
+    )
+
+    @staticmethod
+    def is_non_empty(output: str) -> bool:
+        """
+        Check the output holds any text.
+        :param output:
+        :return:
+        """
+        return isinstance(output, str) and bool(output.strip())
+
+    @classmethod
+    def has_latex_delimiters(cls, output: str) -> bool:
+        """
+        Check the output holds math delimited as LaTeX, e.g. $...$, $$...$$, \\[...\\], \\begin{...}
+        or a latex code block.
+        :param output:
+        :return:
+        """
+        return cls.is_non_empty(output) and cls.LATEX_DELIMITERS_PATTERN.search(output) is not None
+
+    @classmethod
+    def is_latex_parsable(cls, output: str) -> bool:
+        """
+        Check every math block of the output is well-formed LaTeX: braces balanced, \\begin and
+        \\end environments matching and \\left paired with \\right. These are the structural errors
+        KaTeX rejects that a model typically makes, e.g. on a truncated output.
+        :param output:
+        :return: False when the output holds no math block
+        """
+        if not cls.is_non_empty(output):
+            return False
+        blocks = [
+            next(group for group in match.groups() if group is not None)
+            for match in cls.MATH_BLOCK_PATTERN.finditer(output)
+        ]
+        return bool(blocks) and all(cls.is_balanced_latex(block) for block in blocks)
+
+    @classmethod
+    def is_balanced_latex(cls, latex: str) -> bool:
+        """
+        Check the structure of a LaTeX math block.
+        :param latex:
+        :return:
+        """
+        if not latex.strip():
+            return False
+        depth = 0
+        environments = []
+        lefts = 0
+        for match in cls.LATEX_TOKEN_PATTERN.finditer(latex):
+            token = match.group(0)
+            if token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+                if depth < 0:
+                    return False
+            elif token.startswith("\\begin"):
+                environments.append(match.group(1))
+            elif token.startswith("\\end"):
+                if not environments or environments.pop() != match.group(2):
+                    return False
+            elif token == "\\left":
+                lefts += 1
+            elif token == "\\right":
+                lefts -= 1
+                if lefts < 0:
+                    return False
+        return depth == 0 and not environments and lefts == 0
+
+    @staticmethod
+    def has_length(output: str, min_length: int = 0, max_length: int = None) -> bool:
+        """
+        Check the length of the output, stripped of the surrounding whitespace, is within bounds.
+        :param output:
+        :param min_length:
+        :param max_length:
+        :return:
+        """
+        if not isinstance(output, str):
+            return False
+        length = len(output.strip())
+        return length >= min_length and (max_length is None or length <= max_length)
+
+    @classmethod
+    def is_acceptable(cls, output: str) -> bool:
+        """
+        Default acceptance check of the race and cascade strategies.
+        :param output:
+        :return:
+        """
+        return cls.has_latex_delimiters(output)
+
+    @classmethod
+    def from_spec(cls, spec: typing.Optional[str]) -> typing.Callable[[str], bool]:
+        """
+        Build the acceptance check of an action from its validators, one per line, all of them must pass:
+            latex               the output holds LaTeX math delimiters
+            latex_parsable      every math block of the output is well-formed LaTeX
+            min_length:<n>      the output has at least n characters
+            max_length:<n>      the output has at most n characters
+            regex:<pattern>     the pattern is found in the output
+        :param spec:
+        :return: The default check when no validator is given
+        """
+        checks = []
+        for line in (spec or "").splitlines():
+            name, _, argument = line.strip().partition(":")
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name == "latex":
+                checks.append(cls.has_latex_delimiters)
+            elif name in ("latex_parsable", "katex"):
+                checks.append(cls.is_latex_parsable)
+            elif name in ("min_length", "max_length"):
+                try:
+                    bound = int(argument)
+                except ValueError:
+                    raise ValueError(f"Validator {name} expects an integer, got {argument!r}")
+                bounds = {name: bound}
+                checks.append(lambda output, bounds=bounds: cls.has_length(output, **bounds))
+            elif name == "regex":
+                try:
+                    pattern = re.compile(argument.strip(), re.DOTALL)
+                except re.error as e:
+                    raise ValueError(f"Invalid validator pattern {argument!r}: {e}")
+                checks.append(lambda output, pattern=pattern: isinstance(output, str) and bool(pattern.search(output)))
+            else:
+                raise ValueError(f"Unknown validator {name!r}")
+        if not checks:
+            return cls.is_acceptable
+        return lambda output: all(check(output) for check in checks)
@@ -0,0 +1,419 @@
+import logging
+import threading
+import time
+import typing
+from concurrent.futures import as_completed, CancelledError
+
+from PIL.Image import Image as PILImage
+from tqdm import tqdm
+
+from quack2tex.enums import InferenceStrategy
+from quack2tex.utils import PromptPayload, Tracer
+from .cassette import Cassette
+from .client_pool import LLMClientPool
+from .image_preprocessor import ImagePreprocessor
+from .inference_stats import InferenceStats
+from .llm_stream import LLMStream
+from .model_router import ModelRouter
+from .output_validator import OutputValidator
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .scheduler import InferenceScheduler
+
+logger = logging.getLogger(__name__)
+
+class PromptProcessor:
+    """
+    Runs a prompt request, an action applied to an input, against the models of the action.
+
+    It does not depend on Qt, so the same pipeline serves the application windows and the
+    headless entry points.
+    """
+
+    # the output shown for a model whose call failed
+    ERROR_PREFIX = "Error by running inference on model"
+
+    def __init__(
+        self,
+        response_cache: ResponseCache = None,
+        client_pool: LLMClientPool = None,
+        scheduler: InferenceScheduler = None,
+        image_preprocessor: ImagePreprocessor = None,
+        model_router: ModelRouter = None,
+        show_progress: bool = True,
+    ):
+        """
+        Initialize the processor, the process-wide instances are used by default.
+
+        :param response_cache:
+        :param client_pool:
+        :param scheduler:
+        :param image_preprocessor:
+        :param model_router:
+        :param show_progress: Show a progress bar of the model calls of each request
+        """
+        self.response_cache = response_cache or ResponseCache()
+        self.client_pool = client_pool or LLMClientPool()
+        self.scheduler = scheduler or InferenceScheduler()
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor()
+        self.model_router = model_router or ModelRouter()
+        self.show_progress = show_progress
+
+    @classmethod
+    def format_error(cls, model: str, ex: BaseException) -> str:
+        return f"{cls.ERROR_PREFIX} {model}: {ex}"
+
+    @classmethod
+    def is_error_output(cls, output: typing.Any) -> bool:
+        """
+        Check a model output of a prompt result is the error of a failed call, see `format_error`.
+        :param output:
+        :return:
+        """
+        return isinstance(output, str) and output.startswith(cls.ERROR_PREFIX)
+
+    @staticmethod
+    def get_prompt_data(menu_item) -> dict:
+        """
+        Get the settings of the action configured on a menu item.
+        :param menu_item:
+        :return:
+        """
+        return {
+            "action": menu_item.name,
+            "system_instruction": menu_item.system_instruction,
+            "guidance_prompt": menu_item.guidance_prompt,
+            "models": menu_item.models,
+            "capture_mode": menu_item.capture_mode,
+            "use_cache": menu_item.use_cache is not False,
+            "strategy": menu_item.strategy or InferenceStrategy.ALL.value,
+            "validators": menu_item.validators
+        }
+
+    @staticmethod
+    def call_llm(model, system_instruction, multimodal_prompt, on_chunk=None, cancel_event=None, action=None):
+        """
+        Standalone function to call the language model
+        :param model:
+        :param system_instruction:
+        :param multimodal_prompt:
+        :param on_chunk: optional callback receiving (model, chunk) as the response is generated
+        :param cancel_event: optional event stopping the generation once set
+        :param action: optional name of the action, recorded with the outcome of the call
+        :return:
+        """
+        client_pool = LLMClientPool()
+        rate_limiter = RateLimiter()
+        cassette = Cassette()
+        provider = client_pool.get_provider(model)
+        replaying = cassette.mode == "replay"
+        # replayed calls never create a client, so they run without API keys
+        llm = None if replaying else client_pool.get(model, system_instruction)
+        chunks = []
+        # timings of the last attempt, the earlier ones were rejected by the provider
+        timings = {}
+
+        def generate():
+            # streamed even without callback, so the payload is sent without being re-encoded
+            chunks.clear()
+            timings.clear()
+            timings["started_at"] = time.perf_counter()
+            for chunk in cassette.iter_chunks(
+                model, system_instruction, multimodal_prompt, lambda: LLMStream.iter_chunks(llm, multimodal_prompt)
+            ):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError(f"Inference on model {model} was cancelled")
+                if not chunks:
+                    timings["first_token_at"] = time.perf_counter()
+                    Tracer.instant("first token", "inference", model=model)
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    on_chunk(model, chunk)
+            return "".join(chunks)
+
+        def record(output_length: int = 0, error: BaseException = None):
+            # cancelled calls lost a race, they say nothing about the model, and replayed ones are not real
+            if isinstance(error, CancelledError) or replaying or "started_at" not in timings:
+                return
+            first_token_at = timings.get("first_token_at")
+            InferenceStats().record(
+                model,
+                provider=provider,
+                action=action,
+                input_type=InferenceStats.get_input_type(multimodal_prompt),
+                input_size=InferenceStats.get_input_size(multimodal_prompt),
+                time_to_first_token=first_token_at - timings["started_at"] if first_token_at else None,
+                latency=time.perf_counter() - timings["started_at"],
+                output_length=output_length,
+                error=error,
+            )
+
+        with Tracer.span("call_llm", "inference", model=model, provider=provider) as span:
+            try:
+                if replaying:
+                    output = PromptProcessor.replay_call(generate, rate_limiter.max_retries)
+                else:
+                    output = rate_limiter.call(
+                        provider,
+                        generate,
+                        tokens=RateLimiter.estimate_tokens([system_instruction or "", *multimodal_prompt]),
+                        cancel_event=cancel_event,
+                        # a stream failing midway is not replayed once its chunks were shown
+                        can_retry=lambda _: on_chunk is None or not chunks
+                    )
+            except Exception as e:
+                record(sum(map(len, chunks)), e)
+                raise
+            output_length = len(output) if isinstance(output, str) else 0
+            record(output_length)
+            span.set(output_length=output_length)
+        if isinstance(output, str) and not replaying:
+            rate_limiter.consume(provider, RateLimiter.estimate_tokens(output))
+        return output
+
+    @staticmethod
+    def replay_call(generate: typing.Callable[[], str], max_retries: int) -> str:
+        """
+        Replay a call without the rate limiter, replayed calls reach no provider, so they are
+        neither throttled nor backed off. The retries recorded after a rate limit error are
+        replayed right away, in the order they were recorded.
+        :param generate: Replays the next recorded attempt of the call
+        :param max_retries: Maximum number of retries, see `RateLimiter`
+        :return:
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return generate()
+            except Exception as e:
+                if attempt == max_retries or not RateLimiter.is_retryable(e):
+                    raise
+
+    @staticmethod
+    def to_payload(prompt_input: typing.Union[str, PILImage, PromptPayload]) -> typing.Union[str, PromptPayload]:
+        """
+        Wrap an image prompt input in a payload encoded on first use, texts and payloads are returned as is.
+        :param prompt_input:
+        :return:
+        """
+        if isinstance(prompt_input, PILImage):
+            return PromptPayload.from_image(prompt_input)
+        return prompt_input
+
+    def get_model_prompts(
+            self,
+            models: typing.List[str],
+            guidance_prompt: str,
+            prompt_input: typing.Union[str, PromptPayload]
+    ) -> typing.Dict[str, list]:
+        """
+        Build the prompt sent to every model, images are preprocessed and encoded once per pixel and
+        byte budget, and the resulting payload is shared by all the models having the same budgets
+        :param models:
+        :param guidance_prompt:
+        :param prompt_input:
+        :return:
+        """
+        if not models or not isinstance(prompt_input, PromptPayload):
+            return {model: [guidance_prompt, prompt_input] for model in models}
+        started_at = time.perf_counter()
+        with Tracer.span("normalize image", "preprocess"):
+            normalized_image = self.image_preprocessor.normalize(prompt_input.image)
+        images = {}
+        model_prompts = {}
+        for model in models:
+            provider = self.client_pool.get_provider(model)
+            budgets = (
+                self.image_preprocessor.get_pixel_budget(model, provider),
+                self.image_preprocessor.get_byte_budget(model, provider),
+            )
+            if budgets not in images:
+                with Tracer.span("fit image", "preprocess", pixel_budget=budgets[0], byte_budget=budgets[1]):
+                    images[budgets] = self.image_preprocessor.fit(normalized_image, *budgets, source=prompt_input)
+                ImagePreprocessor.log_reduction(prompt_input, images[budgets], time.perf_counter() - started_at)
+            model_prompts[model] = [guidance_prompt, images[budgets]]
+        return model_prompts
+
+    def warm_up(self, prompt_data: dict) -> list:
+        """
+        Warm up the clients of the models of an action in the background, to be called as soon as
+        its input starts being captured, so the request starts on open connections.
+        The candidates of an auto model are all warmed up, the router picks one once the input is known.
+        :param prompt_data:
+        :return: The futures of the warm-ups, see `LLMClientPool.warm_up_async`
+        """
+        if Cassette().mode == "replay":
+            return []
+        models = prompt_data.get("models")
+        models = [model for model in (models.split(",") if models else []) if model != ModelRouter.AUTO]
+        return self.client_pool.warm_up_async(models, prompt_data.get("system_instruction"))
+
+    def route_models(
+            self,
+            prompt_data: dict,
+            prompt_input: typing.Union[str, PILImage, PromptPayload]
+    ) -> typing.Tuple[dict, typing.Optional[dict]]:
+        """
+        Replace the "auto" model of an action by the model picked by the router, the other models
+        listed with it are the candidates.
+        :param prompt_data:
+        :param prompt_input:
+        :return: The prompt data to run and the route, see `ModelRouter.route`, None for actions without auto model
+        """
+        models = prompt_data.get("models")
+        models = models.split(",") if models else []
+        if not ModelRouter.is_auto(models):
+            return prompt_data, None
+        route = self.model_router.route(
+            prompt_data.get("action"),
+            InferenceStats.get_input_type(prompt_input),
+            [model for model in models if model != ModelRouter.AUTO]
+        )
+        return {**prompt_data, "models": route["model"]}, route
+
+    def process_prompt_request(
+            self,
+            prompt_data: dict,
+            prompt_input:  typing.Union[str, PILImage, PromptPayload],
+            on_chunk: typing.Callable[[str, str], None] = None,
+            input_hash: str = None
+    ) -> dict:
+        """
+        Call the language model
+        :param prompt_data:
+        :param prompt_input: A text, an image or an image payload, images are encoded once here
+        :param on_chunk: optional callback receiving (model, chunk) as each model streams its output
+        :param input_hash: content hash of the prompt input, computed when not given
+        :return:
+        """
+        prompt_input = self.to_payload(prompt_input)
+        prompt_data, _ = self.route_models(prompt_data, prompt_input)
+        models = prompt_data.get("models")
+        system_instruction = prompt_data.get("system_instruction")
+        guidance_prompt = prompt_data.get("guidance_prompt")
+        use_cache = prompt_data.get("use_cache", True)
+        strategy = prompt_data.get("strategy")
+        race = strategy == InferenceStrategy.RACE
+        is_acceptable = OutputValidator.from_spec(prompt_data.get("validators"))
+
+        models  = models.split(",") if models else []
+        results = {}
+        cache_keys = {}
+        if use_cache:
+            input_hash = input_hash or ResponseCache.hash_input(prompt_input)
+            for model in models:
+                cache_key = ResponseCache.make_key(model, system_instruction, guidance_prompt, input_hash)
+                cached_output = self.response_cache.get(cache_key)
+                if cached_output is None:
+                    cache_keys[model] = cache_key
+                else:
+                    results[model] = cached_output
+
+        if strategy == InferenceStrategy.CASCADE:
+            return self.run_cascade(
+                models, system_instruction, guidance_prompt, prompt_input, results, cache_keys, is_acceptable,
+                on_chunk, action=prompt_data.get("action")
+            )
+
+        # In race mode only the winner is shown, so partial outputs are not streamed
+        if race:
+            winner = next((model for model in results if is_acceptable(results[model])), None)
+            if winner is not None:
+                if on_chunk is not None:
+                    on_chunk(winner, results[winner])
+                return {winner: results[winner]}
+        elif on_chunk is not None:
+            for model, cached_output in results.items():
+                on_chunk(model, cached_output)
+
+        pending_models = [model for model in models if model not in results]
+        model_prompts = self.get_model_prompts(pending_models, guidance_prompt, prompt_input)
+        cancel_event = threading.Event()
+        futures = {
+            self.scheduler.submit(
+                self.call_llm,
+                model,
+                system_instruction,
+                model_prompts[model],
+                None if race else on_chunk,
+                cancel_event if race else None,
+                action=prompt_data.get("action"),
+                provider=self.client_pool.get_provider(model)
+            ): model
+            for model in pending_models
+        }
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures), disable=not self.show_progress):
+                model_name = futures[future]
+                try:
+                    results[model_name] = future.result()
+                except Exception as e:
+                    results[model_name] = self.format_error(model_name, e)
+                    continue
+                model_output = results[model_name]
+                if model_name in cache_keys and isinstance(model_output, str) and model_output:
+                    self.response_cache.put(cache_keys[model_name], model_name, model_output)
+                if race and is_acceptable(model_output):
+                    if on_chunk is not None:
+                        on_chunk(model_name, model_output)
+                    return {model_name: model_output}
+        finally:
+            # stop the calls still queued or running once the race is decided
+            cancel_event.set()
+            for future in futures:
+                future.cancel()
+        return results
+
+    def run_cascade(
+            self,
+            models: typing.List[str],
+            system_instruction: str,
+            guidance_prompt: str,
+            prompt_input: typing.Union[str, PromptPayload],
+            results: dict,
+            cache_keys: dict,
+            is_acceptable: typing.Callable[[str], bool],
+            on_chunk: typing.Callable[[str, str], None] = None,
+            action: str = None
+    ) -> dict:
+        """
+        Try the models one after the other, in the order of the action, and stop at the first
+        acceptable output, so the cheap models answer the easy inputs and the larger ones are only
+        paid for when they fail.
+        :param models:
+        :param system_instruction:
+        :param guidance_prompt:
+        :param prompt_input:
+        :param results: The cached outputs, they are checked without calling their model
+        :param cache_keys: The cache keys of the models without cached output
+        :param is_acceptable:
+        :param on_chunk: optional callback receiving the accepted output, the rejected ones are not shown
+        :param action: optional name of the action, recorded with the outcome of the calls
+        :return: The accepted output, or the outputs of all the models when none was accepted
+        """
+        model_prompts = self.get_model_prompts(
+            [model for model in models if model not in results], guidance_prompt, prompt_input
+        )
+        for model in models:
+            if model not in results:
+                future = self.scheduler.submit(
+                    self.call_llm,
+                    model,
+                    system_instruction,
+                    model_prompts[model],
+                    action=action,
+                    provider=self.client_pool.get_provider(model)
+                )
+                try:
+                    results[model] = future.result()
+                except Exception as e:
+                    results[model] = self.format_error(model, e)
+                    logger.info("Model %s failed: %s", model, e)
+                    continue
+                if model in cache_keys and isinstance(results[model], str) and results[model]:
+                    self.response_cache.put(cache_keys[model], model, results[model])
+            if is_acceptable(results[model]):
+                if on_chunk is not None:
+                    on_chunk(model, results[model])
+                return {model: results[model]}
+            logger.info("Output of model %s rejected by the validators", model)
+        return {model: results[model] for model in models}
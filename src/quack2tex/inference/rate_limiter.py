@@ -0,0 +1,307 @@
+import email.utils
+import os
+import random
+import re
+import time
+import typing
+from concurrent.futures import CancelledError
+from threading import Event, Lock
+
+import tenacity
+from PIL.Image import Image as PILImage
+
+from quack2tex.utils import PromptPayload, Singleton, Tracer
+from .scheduler import InferenceScheduler
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously up to `capacity` units per minute.
+
+    Callers reserve units before waiting, so the bucket can go negative and the debt tells how long
+    the caller has to wait. This keeps concurrent callers in arrival order without holding a lock
+    while sleeping.
+    """
+
+    def __init__(self, capacity: float):
+        """
+        Initialize the bucket full.
+        :param capacity: Units allowed per minute
+        """
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Take units from the bucket, must be called holding the limiter lock.
+        :param amount: Units to take, clamped to the capacity so a large request can not wait forever
+        :param now: Monotonic time
+        :return: Seconds to wait before the units are available
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RetryAfterWait(tenacity.wait.wait_base):
+    """
+    Wait for the delay hinted by the provider, or for a jittered exponential backoff without hint.
+    """
+
+    def __init__(self, max_wait: float):
+        self.max_wait = max_wait
+        self.backoff = tenacity.wait_random_exponential(multiplier=1, max=max_wait)
+
+    def __call__(self, retry_state: tenacity.RetryCallState) -> float:
+        retry_after = RateLimiter.get_retry_after(retry_state.outcome.exception())
+        if retry_after is None:
+            return self.backoff(retry_state)
+        # the jitter keeps the calls throttled together from retrying at the same instant
+        return min(retry_after + random.uniform(0, 1), self.max_wait)
+
+
+class RateLimiter(metaclass=Singleton):
+    """
+    Per-provider throttling of the model calls.
+
+    Every provider has a requests-per-minute and a tokens-per-minute bucket, a call waits until
+    both hold enough capacity. Calls rejected by the provider for rate limiting or overload are
+    retried after the delay hinted by the provider or after a jittered exponential backoff, and
+    the whole provider is paused meanwhile so the calls queued behind do not hit the limit again.
+    """
+
+    DEFAULT_PROVIDER_RPM = {"google": 15, "openai": 500, "anthropic": 50, "groq": 30}
+    DEFAULT_PROVIDER_TPM = {"google": 1_000_000, "openai": 200_000, "anthropic": 40_000, "groq": 6_000}
+    RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+    RATE_LIMIT_PATTERN = re.compile(r"\b429\b|RESOURCE_EXHAUSTED|rate.?limit|overloaded", re.IGNORECASE)
+    RETRY_DELAY_PATTERN = re.compile(
+        r"(?:retryDelay['\"]?\s*[:=]\s*['\"]?|retry in\s+)(\d+(?:\.\d+)?)\s*s", re.IGNORECASE
+    )
+
+    def __init__(
+        self,
+        provider_rpm: typing.Dict[str, int] = None,
+        provider_tpm: typing.Dict[str, int] = None,
+        max_retries: int = None,
+        max_backoff: float = None,
+    ):
+        """
+        Initialize the rate limiter.
+
+        :param provider_rpm: Requests per minute per provider, providers without a limit are not throttled
+        :param provider_tpm: Tokens per minute per provider, providers without a limit are not throttled
+        :param max_retries: Number of retries of a rejected call
+        :param max_backoff: Maximum seconds to wait between two attempts
+        """
+        self.provider_rpm = {
+            **self.DEFAULT_PROVIDER_RPM,
+            **InferenceScheduler.parse_provider_limits(os.getenv("QUACK2TEX_PROVIDER_RPM", "")),
+            **(provider_rpm or {}),
+        }
+        self.provider_tpm = {
+            **self.DEFAULT_PROVIDER_TPM,
+            **InferenceScheduler.parse_provider_limits(os.getenv("QUACK2TEX_PROVIDER_TPM", "")),
+            **(provider_tpm or {}),
+        }
+        self.max_retries = int(max_retries or os.getenv("QUACK2TEX_RATE_LIMIT_MAX_RETRIES", 5))
+        self.max_backoff = float(max_backoff or os.getenv("QUACK2TEX_RATE_LIMIT_MAX_BACKOFF", 60))
+        self._lock = Lock()
+        self._request_buckets: typing.Dict[str, TokenBucket] = {}
+        self._token_buckets: typing.Dict[str, TokenBucket] = {}
+        self._paused_until: typing.Dict[str, float] = {}
+        self.retries = 0
+
+    def _bucket(self, buckets: dict, limits: dict, provider: str) -> typing.Optional[TokenBucket]:
+        """
+        Get the bucket of a provider, must be called holding the lock.
+        :param buckets:
+        :param limits:
+        :param provider:
+        :return: None when the provider is not limited
+        """
+        if provider not in buckets:
+            limit = limits.get(provider)
+            buckets[provider] = TokenBucket(limit) if limit else None
+        return buckets[provider]
+
+    def acquire(self, provider: str, tokens: int = 0, cancel_event: Event = None) -> float:
+        """
+        Wait until the provider accepts a new call.
+        :param provider:
+        :param tokens: Estimated number of tokens of the call
+        :param cancel_event: optional event interrupting the wait once set
+        :return: The seconds waited
+        """
+        now = time.monotonic()
+        with self._lock:
+            delays = [self._paused_until.get(provider, now) - now]
+            request_bucket = self._bucket(self._request_buckets, self.provider_rpm, provider)
+            if request_bucket is not None:
+                delays.append(request_bucket.reserve(1, now))
+            token_bucket = self._bucket(self._token_buckets, self.provider_tpm, provider)
+            if token_bucket is not None and tokens:
+                delays.append(token_bucket.reserve(tokens, now))
+        delay = max(delays)
+        if delay > 0:
+            with Tracer.span("throttled", "inference", provider=provider):
+                if cancel_event is None:
+                    time.sleep(delay)
+                elif cancel_event.wait(delay):
+                    raise CancelledError(f"Call to provider {provider} was cancelled while throttled")
+        return max(delay, 0.0)
+
+    def consume(self, provider: str, tokens: int) -> None:
+        """
+        Charge tokens known once the call is done, e.g. the generated ones, without waiting.
+        :param provider:
+        :param tokens:
+        :return:
+        """
+        with self._lock:
+            token_bucket = self._bucket(self._token_buckets, self.provider_tpm, provider)
+            if token_bucket is not None and tokens:
+                token_bucket.reserve(tokens, time.monotonic())
+
+    def pause(self, provider: str, delay: float) -> None:
+        """
+        Hold every new call to the provider for a while.
+        :param provider:
+        :param delay: Seconds
+        :return:
+        """
+        with self._lock:
+            paused_until = time.monotonic() + delay
+            self._paused_until[provider] = max(self._paused_until.get(provider, 0.0), paused_until)
+
+    def call(
+        self,
+        provider: str,
+        fn: typing.Callable[[], typing.Any],
+        tokens: int = 0,
+        cancel_event: Event = None,
+        can_retry: typing.Callable[[BaseException], bool] = None,
+    ) -> typing.Any:
+        """
+        Run a call once the provider accepts it, retrying it when rejected for rate limiting.
+        :param provider:
+        :param fn: The call, taking no argument
+        :param tokens: Estimated number of tokens of the call
+        :param cancel_event: optional event interrupting the waits once set
+        :param can_retry: optional extra check, a failed call is only retried when it returns True
+        :return: The result of the call
+        """
+        def should_retry(ex: BaseException) -> bool:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            return self.is_retryable(ex) and (can_retry is None or can_retry(ex))
+
+        def before_sleep(retry_state: tenacity.RetryCallState) -> None:
+            self.retries += 1
+            self.pause(provider, retry_state.upcoming_sleep)
+
+        retrying = tenacity.Retrying(
+            retry=tenacity.retry_if_exception(should_retry),
+            wait=RetryAfterWait(self.max_backoff),
+            stop=tenacity.stop_after_attempt(self.max_retries + 1),
+            before_sleep=before_sleep,
+            # the provider pause is waited for in `acquire`
+            sleep=lambda _: None,
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                self.acquire(provider, tokens, cancel_event)
+                return fn()
+
+    @staticmethod
+    def estimate_tokens(prompt: typing.Any) -> int:
+        """
+        Roughly estimate the number of input tokens of a prompt.
+        Text counts one token every four characters, images one token every 750 pixels up to 1600.
+        :param prompt: A string, a PIL image, an image payload or a list of them
+        :return:
+        """
+        tokens = 0
+        for part in prompt if isinstance(prompt, list) else [prompt]:
+            if isinstance(part, str):
+                tokens += len(part) // 4 + 1
+            elif isinstance(part, (PILImage, PromptPayload)):
+                tokens += min(part.width * part.height // 750, 1600)
+        return tokens
+
+    @staticmethod
+    def iter_exception_chain(ex: BaseException) -> typing.Iterator[BaseException]:
+        """
+        Iterate the exception and the exceptions it was raised from, the clients often wrap the SDK errors.
+        :param ex:
+        :return:
+        """
+        seen = set()
+        while ex is not None and id(ex) not in seen:
+            seen.add(id(ex))
+            yield ex
+            ex = ex.__cause__ or ex.__context__
+
+    @classmethod
+    def get_status_code(cls, ex: BaseException) -> typing.Optional[int]:
+        """
+        Get the HTTP status code of a failed call.
+        :param ex:
+        :return: None when the error does not come from an HTTP response
+        """
+        for error in cls.iter_exception_chain(ex):
+            for candidate in (
+                getattr(error, "status_code", None),
+                getattr(error, "code", None),
+                getattr(getattr(error, "response", None), "status_code", None),
+            ):
+                if isinstance(candidate, int):
+                    return candidate
+        if cls.RATE_LIMIT_PATTERN.search(str(ex)):
+            return 429
+        return None
+
+    @classmethod
+    def is_retryable(cls, ex: BaseException) -> bool:
+        """
+        Check if a failed call was rejected for rate limiting or overload.
+        :param ex:
+        :return:
+        """
+        if isinstance(ex, CancelledError):
+            return False
+        return cls.get_status_code(ex) in cls.RETRYABLE_STATUS_CODES
+
+    @classmethod
+    def get_retry_after(cls, ex: BaseException) -> typing.Optional[float]:
+        """
+        Get the delay before retrying hinted by the provider,
+        from the retry-after headers or from the retry delay of the error details.
+        :param ex:
+        :return: Seconds, None without hint
+        """
+        for error in cls.iter_exception_chain(ex):
+            headers = getattr(getattr(error, "response", None), "headers", None) or {}
+            if headers.get("retry-after-ms"):
+                try:
+                    return float(headers["retry-after-ms"]) / 1000
+                except ValueError:
+                    pass
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    try:
+                        retry_date = email.utils.parsedate_to_datetime(retry_after)
+                    except (TypeError, ValueError):
+                        retry_date = None
+                    if retry_date is not None:
+                        return max(0.0, retry_date.timestamp() - time.time())
+            match = cls.RETRY_DELAY_PATTERN.search(str(error))
+            if match:
+                return float(match.group(1))
+        return None
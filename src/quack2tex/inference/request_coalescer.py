@@ -0,0 +1,61 @@
+import hashlib
+import json
+import typing
+from concurrent.futures import Future
+from threading import Lock
+
+from quack2tex.utils import Singleton
+
+
+class RequestCoalescer(metaclass=Singleton):
+    """
+    Collapses identical requests submitted while the first one is still running.
+
+    The first caller of a key runs the request, callers arriving before it finishes wait for and
+    share its result instead of running the request again.
+    """
+
+    def __init__(self):
+        self._in_flight: typing.Dict[str, Future] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def make_key(prompt_data: dict, input_hash: str) -> str:
+        """
+        Build the key identifying a request, an action applied to an input.
+        :param prompt_data: The action settings
+        :param input_hash: Content hash of the prompt input
+        :return:
+        """
+        action = json.dumps(prompt_data, sort_keys=True, default=str)
+        return hashlib.sha256(f"{action}\0{input_hash}".encode("utf-8")).hexdigest()
+
+    def run(self, key: str, fn: typing.Callable, *args, **kwargs) -> typing.Tuple[typing.Any, bool]:
+        """
+        Run the request, or attach to the identical request already running.
+        :param key:
+        :param fn:
+        :param args:
+        :param kwargs:
+        :return: The result and whether it was shared from an already running request
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            coalesced = future is not None
+            if not coalesced:
+                future = Future()
+                self._in_flight[key] = future
+        if coalesced:
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
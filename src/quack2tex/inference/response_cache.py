@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import time
+import typing
+import unicodedata
+from pathlib import Path
+from threading import Lock
+
+from PIL.Image import Image as PILImage
+
+from quack2tex.utils import ImageUtils, LibUtils, PromptPayload, Singleton
+
+
+class ResponseCache(metaclass=Singleton):
+    """
+    Persistent, content-addressed cache of model responses.
+
+    Entries are keyed on a hash of (model, system instruction, guidance prompt, normalized input)
+    and evicted least-recently-used first once the cache exceeds its byte budget, or when they
+    are older than the configured maximum age.
+    """
+
+    def __init__(
+        self,
+        cache_file: typing.Union[str, Path] = None,
+        max_bytes: int = None,
+        max_age: float = None,
+    ):
+        """
+        Initialize the response cache.
+
+        :param cache_file: SQLite file holding the cache, defaults to a file next to quack2tex.db
+        :param max_bytes: Maximum total size of the cached outputs in bytes, 0 keeps nothing
+        :param max_age: Maximum age of an entry in seconds, 0 expires the entries at once
+        """
+        self.cache_file = Path(cache_file or LibUtils.get_response_cache_file())
+        if max_bytes is None:
+            max_bytes = os.getenv("QUACK2TEX_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        if max_age is None:
+            max_age = os.getenv("QUACK2TEX_CACHE_MAX_AGE", 30 * 24 * 60 * 60)
+        self.max_bytes = int(max_bytes)
+        self.max_age = float(max_age)
+        self._lock = Lock()
+        self._connection = sqlite3.connect(str(self.cache_file), check_same_thread=False)
+        self._connection.execute("pragma journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                output TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS ix_responses_accessed_at ON responses (accessed_at)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def normalize_input(prompt_input: typing.Union[str, PILImage]) -> bytes:
+        """
+        Get a canonical byte representation of the prompt input.
+        Text is NFC-normalized with unified line endings, images are hashed on their decoded pixels
+        so the same capture hashes the same regardless of how it was encoded.
+        :param prompt_input:
+        :return:
+        """
+        if isinstance(prompt_input, PILImage):
+            header = f"{prompt_input.mode}:{prompt_input.width}x{prompt_input.height}:".encode("utf-8")
+            return header + prompt_input.tobytes()
+        text = unicodedata.normalize("NFC", prompt_input or "")
+        return text.replace("\r\n", "\n").strip().encode("utf-8")
+
+    @classmethod
+    def hash_input(cls, prompt_input: typing.Union[str, PILImage, PromptPayload]) -> str:
+        """
+        Get the content hash of the prompt input.
+        :param prompt_input:
+        :return:
+        """
+        if isinstance(prompt_input, PromptPayload):
+            return prompt_input.content_hash
+        if isinstance(prompt_input, PILImage):
+            return ImageUtils.hash_image(prompt_input)
+        return hashlib.sha256(cls.normalize_input(prompt_input)).hexdigest()
+
+    @staticmethod
+    def make_key(model: str, system_instruction: str, guidance_prompt: str, input_hash: str) -> str:
+        """
+        Build the cache key of a model request.
+        :param model:
+        :param system_instruction:
+        :param guidance_prompt:
+        :param input_hash: Content hash of the prompt input, see `hash_input`
+        :return:
+        """
+        digest = hashlib.sha256()
+        for part in (model, system_instruction, guidance_prompt, input_hash):
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> typing.Optional[str]:
+        """
+        Get a cached output, refreshing its LRU position.
+        :param key:
+        :return: The cached output or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT output, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            output, created_at = row
+            if now - created_at > self.max_age:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            return output
+
+    def put(self, key: str, model: str, output: str) -> None:
+        """
+        Store a model output and evict entries over the age and size budgets.
+        :param key:
+        :param model:
+        :param output:
+        :return:
+        """
+        now = time.time()
+        size = len(output.encode("utf-8"))
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, output, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, output, size, now, now),
+            )
+            self._evict(now)
+            self._connection.commit()
+
+    def _evict(self, now: float) -> None:
+        """
+        Remove expired entries, then the least recently used ones until the cache fits its byte budget.
+        :param now:
+        :return:
+        """
+        self._connection.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.max_age,)
+        )
+        self._connection.execute(
+            """
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running_size
+                    FROM responses
+                ) WHERE running_size > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def clear(self) -> None:
+        """
+        Remove all the cached entries.
+        :return:
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
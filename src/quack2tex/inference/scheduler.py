@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import os
+import time
+import typing
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from threading import Condition, Thread
+
+from quack2tex.utils import Singleton
+
+
+@dataclass(order=True)
+class InferenceTask:
+    """
+    A queued call, ordered by priority and then by submission order.
+    """
+    priority: int
+    sequence: int
+    provider: str = field(compare=False)
+    fn: typing.Callable = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    future: Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class InferenceScheduler(metaclass=Singleton):
+    """
+    Long-lived scheduler running model calls on a bounded set of worker threads.
+
+    Besides the global concurrency cap, every provider has its own cap, so a slow provider can only
+    hold its share of the workers while the calls to the other providers keep being dispatched.
+    Tasks wait in per-provider priority queues, lower priorities run first and equal priorities
+    run in submission order.
+    """
+
+    DEFAULT_PROVIDER_LIMITS = {"google": 4, "openai": 4, "anthropic": 2, "groq": 4, "ollama": 1}
+
+    def __init__(self, max_workers: int = None, provider_limits: typing.Dict[str, int] = None):
+        """
+        Initialize the scheduler.
+
+        :param max_workers: Maximum number of calls running at the same time
+        :param provider_limits: Maximum number of calls running at the same time per provider,
+            providers without a limit are only bounded by `max_workers`
+        """
+        self.max_workers = int(max_workers or os.getenv("QUACK2TEX_MAX_CONCURRENCY", 8))
+        self.provider_limits = {
+            **self.DEFAULT_PROVIDER_LIMITS,
+            **self.parse_provider_limits(os.getenv("QUACK2TEX_PROVIDER_CONCURRENCY", "")),
+            **(provider_limits or {}),
+        }
+        self._condition = Condition()
+        self._queues: typing.Dict[str, typing.List[InferenceTask]] = defaultdict(list)
+        self._running: typing.Dict[str, int] = defaultdict(int)
+        self._sequence = itertools.count()
+        self._threads: typing.List[Thread] = []
+        self._idle_workers = 0
+        self._shutdown = False
+
+        # metrics
+        self._submitted = 0
+        self._completed = 0
+        self._max_queue_depth = 0
+        self._wait_times = deque(maxlen=1000)
+
+    @staticmethod
+    def parse_provider_limits(value: str) -> typing.Dict[str, int]:
+        """
+        Parse provider limits written as `provider=limit` pairs separated by commas.
+        :param value: e.g. "google=4,ollama=1"
+        :return:
+        """
+        limits = {}
+        for pair in filter(None, (part.strip() for part in value.split(","))):
+            provider, _, limit = pair.partition("=")
+            limits[provider.strip()] = int(limit)
+        return limits
+
+    def submit(
+        self, fn: typing.Callable, *args, provider: str = "default", priority: int = 0, **kwargs
+    ) -> Future:
+        """
+        Queue a call.
+        :param fn:
+        :param args:
+        :param provider: The provider whose concurrency cap applies to the call
+        :param priority: Lower values run first
+        :param kwargs:
+        :return: A future holding the result of the call
+        """
+        future = Future()
+        task = InferenceTask(
+            priority=priority,
+            sequence=next(self._sequence),
+            provider=provider,
+            fn=fn,
+            args=args,
+            kwargs=kwargs,
+            future=future,
+            enqueued_at=time.monotonic(),
+        )
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            heapq.heappush(self._queues[provider], task)
+            self._submitted += 1
+            queue_depth = self._queue_depth()
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth)
+            if len(self._threads) < self.max_workers and self._idle_workers < queue_depth:
+                thread = Thread(target=self._work, name=f"quack2tex-inference-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify_all()
+        return future
+
+    def _queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _provider_limit(self, provider: str) -> int:
+        return self.provider_limits.get(provider, self.max_workers)
+
+    def _pop_next_task(self) -> typing.Optional[InferenceTask]:
+        """
+        Pop the most urgent task whose provider is under its cap, must be called holding the lock.
+        :return:
+        """
+        candidates = [
+            queue for provider, queue in self._queues.items()
+            if queue and self._running[provider] < self._provider_limit(provider)
+        ]
+        if not candidates:
+            return None
+        return heapq.heappop(min(candidates, key=lambda queue: queue[0]))
+
+    def _work(self) -> None:
+        """
+        Worker thread loop.
+        :return:
+        """
+        while True:
+            with self._condition:
+                task = self._pop_next_task()
+                while task is None:
+                    if self._shutdown:
+                        return
+                    self._idle_workers += 1
+                    self._condition.wait()
+                    self._idle_workers -= 1
+                    task = self._pop_next_task()
+                self._running[task.provider] += 1
+                self._wait_times.append(time.monotonic() - task.enqueued_at)
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.fn(*task.args, **task.kwargs)
+                    except BaseException as ex:
+                        task.future.set_exception(ex)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._condition:
+                    self._running[task.provider] -= 1
+                    self._completed += 1
+                    self._condition.notify_all()
+
+    def metrics(self) -> dict:
+        """
+        Get the queue depth and wait time metrics.
+        :return:
+        """
+        with self._condition:
+            wait_times = sorted(self._wait_times)
+            return {
+                "workers": len(self._threads),
+                "queue_depth": self._queue_depth(),
+                "max_queue_depth": self._max_queue_depth,
+                "queue_depth_by_provider": {provider: len(queue) for provider, queue in self._queues.items() if queue},
+                "running_by_provider": {provider: count for provider, count in self._running.items() if count},
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "wait_time_avg": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+                "wait_time_p95": wait_times[int(0.95 * (len(wait_times) - 1))] if wait_times else 0.0,
+                "wait_time_max": wait_times[-1] if wait_times else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False) -> None:
+        """
+        Stop the worker threads once the queued calls are done.
+        :param wait: Block until the worker threads exit
+        :param cancel_pending: Cancel the calls that did not start yet
+        :return:
+        """
+        with self._condition:
+            self._shutdown = True
+            if cancel_pending:
+                for queue in self._queues.values():
+                    for task in queue:
+                        task.future.cancel()
+                    queue.clear()
+            self._condition.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
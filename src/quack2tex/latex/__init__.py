@@ -0,0 +1,6 @@
+from .latex_store import LatexStore
+from .python_to_latex import PythonToLatex, UnsupportedSyntax
+from .latifier import Latifier, LatexConversion
+from .wrapped_function_result import Quack2TexWrappedFunctionResult
+from .decorators import latify, alatify
+from .package_latifier import PackageLatifier, FunctionSource
@@ -0,0 +1,76 @@
+import inspect
+import typing
+from concurrent.futures import Future
+from functools import wraps
+from threading import Lock
+
+from .latifier import Latifier
+from .wrapped_function_result import Quack2TexWrappedFunctionResult
+
+
+def _latex_future_getter(func: typing.Callable, model: str = None, prompt: str = None) -> typing.Callable[[], Future]:
+    """
+    Build the function returning the LaTeX future of a latified function, the source is read and
+    the conversion submitted on its first call, then the same future is returned unless it failed.
+    :param func:
+    :param model:
+    :param prompt:
+    :return:
+    """
+    lock = Lock()
+    state = {"future": None}
+
+    def get_latex_future() -> Future:
+        with lock:
+            future = state["future"]
+            if future is None or (future.done() and future.exception() is not None):
+                future = state["future"] = Latifier().submit_function(func, model, prompt)
+            return future
+
+    return get_latex_future
+
+
+def latify(model: str = None, prompt: str = None):
+    """
+    Decorator to convert a function to LaTeX using the LLM model.
+    The function runs right away, its LaTeX is generated in the background once per source and
+    read from the `latex` attribute of the returned result, see `Quack2TexWrappedFunctionResult`.
+    :param model: The model generating the LaTeX, QUACK2TEX_LATIFY_MODEL by default
+    :param prompt: Instruction sent with the source of the function
+    :return:
+    """
+    def decorator(func):
+        get_latex_future = _latex_future_getter(func, model, prompt)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            latex_future = get_latex_future()
+            return Quack2TexWrappedFunctionResult(result=func(*args, **kwargs), latex_future=latex_future)
+
+        wrapper.latex_future = get_latex_future
+        return wrapper
+    return decorator
+
+
+def alatify(model: str = None, prompt: str = None):
+    """
+    Asynchronous variant of `latify` for coroutine functions, or plain functions called from an
+    event loop. Await `alatex()` on the returned result to get the LaTeX without blocking the loop.
+    :param model: The model generating the LaTeX, QUACK2TEX_LATIFY_MODEL by default
+    :param prompt: Instruction sent with the source of the function
+    :return:
+    """
+    def decorator(func):
+        get_latex_future = _latex_future_getter(func, model, prompt)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            latex_future = get_latex_future()
+            result = func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return Quack2TexWrappedFunctionResult(result=result, latex_future=latex_future)
+
+        wrapper.latex_future = get_latex_future
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+import hashlib
+import sqlite3
+import time
+import typing
+from pathlib import Path
+from threading import Lock
+
+from quack2tex.utils import LibUtils, Singleton
+
+
+class LatexStore(metaclass=Singleton):
+    """
+    Persistent store of the LaTeX generated for Python functions.
+
+    Entries are keyed on a hash of (model, prompt, function source), so a function is sent to a
+    model once and its LaTeX is reused by every later call and run until its source changes.
+    Unlike the response cache, entries never expire, they are the generated documentation.
+    """
+
+    def __init__(self, store_file: typing.Union[str, Path] = None):
+        """
+        Initialize the store.
+
+        :param store_file: SQLite file holding the store, defaults to a file next to quack2tex.db
+        """
+        self.store_file = Path(store_file or LibUtils.get_latex_store_file())
+        self._lock = Lock()
+        self._connection = sqlite3.connect(str(self.store_file), check_same_thread=False)
+        self._connection.execute("pragma journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS latex (
+                key TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                latex TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def hash_source(source: str) -> str:
+        """
+        Get the content hash of a function source, indentation and trailing spaces excluded.
+        :param source:
+        :return:
+        """
+        lines = (line.rstrip() for line in source.replace("\r\n", "\n").split("\n"))
+        return hashlib.sha256("\n".join(line for line in lines if line).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, source_hash: str) -> str:
+        """
+        Build the key of a function.
+        :param model:
+        :param prompt:
+        :param source_hash: See `hash_source`
+        :return:
+        """
+        digest = hashlib.sha256()
+        for part in (model, prompt, source_hash):
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> typing.Optional[str]:
+        """
+        Get the stored LaTeX of a function.
+        :param key:
+        :return: None when the function was never converted with this model and prompt
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT latex FROM latex WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key: str, name: str, model: str, latex: str) -> None:
+        """
+        Store the LaTeX of a function.
+        :param key:
+        :param name: Qualified name of the function, for inspection only
+        :param model:
+        :param latex:
+        :return:
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO latex (key, name, model, latex, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, name, model, latex, time.time()),
+            )
+            self._connection.commit()
+
+    def clear(self) -> None:
+        """
+        Remove all the stored entries.
+        :return:
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM latex")
+            self._connection.commit()
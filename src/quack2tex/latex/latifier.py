@@ -0,0 +1,145 @@
+import ast
+import asyncio
+import inspect
+import os
+import textwrap
+import typing
+from concurrent.futures import Future
+from threading import Lock
+
+from quack2tex.inference import InferenceScheduler, LLMClientPool, PromptProcessor
+from quack2tex.utils import Singleton
+from .latex_store import LatexStore
+from .python_to_latex import PythonToLatex, UnsupportedSyntax
+
+
+class LatexConversion(typing.NamedTuple):
+    """
+    The LaTeX of a function and the path producing it, ast for the offline translator, llm for a model.
+    """
+    latex: str
+    method: str
+
+
+class Latifier(metaclass=Singleton):
+    """
+    Converts Python functions to LaTeX, offline when possible, with a model once per function
+    source otherwise.
+
+    Functions the `PythonToLatex` translator handles are converted right away without any network
+    round trip, unless a custom prompt asks for something else. For the others, the LaTeX is
+    looked up in the `LatexStore` by the hash of its source, and only generated on a miss, in the
+    background on the inference scheduler, so the callers get a future and never wait for the
+    model unless they read its result. Conversions in flight are shared by the callers asking for
+    the same function, and failed ones are retried on the next request.
+    """
+
+    DEFAULT_MODEL = "models/gemini-1.5-flash-latest"
+    DEFAULT_PROMPT = "Generate a LaTeX representation of the following function in markdown format:"
+    AST, LLM = "ast", "llm"
+
+    def __init__(self, use_translator: bool = None):
+        """
+        Initialize the latifier.
+
+        :param use_translator: Try the offline translator first, QUACK2TEX_LATIFY_TRANSLATOR turns it off with 0
+        """
+        if use_translator is None:
+            use_translator = os.getenv("QUACK2TEX_LATIFY_TRANSLATOR", "1").lower() not in ("0", "false", "no", "off")
+        self.use_translator = use_translator
+        self._futures: typing.Dict[str, Future] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def get_source(func: typing.Callable) -> str:
+        """
+        Get the source of a function without its decorators, so changing how it is decorated
+        does not invalidate its LaTeX.
+        :param func:
+        :return:
+        """
+        source = textwrap.dedent(inspect.getsource(inspect.unwrap(func)))
+        try:
+            node = ast.parse(source).body[0]
+        except (SyntaxError, IndexError):
+            return source
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return source
+        return "\n".join(source.splitlines()[node.lineno - 1:])
+
+    @classmethod
+    def get_model(cls, model: str = None) -> str:
+        return model or os.getenv("QUACK2TEX_LATIFY_MODEL", cls.DEFAULT_MODEL)
+
+    def submit(self, name: str, source: str, model: str = None, prompt: str = None) -> Future:
+        """
+        Get the LaTeX of a function source, from the store or from a model call queued in the background.
+        :param name: Qualified name of the function
+        :param source: See `get_source`
+        :param model:
+        :param prompt: Instruction sent before the source
+        :return: A future holding the `LatexConversion`
+        """
+        model = self.get_model(model)
+        prompt = prompt or self.DEFAULT_PROMPT
+        if self.use_translator and prompt == self.DEFAULT_PROMPT:
+            try:
+                latex = PythonToLatex.translate(source)
+            except UnsupportedSyntax:
+                pass
+            else:
+                future = Future()
+                future.set_result(LatexConversion(latex, self.AST))
+                return future
+        key = LatexStore.make_key(model, prompt, LatexStore.hash_source(source))
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                return future
+            latex = LatexStore().get(key)
+            if latex is not None:
+                future = Future()
+                future.set_result(LatexConversion(latex, self.LLM))
+            else:
+                # documentation is never more urgent than an interactive request
+                future = InferenceScheduler().submit(
+                    self._generate, key, name, model, prompt, source,
+                    provider=LLMClientPool().get_provider(model), priority=1
+                )
+            self._futures[key] = future
+        return future
+
+    def submit_function(self, func: typing.Callable, model: str = None, prompt: str = None) -> Future:
+        """
+        Get the LaTeX of a function, see `submit`.
+        :param func:
+        :param model:
+        :param prompt:
+        :return:
+        """
+        return self.submit(func.__qualname__, self.get_source(func), model, prompt)
+
+    def _generate(self, key: str, name: str, model: str, prompt: str, source: str) -> LatexConversion:
+        latex = PromptProcessor.call_llm(model, None, [prompt + "\n\n" + source], action="latify")
+        LatexStore().put(key, name, model, latex)
+        return LatexConversion(latex, self.LLM)
+
+    def latify(self, func: typing.Callable, model: str = None, prompt: str = None) -> str:
+        """
+        Get the LaTeX of a function, waiting for the model on a miss.
+        :param func:
+        :param model:
+        :param prompt:
+        :return:
+        """
+        return self.submit_function(func, model, prompt).result().latex
+
+    async def alatify(self, func: typing.Callable, model: str = None, prompt: str = None) -> str:
+        """
+        Get the LaTeX of a function without blocking the event loop.
+        :param func:
+        :param model:
+        :param prompt:
+        :return:
+        """
+        return (await asyncio.wrap_future(self.submit_function(func, model, prompt))).latex
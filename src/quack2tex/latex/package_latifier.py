@@ -0,0 +1,451 @@
+import ast
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import typing
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from tqdm import tqdm
+
+from quack2tex.inference import InferenceScheduler, LLMClientPool, PromptProcessor
+from .latex_store import LatexStore
+from .latifier import Latifier
+from .python_to_latex import PythonToLatex, UnsupportedSyntax
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FunctionSource:
+    """
+    A function found in a source file, with the LaTeX produced for it.
+    """
+    module: str
+    name: str
+    source: str
+    source_hash: str = field(init=False)
+    latex: typing.Optional[str] = None
+    method: typing.Optional[str] = None
+    error: typing.Optional[str] = None
+
+    def __post_init__(self):
+        self.source_hash = LatexStore.hash_source(self.source)
+
+
+class PackageLatifier:
+    """
+    Converts all the functions of a package to LaTeX, as one document.
+
+    The functions are read from the source files without importing them. Each one is translated
+    offline when possible, then looked up in the `LatexStore` by the hash of its source, so a run
+    after the first one only sends the functions whose source changed. The remaining functions are
+    sent several per request, the requests running concurrently on the inference scheduler, and a
+    function missing from the answer of its batch is sent again on its own.
+    """
+
+    BATCH_PROMPT = (
+        "For each of the following numbered Python functions, start a section with a line holding only "
+        "`### <number>`, then follow the instruction below for that function only.\n\nInstruction: {prompt}"
+    )
+    SECTION_PATTERN = re.compile(r"^#{2,4}\s*\[?(\d+)\]?[.:]?\s*$", re.MULTILINE)
+    LATIFY_DECORATORS = ("latify", "alatify")
+    OUTPUT_FORMATS = ("markdown", "tex")
+    TEX_PROMPT = (
+        "Generate a LaTeX representation of the following function, written as LaTeX only, to be pasted "
+        "in the body of a document using amsmath: display math in \\[ \\] or amsmath environments, "
+        "no markdown, no code fences, no preamble:"
+    )
+    # math kept as is when converting markdown, display math in $$ first so it is not read as two inline ones
+    MATH_PATTERN = re.compile(
+        r"\$\$.*?\$\$|\\\[.*?\\\]|\\\(.*?\\\)|\\begin\{([a-zA-Z]+\*?)\}.*?\\end\{\1\}|\$[^$\n]+\$",
+        re.DOTALL,
+    )
+    LIST_ITEM_PATTERN = re.compile(r"^\s*(?:([-*+])|\d+[.)])\s+(.*)$")
+
+    def __init__(
+        self,
+        model: str = None,
+        prompt: str = None,
+        batch_size: int = 8,
+        use_translator: bool = True,
+        show_progress: bool = True,
+        output_format: str = "markdown",
+    ):
+        """
+        Initialize the converter.
+
+        :param model: The model generating the LaTeX, see `Latifier.get_model`
+        :param prompt: Instruction applied to every function, by default `Latifier.DEFAULT_PROMPT`
+            for markdown and `TEX_PROMPT` for tex
+        :param batch_size: Maximum number of functions sent in one request
+        :param use_translator: Try the offline translator first, only with the default prompt
+        :param show_progress: Show a progress bar of the functions sent
+        :param output_format: markdown or tex, the document the LaTeX is written to, see `to_markdown` and `to_tex`
+        """
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format {output_format}, expected one of {self.OUTPUT_FORMATS}")
+        default_prompt = self.TEX_PROMPT if output_format == "tex" else Latifier.DEFAULT_PROMPT
+        self.model = Latifier.get_model(model)
+        self.prompt = prompt or default_prompt
+        self.batch_size = max(1, batch_size)
+        self.use_translator = use_translator and self.prompt == default_prompt
+        self.show_progress = show_progress
+
+    @classmethod
+    def is_latified(cls, node: ast.AST) -> bool:
+        """
+        Check a function is decorated with latify or alatify, called or not, qualified or not.
+        :param node:
+        :return:
+        """
+        for decorator in getattr(node, "decorator_list", []):
+            target = decorator.func if isinstance(decorator, ast.Call) else decorator
+            name = target.attr if isinstance(target, ast.Attribute) else getattr(target, "id", None)
+            if name in cls.LATIFY_DECORATORS:
+                return True
+        return False
+
+    @classmethod
+    def collect_functions(cls, path: typing.Union[str, Path], decorated_only: bool = False) -> typing.List[FunctionSource]:
+        """
+        Find the functions and methods of a package, or of a single file, in source order.
+        :param path: A package directory or a Python file
+        :param decorated_only: Keep only the functions decorated with latify
+        :return:
+        """
+        path = Path(path)
+        files = [path] if path.is_file() else sorted(path.rglob("*.py"))
+        # module names start with the package name, or are the file name for a single file
+        root = path.parent
+        functions = []
+        for file in files:
+            module = ".".join(file.relative_to(root).with_suffix("").parts)
+            try:
+                source = file.read_text(encoding="utf-8")
+                tree = ast.parse(source, filename=str(file))
+            except (OSError, UnicodeDecodeError, SyntaxError) as e:
+                logger.warning("Skipping %s: %s", file, e)
+                continue
+            lines = source.splitlines()
+            functions.extend(cls._collect_from_body(module, tree.body, lines, decorated_only))
+        return functions
+
+    @classmethod
+    def _collect_from_body(
+        cls, module: str, body: list, lines: typing.List[str], decorated_only: bool, prefix: str = ""
+    ) -> typing.List[FunctionSource]:
+        functions = []
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                functions.extend(
+                    cls._collect_from_body(module, node.body, lines, decorated_only, f"{prefix}{node.name}.")
+                )
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if decorated_only and not cls.is_latified(node):
+                    continue
+                # the decorators are left out, as `Latifier.get_source` does, so both share the stored LaTeX
+                source = textwrap.dedent("\n".join(lines[node.lineno - 1:node.end_lineno]))
+                functions.append(FunctionSource(module, f"{prefix}{node.name}", source))
+        return functions
+
+    def make_key(self, function: FunctionSource) -> str:
+        return LatexStore.make_key(self.model, self.prompt, function.source_hash)
+
+    def make_batch_prompt(self, functions: typing.List[FunctionSource]) -> str:
+        """
+        Build the prompt of a batch, the functions are numbered from 1.
+        :param functions:
+        :return:
+        """
+        sections = [
+            f"Function {index}:\n```python\n{function.source}\n```"
+            for index, function in enumerate(functions, start=1)
+        ]
+        return self.BATCH_PROMPT.format(prompt=self.prompt) + "\n\n" + "\n\n".join(sections)
+
+    @classmethod
+    def split_batch_output(cls, output: str, size: int) -> typing.Dict[int, str]:
+        """
+        Split the answer of a batch into the sections of its functions.
+        :param output:
+        :param size: Number of functions of the batch
+        :return: The non-empty sections by function index, from 0
+        """
+        matches = list(cls.SECTION_PATTERN.finditer(output))
+        sections = {}
+        for match, next_match in zip(matches, matches[1:] + [None]):
+            index = int(match.group(1)) - 1
+            section = output[match.end():next_match.start() if next_match else len(output)].strip()
+            if 0 <= index < size and section and index not in sections:
+                sections[index] = section
+        return sections
+
+    def run_batch(self, functions: typing.List[FunctionSource]) -> typing.List[FunctionSource]:
+        """
+        Convert a batch of functions with one request, storing the LaTeX of every function answered.
+        :param functions:
+        :return: The functions missing from the answer
+        """
+        if len(functions) == 1:
+            prompt = self.prompt + "\n\n" + functions[0].source
+            sections = {0: PromptProcessor.call_llm(self.model, None, [prompt], action="latify")}
+        else:
+            output = PromptProcessor.call_llm(self.model, None, [self.make_batch_prompt(functions)], action="latify")
+            sections = self.split_batch_output(output, len(functions))
+        store = LatexStore()
+        missing = []
+        for index, function in enumerate(functions):
+            if index in sections:
+                function.latex, function.method = sections[index], Latifier.LLM
+                store.put(self.make_key(function), f"{function.module}.{function.name}", self.model, function.latex)
+            else:
+                missing.append(function)
+        return missing
+
+    def run(self, functions: typing.List[FunctionSource]) -> dict:
+        """
+        Produce the LaTeX of the functions, setting their `latex`, `method` and `error`.
+        :param functions:
+        :return: Counters of the run: translated, stored, sent, requests and failed
+        """
+        counters = {"translated": 0, "stored": 0, "sent": 0, "requests": 0, "failed": 0}
+        store = LatexStore()
+        pending = []
+        for function in functions:
+            if self.use_translator:
+                try:
+                    function.latex, function.method = PythonToLatex.translate(function.source), Latifier.AST
+                    counters["translated"] += 1
+                    continue
+                except UnsupportedSyntax:
+                    pass
+            latex = store.get(self.make_key(function))
+            if latex is not None:
+                function.latex, function.method = latex, Latifier.LLM
+                counters["stored"] += 1
+            else:
+                pending.append(function)
+        counters["sent"] = len(pending)
+
+        scheduler = InferenceScheduler()
+        provider = LLMClientPool().get_provider(self.model)
+        batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        futures = {scheduler.submit(self.run_batch, batch, provider=provider, priority=1): batch for batch in batches}
+        counters["requests"] = len(futures)
+        with tqdm(total=len(pending), unit="function", disable=not self.show_progress) as progress:
+            while futures:
+                retries = {}
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    try:
+                        missing = future.result()
+                    except Exception as e:
+                        logger.warning("A batch of %d functions failed: %s", len(batch), e)
+                        for function in batch:
+                            function.error = str(e)
+                        progress.update(len(batch))
+                        continue
+                    progress.update(len(batch) - len(missing))
+                    if len(batch) == 1:
+                        for function in missing:
+                            function.error = "The model returned no LaTeX"
+                            progress.update(1)
+                        continue
+                    for function in missing:
+                        retries[scheduler.submit(self.run_batch, [function], provider=provider, priority=1)] = [function]
+                counters["requests"] += len(retries)
+                futures = retries
+        counters["failed"] = sum(1 for function in functions if function.latex is None)
+        return counters
+
+    @staticmethod
+    def strip_code_fences(latex: str) -> str:
+        return re.sub(r"```(?:latex|tex|math|markdown)?\s*\n?(.*?)```", r"\1", latex, flags=re.DOTALL).strip()
+
+    @classmethod
+    def to_markdown(cls, functions: typing.List[FunctionSource], title: str) -> str:
+        """
+        Write the functions as a markdown document, one section per module.
+        :param functions:
+        :param title:
+        :return:
+        """
+        parts = [f"# {title}"]
+        module = None
+        for function in functions:
+            if function.module != module:
+                module = function.module
+                parts.append(f"## `{module}`")
+            parts.append(f"### `{function.name}`")
+            parts.append(function.latex if function.latex is not None else f"*Not converted: {function.error}*")
+        return "\n\n".join(parts) + "\n"
+
+    @staticmethod
+    def escape_tex(text: str) -> str:
+        """
+        Escape the characters of a text having a meaning in LaTeX, the backslashes of LaTeX commands are kept.
+        :param text:
+        :return:
+        """
+        return re.sub(r"(?<!\\)([_&%$#])", r"\\\1", text)
+
+    @classmethod
+    def markdown_to_tex(cls, text: str) -> str:
+        """
+        Convert the markdown left in an answer to LaTeX: display math in $$, headings, bold, italic,
+        inline code and lists. The math and the LaTeX already there are kept as is.
+        :param text:
+        :return:
+        """
+        maths = []
+
+        def hide_math(match: re.Match) -> str:
+            math = match.group(0)
+            maths.append(f"\\[{math[2:-2]}\\]" if math.startswith("$$") else math)
+            return f"\0{len(maths) - 1}\0"
+
+        # the math is hidden while the lines are converted, so lists and paragraphs can hold math
+        converted = cls._markdown_text_to_tex(cls.MATH_PATTERN.sub(hide_math, text.replace("\0", "")))
+        return re.sub(r"\0(\d+)\0", lambda match: maths[int(match.group(1))], converted).strip()
+
+    @classmethod
+    def _markdown_text_to_tex(cls, text: str) -> str:
+        def inline(line: str) -> str:
+            # code spans are escaped as a whole, the rest keeps its LaTeX commands
+            pieces = re.split(r"`([^`]+)`", line)
+            for index, piece in enumerate(pieces):
+                if index % 2:
+                    code = re.sub(
+                        r"[_&%$#{}\\]", lambda m: "\\textbackslash{}" if m.group(0) == "\\" else "\\" + m.group(0), piece
+                    )
+                    pieces[index] = "\\texttt{" + code + "}"
+                else:
+                    piece = cls.escape_tex(piece)
+                    piece = re.sub(r"\*\*(.+?)\*\*", r"\\textbf{\1}", piece)
+                    pieces[index] = re.sub(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", r"\\emph{\1}", piece)
+            return "".join(pieces)
+
+        lines = []
+        environment = None
+        for line in text.split("\n"):
+            heading = re.match(r"^\s*#{1,6}\s+(.*?)\s*#*\s*$", line)
+            item = cls.LIST_ITEM_PATTERN.match(line)
+            item_environment = (("itemize" if item.group(1) else "enumerate") if item else None)
+            if environment and item_environment != environment and (line.strip() or item_environment):
+                lines.append(f"\\end{{{environment}}}")
+                environment = None
+            if heading:
+                lines.append(f"\\paragraph{{{inline(heading.group(1))}}}")
+            elif item:
+                if environment is None:
+                    environment = item_environment
+                    lines.append(f"\\begin{{{environment}}}")
+                lines.append(f"\\item {inline(item.group(2))}")
+            else:
+                lines.append(inline(line))
+        if environment:
+            lines.append(f"\\end{{{environment}}}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def check_tex_fragment(latex: str) -> typing.Optional[str]:
+        """
+        Check that a piece of LaTeX can be pasted in a document: balanced braces, environments and
+        math delimiters. It does not replace compiling the document, see `compile_tex`.
+        :param latex:
+        :return: What is wrong, None when the fragment is well formed
+        """
+        # escaped characters and \\ line breaks do not count
+        latex = re.sub(r"\\[\\{}$&%#_]", "", latex)
+        depth = 0
+        for char in latex:
+            depth += {"{": 1, "}": -1}.get(char, 0)
+            if depth < 0:
+                return "unbalanced braces"
+        if depth:
+            return "unbalanced braces"
+        environments = []
+        for command, name in re.findall(r"\\(begin|end)\{([^}]*)\}", latex):
+            if command == "begin":
+                environments.append(name)
+            elif not environments or environments.pop() != name:
+                return f"unbalanced environment {name}"
+        if environments:
+            return f"unclosed environment {environments[-1]}"
+        if "$$" in latex or latex.count("$") % 2:
+            return "unbalanced math delimiters"
+        if latex.count("\\[") != latex.count("\\]") or latex.count("\\(") != latex.count("\\)"):
+            return "unbalanced math delimiters"
+        return None
+
+    @classmethod
+    def compile_tex(cls, document: str, timeout: float = 120) -> typing.Optional[str]:
+        """
+        Compile a LaTeX document with pdflatex to check it, the PDF is discarded.
+        :param document:
+        :param timeout: Seconds before the compilation is given up
+        :return: The first error of the log, None when the document compiles
+        :raises FileNotFoundError: when pdflatex is not installed
+        """
+        compiler = shutil.which("pdflatex")
+        if compiler is None:
+            raise FileNotFoundError("pdflatex is not installed")
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "document.tex").write_text(document, encoding="utf-8")
+            try:
+                process = subprocess.run(
+                    [compiler, "-interaction=nonstopmode", "-halt-on-error", "document.tex"],
+                    cwd=directory, capture_output=True, text=True, errors="replace", timeout=timeout,
+                )
+            except subprocess.TimeoutExpired:
+                return f"pdflatex did not finish within {timeout} seconds"
+        if process.returncode == 0:
+            return None
+        errors = [line for line in process.stdout.splitlines() if line.startswith("!")]
+        return errors[0] if errors else f"pdflatex exited with code {process.returncode}"
+
+    @classmethod
+    def to_tex(cls, functions: typing.List[FunctionSource], title: str) -> str:
+        """
+        Write the functions as a LaTeX document, one section per module. The markdown left in the
+        answers is converted, and an answer that is not well formed LaTeX is written verbatim so
+        the document still compiles.
+        :param functions:
+        :param title:
+        :return:
+        """
+        def escape(text: str) -> str:
+            return re.sub(r"([_&%$#{}])", r"\\\1", text)
+
+        parts = ["\n".join([
+            "\\documentclass{article}",
+            "\\usepackage{amsmath,amssymb}",
+            f"\\title{{{escape(title)}}}",
+            "\\begin{document}",
+            "\\maketitle",
+        ])]
+        module = None
+        for function in functions:
+            if function.module != module:
+                module = function.module
+                parts.append(f"\\section{{\\texttt{{{escape(module)}}}}}")
+            parts.append(f"\\subsection{{\\texttt{{{escape(function.name)}}}}}")
+            if function.latex is not None:
+                latex = cls.markdown_to_tex(cls.strip_code_fences(function.latex))
+                error = cls.check_tex_fragment(latex)
+                if error is None:
+                    parts.append(latex)
+                else:
+                    # kept readable without breaking the document
+                    logger.warning("The LaTeX of %s.%s is malformed: %s", function.module, function.name, error)
+                    parts.append(f"\\textit{{Malformed LaTeX: {error}}}")
+                    parts.append(f"\\begin{{verbatim}}\n{function.latex}\n\\end{{verbatim}}")
+            else:
+                parts.append(f"\\textit{{Not converted: {escape(function.error or '')}}}")
+        parts.append("\\end{document}")
+        return "\n\n".join(parts) + "\n"
@@ -0,0 +1,379 @@
+import ast
+import textwrap
+import typing
+
+
+class UnsupportedSyntax(ValueError):
+    """
+    Raised by `PythonToLatex` on a construct it does not translate, the model handles those.
+    """
+
+
+class PythonToLatex:
+    """
+    Deterministic translation of arithmetic Python functions to LaTeX, without any model call.
+
+    A function made of assignments and a final return is rendered as its equations, one line per
+    new variable, with the reassigned variables substituted into the expressions using them.
+    Arithmetic, powers, comparisons, conditional expressions, indexing, `sum`/`prod` over
+    generators of `range` or of a sequence, and the usual `math`/`numpy` functions and constants
+    are supported. Any other construct, loops, branches, methods or keyword arguments among others,
+    raises `UnsupportedSyntax`.
+    """
+
+    # operator precedences, an operand binding less tightly than its operator is parenthesized,
+    # sums and products extend to the right, so they are parenthesized as operands of arithmetic,
+    # and a fraction is parenthesized as the base of a power
+    OR, AND, NOT, COMPARE, REDUCTION, ADD, MUL, UNARY, FRACTION, POWER, CALL, ATOM = (
+        10, 20, 30, 40, 45, 50, 60, 70, 75, 80, 90, 100
+    )
+
+    GREEK_LETTERS = {
+        "alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa", "mu", "nu",
+        "xi", "pi", "rho", "sigma", "tau", "phi", "chi", "psi", "omega",
+        "Gamma", "Delta", "Theta", "Xi", "Pi", "Sigma", "Phi", "Psi", "Omega",
+    }
+    MODULES = {"np", "numpy", "math", "cmath", "scipy", "sp", "jnp", "torch"}
+    CONSTANTS = {"pi": r"\pi", "e": "e", "inf": r"\infty", "tau": r"\tau", "nan": r"\mathrm{NaN}"}
+    NAMED_FUNCTIONS = {
+        "sin": r"\sin", "cos": r"\cos", "tan": r"\tan",
+        "arcsin": r"\arcsin", "arccos": r"\arccos", "arctan": r"\arctan",
+        "asin": r"\arcsin", "acos": r"\arccos", "atan": r"\arctan",
+        "sinh": r"\sinh", "cosh": r"\cosh", "tanh": r"\tanh",
+        "log": r"\ln", "log2": r"\log_{2}", "log10": r"\log_{10}",
+        "max": r"\max", "min": r"\min", "maximum": r"\max", "minimum": r"\min",
+        "amax": r"\max", "amin": r"\min", "det": r"\det",
+    }
+    BINARY_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: r"\cdot", ast.MatMult: r"\cdot", ast.Mod: r"\bmod"}
+    COMPARE_OPERATORS = {
+        ast.Eq: "=", ast.NotEq: r"\neq", ast.Lt: "<", ast.LtE: r"\leq", ast.Gt: ">", ast.GtE: r"\geq",
+        ast.In: r"\in", ast.NotIn: r"\notin", ast.Is: "=", ast.IsNot: r"\neq",
+    }
+
+    def __init__(self):
+        # latex and precedence of the variables reassigned so far, substituted where they are used
+        self._substitutions: typing.Dict[str, typing.Tuple[str, int]] = {}
+
+    @classmethod
+    def translate(cls, source: str) -> str:
+        """
+        Translate the source of a function to a markdown math block.
+        :param source: The source of a single function, decorators included or not
+        :return:
+        """
+        try:
+            tree = ast.parse(textwrap.dedent(source))
+        except SyntaxError as e:
+            raise UnsupportedSyntax(f"The source does not parse: {e}") from e
+        functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+        if len(functions) != 1:
+            raise UnsupportedSyntax("The source must hold exactly one function")
+        lines = cls().translate_function(functions[0])
+        if len(lines) == 1:
+            return f"$$\n{lines[0][0]} = {lines[0][1]}\n$$"
+        body = " \\\\\n".join(f"{left} &= {right}" for left, right in lines)
+        return f"$$\n\\begin{{aligned}}\n{body}\n\\end{{aligned}}\n$$"
+
+    def translate_function(self, function: ast.FunctionDef) -> typing.List[typing.Tuple[str, str]]:
+        """
+        Translate a function to its equations.
+        :param function:
+        :return: (left side, right side) pairs, the last one defines the function
+        """
+        arguments = function.args
+        if arguments.vararg or arguments.kwarg or arguments.kwonlyargs or arguments.posonlyargs:
+            raise UnsupportedSyntax("Only positional arguments are supported")
+        parameters = [argument.arg for argument in arguments.args]
+        assigned = set(parameters)
+        lines = []
+        body = function.body
+        if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            body = body[1:]
+        if not body or not isinstance(body[-1], ast.Return) or body[-1].value is None:
+            raise UnsupportedSyntax("The function must end with a return of a value")
+
+        for statement in body[:-1]:
+            if isinstance(statement, ast.Assign) and len(statement.targets) == 1 \
+                    and isinstance(statement.targets[0], ast.Name):
+                name, value = statement.targets[0].id, statement.value
+            elif isinstance(statement, ast.AnnAssign) and isinstance(statement.target, ast.Name) and statement.value:
+                name, value = statement.target.id, statement.value
+            elif isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name):
+                name = statement.target.id
+                value = ast.BinOp(left=ast.Name(id=name, ctx=ast.Load()), op=statement.op, right=statement.value)
+            else:
+                raise UnsupportedSyntax(f"Unsupported statement {type(statement).__name__}")
+            if name in assigned:
+                self._substitutions[name] = self.expression(value)
+            else:
+                lines.append((self.name(name), self.expression(value)[0]))
+                assigned.add(name)
+
+        signature = f"{self.function_name(function.name)}\\left({', '.join(map(self.name, parameters))}\\right)"
+        lines.append((signature, self.expression(body[-1].value)[0]))
+        return lines
+
+    @classmethod
+    def escape(cls, text: str) -> str:
+        return text.replace("\\", r"\backslash ").replace("_", r"\_").replace("{", r"\{").replace("}", r"\}")
+
+    @classmethod
+    def name(cls, identifier: str) -> str:
+        """
+        Render a variable, x, \\alpha, x_{1} or \\mathit{dx}.
+        :param identifier:
+        :return:
+        """
+        base, _, subscript = identifier.partition("_")
+        if subscript and (len(base) == 1 or base in cls.GREEK_LETTERS) and "_" not in subscript:
+            return f"{cls.name(base)}_{{{cls.name(subscript) if not subscript.isdigit() else subscript}}}"
+        if identifier in cls.GREEK_LETTERS:
+            return f"\\{identifier}"
+        if len(identifier) == 1:
+            return identifier
+        return f"\\mathit{{{cls.escape(identifier)}}}"
+
+    @classmethod
+    def function_name(cls, identifier: str) -> str:
+        if len(identifier) == 1:
+            return identifier
+        return f"\\operatorname{{{cls.escape(identifier)}}}"
+
+    @staticmethod
+    def wrap(operand: typing.Tuple[str, int], precedence: int, strict: bool = False) -> str:
+        """
+        Parenthesize an operand binding less tightly than its operator.
+        :param operand: latex and precedence
+        :param precedence: precedence of the operator
+        :param strict: also parenthesize an operand of the same precedence, e.g. the right side of a minus
+        :return:
+        """
+        latex, operand_precedence = operand
+        if operand_precedence < precedence or (strict and operand_precedence == precedence):
+            return f"\\left({latex}\\right)"
+        return latex
+
+    def expression(self, node: ast.AST) -> typing.Tuple[str, int]:
+        """
+        Translate an expression.
+        :param node:
+        :return: The latex and the precedence of the expression
+        """
+        method = getattr(self, f"expression_{type(node).__name__.lower()}", None)
+        if method is None:
+            raise UnsupportedSyntax(f"Unsupported expression {type(node).__name__}")
+        return method(node)
+
+    def expression_constant(self, node: ast.Constant) -> typing.Tuple[str, int]:
+        value = node.value
+        if isinstance(value, bool) or value is None:
+            return f"\\mathrm{{{value}}}", self.ATOM
+        if isinstance(value, (int, float)):
+            text = repr(value)
+            if "e" in text and isinstance(value, float):
+                mantissa, exponent = text.split("e")
+                return f"{mantissa} \\times 10^{{{int(exponent)}}}", self.MUL
+            return text, self.ATOM
+        if isinstance(value, str):
+            return f"\\text{{{self.escape(value)}}}", self.ATOM
+        raise UnsupportedSyntax(f"Unsupported constant {value!r}")
+
+    def expression_name(self, node: ast.Name) -> typing.Tuple[str, int]:
+        if node.id in self._substitutions:
+            return self._substitutions[node.id]
+        return self.name(node.id), self.ATOM
+
+    def expression_attribute(self, node: ast.Attribute) -> typing.Tuple[str, int]:
+        if self.is_module(node.value) and node.attr in self.CONSTANTS:
+            return self.CONSTANTS[node.attr], self.ATOM
+        if node.attr == "T":
+            return f"{self.wrap(self.expression(node.value), self.ATOM)}^{{\\top}}", self.POWER
+        raise UnsupportedSyntax(f"Unsupported attribute {node.attr}")
+
+    def expression_binop(self, node: ast.BinOp) -> typing.Tuple[str, int]:
+        left, right = self.expression(node.left), self.expression(node.right)
+        if isinstance(node.op, ast.Div):
+            return f"\\frac{{{left[0]}}}{{{right[0]}}}", self.FRACTION
+        if isinstance(node.op, ast.FloorDiv):
+            return f"\\left\\lfloor \\frac{{{left[0]}}}{{{right[0]}}} \\right\\rfloor", self.ATOM
+        if isinstance(node.op, ast.Pow):
+            return f"{self.wrap(left, self.POWER, strict=True)}^{{{right[0]}}}", self.POWER
+        operator = self.BINARY_OPERATORS.get(type(node.op))
+        if operator is None:
+            raise UnsupportedSyntax(f"Unsupported operator {type(node.op).__name__}")
+        precedence = self.ADD if operator in ("+", "-") else self.MUL
+        strict = isinstance(node.op, (ast.Sub, ast.Mod))
+        return f"{self.wrap(left, precedence)} {operator} {self.wrap(right, precedence, strict)}", precedence
+
+    def expression_unaryop(self, node: ast.UnaryOp) -> typing.Tuple[str, int]:
+        operand = self.expression(node.operand)
+        if isinstance(node.op, ast.Not):
+            return f"\\lnot {self.wrap(operand, self.NOT)}", self.NOT
+        if isinstance(node.op, ast.Invert):
+            raise UnsupportedSyntax("Unsupported operator Invert")
+        sign = "-" if isinstance(node.op, ast.USub) else "+"
+        # -x**2 is -(x**2) in Python, the power binds tighter and needs no parentheses
+        return f"{sign}{self.wrap(operand, self.UNARY)}", self.UNARY
+
+    def expression_boolop(self, node: ast.BoolOp) -> typing.Tuple[str, int]:
+        operator, precedence = (r"\land", self.AND) if isinstance(node.op, ast.And) else (r"\lor", self.OR)
+        values = [self.wrap(self.expression(value), precedence, strict=True) for value in node.values]
+        return f" {operator} ".join(values), precedence
+
+    def expression_compare(self, node: ast.Compare) -> typing.Tuple[str, int]:
+        parts = [self.wrap(self.expression(node.left), self.COMPARE, strict=True)]
+        for operator, comparator in zip(node.ops, node.comparators):
+            parts.append(self.COMPARE_OPERATORS[type(operator)])
+            parts.append(self.wrap(self.expression(comparator), self.COMPARE, strict=True))
+        return " ".join(parts), self.COMPARE
+
+    def expression_ifexp(self, node: ast.IfExp) -> typing.Tuple[str, int]:
+        body, test, orelse = self.expression(node.body), self.expression(node.test), self.expression(node.orelse)
+        return (
+            f"\\begin{{cases}} {body[0]} & \\text{{if }} {test[0]} \\\\ "
+            f"{orelse[0]} & \\text{{otherwise}} \\end{{cases}}",
+            self.ATOM,
+        )
+
+    def expression_subscript(self, node: ast.Subscript) -> typing.Tuple[str, int]:
+        indices = node.slice.elts if isinstance(node.slice, ast.Tuple) else [node.slice]
+        if any(isinstance(index, ast.Slice) for index in indices):
+            raise UnsupportedSyntax("Unsupported slice")
+        subscript = ", ".join(self.expression(index)[0] for index in indices)
+        return self.indexed(self.wrap(self.expression(node.value), self.ATOM), subscript), self.ATOM
+
+    @staticmethod
+    def indexed(base: str, subscript: str) -> str:
+        """
+        Subscript a rendered expression, grouping a base already subscripted, e.g. {x_{1}}_{i}.
+        :param base:
+        :param subscript:
+        :return:
+        """
+        if "_" in base and not base.startswith("\\left("):
+            base = f"{{{base}}}"
+        return f"{base}_{{{subscript}}}"
+
+    def expression_tuple(self, node: ast.Tuple) -> typing.Tuple[str, int]:
+        return f"\\left({', '.join(self.expression(element)[0] for element in node.elts)}\\right)", self.ATOM
+
+    def expression_list(self, node: ast.List) -> typing.Tuple[str, int]:
+        return f"\\left[{', '.join(self.expression(element)[0] for element in node.elts)}\\right]", self.ATOM
+
+    def is_module(self, node: ast.AST) -> bool:
+        """
+        Check a node is a math module, e.g. np, math or np.linalg.
+        :param node:
+        :return:
+        """
+        while isinstance(node, ast.Attribute):
+            node = node.value
+        return isinstance(node, ast.Name) and node.id in self.MODULES
+
+    def expression_call(self, node: ast.Call) -> typing.Tuple[str, int]:
+        if node.keywords or any(isinstance(argument, ast.Starred) for argument in node.args):
+            raise UnsupportedSyntax("Unsupported keyword or starred arguments")
+        if isinstance(node.func, ast.Name):
+            name = node.func.id
+        elif isinstance(node.func, ast.Attribute) and self.is_module(node.func.value):
+            name = node.func.attr
+        else:
+            raise UnsupportedSyntax("Only functions and math module functions can be called")
+        arguments = node.args
+
+        if name in ("sum", "prod", "nansum") and len(arguments) == 1:
+            return self.reduction(r"\prod" if name == "prod" else r"\sum", arguments[0])
+        if name in ("mean", "average", "std", "var") and len(arguments) == 1 and isinstance(arguments[0], ast.Name):
+            return self.statistic(name, arguments[0].id)
+        if len(arguments) == 1:
+            argument = self.expression(arguments[0])
+            if name == "exp":
+                return f"e^{{{argument[0]}}}", self.POWER
+            if name == "sqrt":
+                return f"\\sqrt{{{argument[0]}}}", self.ATOM
+            if name == "cbrt":
+                return f"\\sqrt[3]{{{argument[0]}}}", self.ATOM
+            if name in ("abs", "fabs", "absolute", "len"):
+                return f"\\left|{argument[0]}\\right|", self.ATOM
+            if name == "norm":
+                return f"\\left\\|{argument[0]}\\right\\|", self.ATOM
+            if name == "floor":
+                return f"\\left\\lfloor {argument[0]} \\right\\rfloor", self.ATOM
+            if name == "ceil":
+                return f"\\left\\lceil {argument[0]} \\right\\rceil", self.ATOM
+            if name == "factorial":
+                return f"{self.wrap(argument, self.ATOM)}!", self.POWER
+        if name == "log" and len(arguments) == 2:
+            value, base = self.expression(arguments[0]), self.expression(arguments[1])
+            return f"\\log_{{{base[0]}}}\\left({value[0]}\\right)", self.CALL
+        if name in ("pow", "power") and len(arguments) == 2:
+            base, exponent = self.expression(arguments[0]), self.expression(arguments[1])
+            return f"{self.wrap(base, self.POWER, strict=True)}^{{{exponent[0]}}}", self.POWER
+        if name in ("dot", "matmul") and len(arguments) == 2:
+            left, right = self.expression(arguments[0]), self.expression(arguments[1])
+            return f"{self.wrap(left, self.MUL)} \\cdot {self.wrap(right, self.MUL)}", self.MUL
+
+        latex_arguments = ", ".join(self.expression(argument)[0] for argument in arguments)
+        function = self.NAMED_FUNCTIONS.get(name) or self.function_name(name)
+        return f"{function}\\left({latex_arguments}\\right)", self.CALL
+
+    def reduction(self, operator: str, node: ast.AST) -> typing.Tuple[str, int]:
+        """
+        Translate a sum or a product, over a generator or over the elements of a sequence.
+        :param operator: \\sum or \\prod
+        :param node: The argument of the call
+        :return:
+        """
+        if not isinstance(node, (ast.GeneratorExp, ast.ListComp)):
+            sequence = self.expression(node)
+            return f"{operator}_{{i}} {self.indexed(self.wrap(sequence, self.ATOM), 'i')}", self.REDUCTION
+        limits = []
+        for generator in node.generators:
+            if generator.ifs or generator.is_async or not isinstance(generator.target, ast.Name):
+                raise UnsupportedSyntax("Only unconditional generators over a single variable are supported")
+            limits.append(self.limits(self.name(generator.target.id), generator.iter))
+        body = self.wrap(self.expression(node.elt), self.MUL)
+        return " ".join(f"{operator}_{{{lower}}}{upper}" for lower, upper in limits) + f" {body}", self.REDUCTION
+
+    def limits(self, variable: str, iterable: ast.AST) -> typing.Tuple[str, str]:
+        """
+        Get the bounds of a reduction variable.
+        :param variable:
+        :param iterable:
+        :return: The lower bound and the upper bound, empty for a sequence
+        """
+        is_range = isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name) \
+            and iterable.func.id == "range" and not iterable.keywords
+        if not is_range:
+            return f"{variable} \\in {self.wrap(self.expression(iterable), self.ATOM)}", ""
+        arguments = iterable.args
+        if len(arguments) == 3 or not arguments:
+            raise UnsupportedSyntax("Only range with a unit step is supported")
+        start = self.expression(arguments[0])[0] if len(arguments) == 2 else "0"
+        stop = arguments[-1]
+        if isinstance(stop, ast.Constant) and isinstance(stop.value, int) and not isinstance(stop.value, bool):
+            last = str(stop.value - 1)
+        elif isinstance(stop, ast.BinOp) and isinstance(stop.op, ast.Add) \
+                and isinstance(stop.right, ast.Constant) and stop.right.value == 1:
+            # range(n + 1) runs up to n
+            last = self.expression(stop.left)[0]
+        else:
+            last = f"{self.wrap(self.expression(stop), self.ADD)} - 1"
+        return f"{variable}={start}", f"^{{{last}}}"
+
+    def statistic(self, name: str, sequence: str) -> typing.Tuple[str, int]:
+        """
+        Translate the mean, the variance or the standard deviation of a sequence.
+        :param name:
+        :param sequence:
+        :return:
+        """
+        element = self.indexed(self.name(sequence), "i")
+        mean = f"\\bar{{{self.name(sequence)}}}"
+        if name in ("mean", "average"):
+            return f"\\frac{{1}}{{N}} \\sum_{{i=1}}^{{N}} {element}", self.REDUCTION
+        variance = f"\\frac{{1}}{{N}} \\sum_{{i=1}}^{{N}} \\left({element} - {mean}\\right)^{{2}}"
+        if name == "var":
+            return variance, self.REDUCTION
+        return f"\\sqrt{{{variance}}}", self.ATOM
@@ -0,0 +1,45 @@
+import asyncio
+import typing
+from concurrent.futures import Future
+
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+
+
+class Quack2TexWrappedFunctionResult(BaseModel):
+    """
+    The result of a latified function, with the LaTeX of the function resolved on first access.
+
+    `latex` and `latex_method` are serialized with the result, so dumping a result still being
+    translated waits for its LaTeX.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    result: typing.Any
+    latex_future: Future = Field(exclude=True, repr=False)
+
+    @computed_field(repr=False)
+    @property
+    def latex(self) -> str:
+        """
+        The LaTeX of the function, waiting for the model when it is still being generated.
+        """
+        return self.latex_future.result().latex
+
+    @computed_field(repr=False)
+    @property
+    def latex_method(self) -> str:
+        """
+        How the LaTeX was produced, ast for the offline translator or llm for a model, see `Latifier`.
+        """
+        return self.latex_future.result().method
+
+    @property
+    def latex_ready(self) -> bool:
+        return self.latex_future.done()
+
+    async def alatex(self) -> str:
+        """
+        Get the LaTeX of the function without blocking the event loop.
+        :return:
+        """
+        return (await asyncio.wrap_future(self.latex_future)).latex
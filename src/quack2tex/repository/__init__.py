@@ -1,3 +1,4 @@
 
 from .menu_item_repository import MenuItemRepository
-from .prompt_repository import PromptRepository
\ No newline at end of file
+from .prompt_repository import PromptRepository
+from .inference_call_repository import InferenceCallRepository
\ No newline at end of file
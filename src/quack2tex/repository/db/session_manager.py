@@ -1,7 +1,7 @@
 import contextlib
 from typing import Any, AsyncIterator
 
-from sqlalchemy import event, NullPool, create_engine
+from sqlalchemy import event, NullPool, create_engine, inspect, text
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncSession,
@@ -189,6 +189,32 @@ class SessionManager(metaclass=Singleton):
         if drop_all:
             mapper_registry.metadata.drop_all(self._engine)
         mapper_registry.metadata.create_all(self._engine)
+        self.add_missing_columns()
+        return self
+
+    def add_missing_columns(self):
+        """
+        Add the columns declared on the models that are missing from existing tables.
+        `create_all` never alters a table that already exists, so columns introduced after a
+        database was created are added in place instead of requiring the file to be deleted.
+
+        :return: Self
+        """
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        inspector = inspect(self._engine)
+        with self._engine.begin() as connection:
+            for table in mapper_registry.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns or not column.nullable:
+                        continue
+                    column_type = column.type.compile(dialect=self._engine.dialect)
+                    connection.execute(
+                        text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+                    )
         return self
 
     async def async_close(self):
@@ -0,0 +1,121 @@
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from quack2tex.repository.models import InferenceCall
+from quack2tex.utils import Tracer
+
+
+class InferenceCallRepository:
+    """
+    Repository class for handling operations related to the recorded model calls.
+    """
+
+    @classmethod
+    @Tracer.traced(category="db")
+    def add_calls(cls, session: Session, calls: List[InferenceCall]) -> None:
+        """
+        Stores a batch of model call outcomes.
+
+        Args:
+            session (Session): The active database session.
+            calls (List[InferenceCall]): The outcomes to store.
+        """
+        session.add_all(calls)
+        session.commit()
+
+    @classmethod
+    @Tracer.traced(category="db")
+    def get_recent_calls(
+        cls,
+        session: Session,
+        window: int = 100,
+        models: List[str] = None,
+        action: str = None,
+        input_type: str = None
+    ) -> List[tuple]:
+        """
+        Retrieves the last calls of every model, newest first.
+
+        Args:
+            session (Session): The active database session.
+            window (int): Number of calls kept per model.
+            models (List[str]): Optional models to restrict to.
+            action (str): Optional action to restrict to.
+            input_type (str): Optional input type to restrict to, image or text.
+
+        Returns:
+            List[tuple]: (model, time to first token, latency, error class) rows.
+        """
+        rank = func.row_number().over(partition_by=InferenceCall.model, order_by=InferenceCall.id.desc())
+        recent = select(
+            InferenceCall.model,
+            InferenceCall.time_to_first_token,
+            InferenceCall.latency,
+            InferenceCall.error_class,
+            rank.label("rank"),
+        )
+        if models:
+            recent = recent.where(InferenceCall.model.in_(models))
+        if action:
+            recent = recent.where(InferenceCall.action == action)
+        if input_type:
+            recent = recent.where(InferenceCall.input_type == input_type)
+        recent = recent.subquery()
+        query = select(
+            recent.c.model, recent.c.time_to_first_token, recent.c.latency, recent.c.error_class
+        ).where(recent.c.rank <= window)
+        return session.execute(query).all()
+
+    @classmethod
+    def get_model_stats(
+        cls,
+        session: Session,
+        window: int = 100,
+        models: List[str] = None,
+        action: str = None,
+        input_type: str = None
+    ) -> Dict[str, dict]:
+        """
+        Computes the rolling latency percentiles and error rate of every model over its last calls.
+        The percentiles are computed on the successful calls only.
+
+        Args:
+            session (Session): The active database session.
+            window (int): Number of calls considered per model.
+            models (List[str]): Optional models to restrict to.
+            action (str): Optional action to restrict to.
+            input_type (str): Optional input type to restrict to, image or text.
+
+        Returns:
+            Dict[str, dict]: Statistics keyed by model.
+        """
+        rows = cls.get_recent_calls(session, window, models, action, input_type)
+        if not rows:
+            return {}
+        model_names = np.array([row[0] for row in rows], dtype=object)
+        ttfts = np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=np.float64)
+        latencies = np.array([row[2] for row in rows], dtype=np.float64)
+        failed = np.array([row[3] is not None for row in rows], dtype=bool)
+
+        stats = {}
+        for model in np.unique(model_names):
+            mask = model_names == model
+            succeeded = mask & ~failed
+            model_ttfts = ttfts[succeeded & ~np.isnan(ttfts)]
+            latency_p50, latency_p95 = (
+                np.percentile(latencies[succeeded], [50, 95]) if succeeded.any() else (None, None)
+            )
+            ttft_p50, ttft_p95 = np.percentile(model_ttfts, [50, 95]) if model_ttfts.size else (None, None)
+            stats[str(model)] = {
+                "calls": int(mask.sum()),
+                "errors": int((mask & failed).sum()),
+                "error_rate": float((mask & failed).sum() / mask.sum()),
+                "latency_p50": None if latency_p50 is None else float(latency_p50),
+                "latency_p95": None if latency_p95 is None else float(latency_p95),
+                "ttft_p50": None if ttft_p50 is None else float(ttft_p50),
+                "ttft_p95": None if ttft_p95 is None else float(ttft_p95),
+            }
+        return stats
@@ -1,5 +1,6 @@
 from quack2tex.repository.models import MenuItem
 from quack2tex.repository.db.sync_session import get_db_session
+from quack2tex.utils import Tracer
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
@@ -22,6 +23,7 @@ class MenuItemRepository:
             MenuItemRepository.populate_item_children(session, child)
 
     @classmethod
+    @Tracer.traced(category="db")
     def fetch_root_item_data(cls, session: Session) -> Optional[MenuItem]:
         """
         Fetches the root node of the menu tree.
@@ -35,6 +37,22 @@ class MenuItemRepository:
         return session.query(MenuItem).filter(MenuItem.is_root == True).first()
 
     @classmethod
+    @Tracer.traced(category="db")
+    def fetch_item_by_name(cls, session: Session, name: str) -> Optional[MenuItem]:
+        """
+        Fetches a menu item by its name.
+
+        Args:
+            session (Session): The active database session.
+            name (str): The name of the menu item.
+
+        Returns:
+            Optional[MenuItem]: The first menu item with that name, if any.
+        """
+        return session.query(MenuItem).filter(MenuItem.name == name).first()
+
+    @classmethod
+    @Tracer.traced(category="db")
     def fetch_root_children_data(cls, session: Session, parent_id: int) -> List[MenuItem]:
         """
         Fetches child items of a given parent menu item.
@@ -56,6 +74,7 @@ class MenuItemRepository:
         return menu_items
 
     @classmethod
+    @Tracer.traced(category="db")
     def fetch_tree_data(cls, session: Session) -> List[MenuItem]:
         """
         Constructs a tree structure of menu items with parent-child relationships.
@@ -79,6 +98,7 @@ class MenuItemRepository:
         return tree
 
     @classmethod
+    @Tracer.traced(category="db")
     def add_item(cls, session: Session, item: MenuItem) -> MenuItem:
         """
         Adds a new menu item to the database.
@@ -100,6 +120,7 @@ class MenuItemRepository:
 
 
     @classmethod
+    @Tracer.traced(category="db")
     def delete_items(cls, session: Session, item_ids: List[int]) -> None:
         """
         Deletes multiple menu items from the database.
@@ -114,6 +135,7 @@ class MenuItemRepository:
         session.commit()
 
     @classmethod
+    @Tracer.traced(category="db")
     def update_item(cls, session: Session, item: MenuItem) -> MenuItem:
         """
         Updates a menu item in the database.
@@ -4,7 +4,7 @@ import os
 from pathlib import Path
 from typing import TYPE_CHECKING, List
 from datetime import datetime, timezone
-from sqlalchemy import ForeignKey, event, LargeBinary, Text, func, DateTime
+from sqlalchemy import ForeignKey, event, LargeBinary, Text, func, DateTime, Float
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -43,6 +43,9 @@ class MenuItem(Base):
     guidance_prompt: Mapped[str] = mapped_column(nullable=True, default=None)
     models: Mapped[str] = mapped_column(nullable=True, default=None)
     capture_mode: Mapped[str] = mapped_column(nullable=True, default=None)
+    use_cache: Mapped[bool] = mapped_column(nullable=True, default=True)
+    strategy: Mapped[str] = mapped_column(nullable=True, default=None)
+    validators: Mapped[str] = mapped_column(Text, nullable=True, default=None)
     parent_id: Mapped[int] = mapped_column(ForeignKey("items.id"), nullable=True, default=None)
 
     if TYPE_CHECKING:
@@ -79,6 +82,9 @@ class Prompt(Base):
         server_default=func.now(),  # DB-side default
         nullable=False
     )
+    action: Mapped[str] = mapped_column(nullable=True, default=None)
+    # hex digest of the perceptual hash of image inputs, too wide for a SQLite integer
+    perceptual_hash: Mapped[str] = mapped_column(nullable=True, default=None)
     if TYPE_CHECKING:
         responses: List[Response]
     else:
@@ -107,6 +113,34 @@ class Response(Base):
 
 
 
+class InferenceCall(Base):
+    """
+    Outcome of a model call, used to compare the latency and reliability of the models.
+    """
+    __tablename__ = "inference_call"
+
+    id: Mapped[int] = mapped_column(init=False, primary_key=True, autoincrement=True)
+    model: Mapped[str] = mapped_column(nullable=False, index=True)
+    provider: Mapped[str] = mapped_column(nullable=True, default=None)
+    action: Mapped[str] = mapped_column(nullable=True, default=None)
+    input_type: Mapped[str] = mapped_column(nullable=True, default=None)
+    input_size: Mapped[int] = mapped_column(nullable=False, default=0)
+    # seconds, null when the call failed before its first token
+    time_to_first_token: Mapped[float] = mapped_column(Float, nullable=True, default=None)
+    latency: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    output_length: Mapped[int] = mapped_column(nullable=False, default=0)
+    error_class: Mapped[str] = mapped_column(nullable=True, default=None)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default_factory=lambda: datetime.now(tz=timezone.utc),
+        server_default=func.now(),
+        nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({self.id}, {self.model}, {self.latency:.2f}s)>"
+
+
 # -----------------------
 # Event Listeners
 # -----------------------
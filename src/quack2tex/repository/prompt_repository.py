@@ -1,5 +1,4 @@
-from io import BytesIO
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 from pathlib import Path
 
 from sqlalchemy import desc
@@ -10,6 +9,8 @@ from sqlalchemy.orm import selectinload
 from PIL.Image import Image as PILImage
 from PIL import Image
 
+from quack2tex.utils import ImageUtils, PromptPayload, Tracer
+
 
 class PromptRepository:
     """
@@ -17,6 +18,7 @@ class PromptRepository:
     """
 
     @classmethod
+    @Tracer.traced(category="db")
     def get_prompt_by_id(cls, session: Session, prompt_id: int) -> Optional[Prompt]:
         """
         Retrieves a prompt by its ID.
@@ -24,6 +26,7 @@ class PromptRepository:
         return session.query(Prompt).filter(Prompt.id == prompt_id).first()
 
     @classmethod
+    @Tracer.traced(category="db")
     def get_all_prompts(cls, session: Session) -> List[Prompt]:
         """
         Retrieves all prompts in the database.
@@ -37,13 +40,27 @@ class PromptRepository:
 
 
     @classmethod
+    @Tracer.traced(category="db")
+    def get_image_prompt_hashes(cls, session: Session) -> List[Tuple[int, Optional[str], str]]:
+        """
+        Retrieves the (id, action, perceptual hash) of every prompt having an image input.
+        """
+        return (
+            session.query(Prompt.id, Prompt.action, Prompt.perceptual_hash)
+            .filter(Prompt.perceptual_hash.isnot(None))
+            .all()
+        )
+
+    @classmethod
+    @Tracer.traced(category="db")
     def add_prompt(
         cls,
         session: Session,
         system_instruction: str,
         guidance_prompt: str,
         input_data: Union[str, Path],
-        capture_mode: str
+        capture_mode: str,
+        action: str = None
     ) -> int:
         """
         Adds a new prompt with either text or binary input (image, file, etc.)
@@ -54,15 +71,19 @@ class PromptRepository:
             guidance_prompt (str): Guidance text.
             input_data (str or Path): Text string or path to a binary file.
             capture_mode (str): Metadata on how the prompt was captured.
+            action (str): Name of the menu action the prompt was made with.
 
         Returns:
             Prompt: The persisted prompt.
         """
-        if isinstance(input_data, PILImage):
-            image_format = input_data.format if input_data.format else "PNG"
-            buffer = BytesIO()
-            input_data.save(buffer, format=image_format)
-            binary_data = buffer.getvalue()
+        perceptual_hash = None
+        if isinstance(input_data, PromptPayload):
+            binary_data = input_data.data
+            perceptual_hash = input_data.perceptual_hash
+        elif isinstance(input_data, PILImage):
+            # lossless for screenshots, high quality lossy for photos
+            binary_data = ImageUtils.encode_to_budget(input_data, max_bytes=0).data
+            perceptual_hash = ImageUtils.perceptual_hash(input_data)
         elif isinstance(input_data, str):
             binary_data = input_data.encode("utf-8")
         elif isinstance(input_data, Path) or Path(input_data).is_file():
@@ -76,13 +97,23 @@ class PromptRepository:
             guidance_prompt=guidance_prompt,
             prompt_input=binary_data,
             capture_mode=capture_mode,
+            action=action,
+            perceptual_hash=cls.format_perceptual_hash(perceptual_hash),
         )
         session.add(prompt)
         session.flush()  # Pushes to DB and populates new_prompt.id
 
         return prompt.id
 
+    @staticmethod
+    def format_perceptual_hash(perceptual_hash: Optional[int]) -> Optional[str]:
+        """
+        Format a perceptual hash as the fixed width hex digest stored in the database.
+        """
+        return None if perceptual_hash is None else f"{perceptual_hash:064x}"
+
     @classmethod
+    @Tracer.traced(category="db")
     def delete_prompt(cls, session: Session, prompt_id: int) -> None:
         """
         Deletes a prompt and its associated responses from the database.
@@ -93,6 +124,7 @@ class PromptRepository:
             session.commit()
 
     @classmethod
+    @Tracer.traced(category="db")
     def add_response(cls, session: Session, prompt_id: int, model_name: str, model_output: str) -> Response:
         """
         Adds a response to a given prompt.
@@ -105,6 +137,7 @@ class PromptRepository:
         session.add(response)
 
     @classmethod
+    @Tracer.traced(category="db")
     def get_responses_for_prompt(cls, session: Session, prompt_id: int) -> List[Response]:
         """
         Retrieves all responses for a given prompt.
@@ -0,0 +1 @@
+from .inference_server import InferenceServer, InferenceRequestHandler
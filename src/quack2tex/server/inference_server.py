@@ -0,0 +1,342 @@
+import base64
+import binascii
+import json
+import logging
+import queue
+import threading
+import typing
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from PIL import UnidentifiedImageError
+
+from quack2tex.enums import InferenceStrategy
+from quack2tex.inference import (
+    NearDuplicateIndex, OutputValidator, PromptProcessor, RequestCoalescer, ResponseCache
+)
+from quack2tex.repository import MenuItemRepository, PromptRepository
+from quack2tex.repository.db.sync_session import get_db_session
+from quack2tex.utils import PromptPayload
+
+logger = logging.getLogger(__name__)
+
+
+class RequestError(Exception):
+    """
+    Invalid request, answered with its HTTP status.
+    """
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class InferenceServer(ThreadingHTTPServer):
+    """
+    Local HTTP API running prompt requests on the same pipeline as the application.
+
+    One long-lived process keeps the pooled clients, the scheduler queues and the response cache
+    warm for every editor plugin or script of the workstation.
+
+    Endpoints:
+        GET  /health   scheduler and client pool state
+        GET  /actions  names of the saved menu actions
+        POST /prompt   run an action on a text or an image
+    """
+
+    daemon_threads = True
+    MAX_BODY_SIZE = 32 * 1024 * 1024
+    PROMPT_FIELDS = ("models", "system_instruction", "guidance_prompt", "strategy", "validators", "use_cache")
+
+    def __init__(
+        self,
+        server_address: typing.Tuple[str, int],
+        prompt_processor: PromptProcessor = None,
+        request_coalescer: RequestCoalescer = None,
+    ):
+        """
+        Initialize the server, the process-wide pipeline is used by default.
+
+        :param server_address: (host, port), port 0 picks a free port
+        :param prompt_processor: The pipeline running the requests, e.g. a stub in tests
+        :param request_coalescer:
+        """
+        super().__init__(server_address, InferenceRequestHandler)
+        self.prompt_processor = prompt_processor or PromptProcessor(show_progress=False)
+        self.request_coalescer = request_coalescer or RequestCoalescer()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_prompt_data(self, params: dict) -> dict:
+        """
+        Build the action settings from a saved action name and the explicit fields of the request.
+        :param params:
+        :return:
+        """
+        action = params.get("action")
+        prompt_data = {"action": action, "capture_mode": "api", "strategy": InferenceStrategy.ALL.value}
+        if action:
+            with get_db_session() as session:
+                menu_item = MenuItemRepository.fetch_item_by_name(session, action)
+                if menu_item is None:
+                    raise RequestError(HTTPStatus.NOT_FOUND, f"No saved action named {action!r}")
+                prompt_data = PromptProcessor.get_prompt_data(menu_item)
+        prompt_data.update({key: params[key] for key in self.PROMPT_FIELDS if params.get(key) is not None})
+        prompt_data["use_cache"] = self.parse_bool(prompt_data.get("use_cache", True))
+        if not prompt_data.get("models"):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "No models given, send an action or models")
+        try:
+            OutputValidator.from_spec(prompt_data.get("validators"))
+        except ValueError as e:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(e))
+        return prompt_data
+
+    def run_prompt_request(
+        self,
+        prompt_data: dict,
+        prompt_input: typing.Union[str, PromptPayload],
+        on_chunk: typing.Callable[[str, str], None] = None,
+    ) -> dict:
+        """
+        Run the request, identical requests sent meanwhile by other clients share the result
+        unless they are streamed.
+        :param prompt_data:
+        :param prompt_input:
+        :param on_chunk: optional callback receiving (model, chunk) as each model streams its output
+        :return:
+        """
+        input_hash = ResponseCache.hash_input(prompt_input)
+        if on_chunk is not None:
+            return self.prompt_processor.process_prompt_request(
+                prompt_data, prompt_input, on_chunk=on_chunk, input_hash=input_hash
+            )
+        prompt_result, _ = self.request_coalescer.run(
+            RequestCoalescer.make_key(prompt_data, input_hash),
+            self.prompt_processor.process_prompt_request,
+            prompt_data,
+            prompt_input,
+            input_hash=input_hash
+        )
+        return prompt_result
+
+    @staticmethod
+    def save_prompt(prompt_data: dict, prompt_input: typing.Union[str, PromptPayload], prompt_result: dict) -> int:
+        """
+        Store the prompt and its responses in the prompt history.
+        :param prompt_data:
+        :param prompt_input:
+        :param prompt_result:
+        :return: The prompt id
+        """
+        with get_db_session() as session:
+            prompt_id = PromptRepository.add_prompt(
+                session=session,
+                system_instruction=prompt_data.get("system_instruction", ""),
+                guidance_prompt=prompt_data.get("guidance_prompt", ""),
+                input_data=prompt_input,
+                capture_mode=prompt_data.get("capture_mode", ""),
+                action=prompt_data.get("action")
+            )
+            for model_name, model_output in prompt_result.items():
+                PromptRepository.add_response(
+                    session=session,
+                    prompt_id=prompt_id,
+                    model_name=model_name,
+                    model_output=model_output
+                )
+            session.commit()
+        NearDuplicateIndex().add(prompt_data.get("action"), getattr(prompt_input, "perceptual_hash", None), prompt_id)
+        return prompt_id
+
+    def health(self) -> dict:
+        """
+        Get the state of the shared pipeline.
+        :return:
+        """
+        return {
+            "status": "ok",
+            "scheduler": self.prompt_processor.scheduler.metrics(),
+            "client_pool": self.prompt_processor.client_pool.stats(),
+        }
+
+    @staticmethod
+    def list_actions() -> typing.List[dict]:
+        """
+        Get the saved actions that can be run.
+        :return:
+        """
+        with get_db_session() as session:
+            menu_items = MenuItemRepository.fetch_tree_data(session)
+            actions, stack = [], list(menu_items)
+            while stack:
+                menu_item = stack.pop()
+                stack.extend(menu_item.children)
+                if menu_item.models:
+                    actions.append({"name": menu_item.name, "models": menu_item.models.split(",")})
+        return sorted(actions, key=lambda action: action["name"])
+
+    @staticmethod
+    def parse_bool(value: typing.Any) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler of the inference server.
+
+    POST /prompt accepts either a JSON object with an `action` name, the explicit
+    `models`/`system_instruction`/`guidance_prompt`/`strategy`/`validators`/`use_cache` fields, and a `text` or
+    a base64 `image`, or a raw `text/plain` or `image/*` body with the same fields in the query
+    string. With `stream` set, the response is a chunked stream of JSON lines, one per model
+    chunk followed by the final result, otherwise a single JSON object once done. With `save`
+    set, the prompt and its responses are stored in the prompt history.
+    """
+
+    server: InferenceServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        try:
+            if path == "/health":
+                self.send_json(HTTPStatus.OK, self.server.health())
+            elif path == "/actions":
+                self.send_json(HTTPStatus.OK, {"actions": self.server.list_actions()})
+            else:
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {path}")
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Request %s failed", self.path)
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path.rstrip("/") != "/prompt":
+                raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {url.path}")
+            params, prompt_input = self.read_prompt_request(dict(parse_qsl(url.query)))
+            prompt_data = self.server.get_prompt_data(params)
+            if InferenceServer.parse_bool(params.get("stream", False)):
+                self.stream_prompt_request(prompt_data, prompt_input, params)
+                return
+            prompt_result = self.server.run_prompt_request(prompt_data, prompt_input)
+            response = {"action": prompt_data.get("action"), "results": prompt_result}
+            if InferenceServer.parse_bool(params.get("save", False)):
+                response["prompt_id"] = self.server.save_prompt(prompt_data, prompt_input, prompt_result)
+            self.send_json(HTTPStatus.OK, response)
+        except RequestError as e:
+            # the body may be left unread
+            self.close_connection = True
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Request %s failed", self.path)
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+    def read_prompt_request(self, params: dict) -> typing.Tuple[dict, typing.Union[str, PromptPayload]]:
+        """
+        Read the request fields and the prompt input from the body.
+        :param params: The query string fields
+        :return:
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.server.MAX_BODY_SIZE:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        body = self.rfile.read(length)
+        content_type = self.headers.get_content_type()
+
+        if content_type.startswith("image/"):
+            return params, self.decode_image(body)
+        if content_type == "text/plain":
+            return params, body.decode(self.headers.get_content_charset() or "utf-8")
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The body must be JSON, text/plain or an image")
+        if not isinstance(payload, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The JSON body must be an object")
+        params = {**params, **payload}
+        if params.get("image"):
+            try:
+                image_data = base64.b64decode(params.pop("image").split(",")[-1], validate=True)
+            except (binascii.Error, ValueError):
+                raise RequestError(HTTPStatus.BAD_REQUEST, "The image must be base64 encoded")
+            return params, self.decode_image(image_data)
+        if params.get("text"):
+            return params, params.pop("text")
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Send a text or an image")
+
+    @staticmethod
+    def decode_image(data: bytes) -> PromptPayload:
+        try:
+            # the uploaded bytes are sent to the models as they are when the format allows it
+            return PromptPayload.from_bytes(data)
+        except (UnidentifiedImageError, OSError, ValueError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The image can not be decoded")
+
+    def stream_prompt_request(self, prompt_data: dict, prompt_input: typing.Union[str, PromptPayload], params: dict):
+        """
+        Run the request, sending every chunk as a JSON line as soon as a model produces it.
+        The chunks are produced by the scheduler threads and written by the handler thread.
+        :param prompt_data:
+        :param prompt_input:
+        :param params:
+        :return:
+        """
+        events = queue.Queue()
+        done = object()
+
+        def work():
+            try:
+                prompt_result = self.server.run_prompt_request(
+                    prompt_data,
+                    prompt_input,
+                    on_chunk=lambda model_name, chunk: events.put({"model": model_name, "chunk": chunk})
+                )
+                event = {"action": prompt_data.get("action"), "results": prompt_result, "done": True}
+                if InferenceServer.parse_bool(params.get("save", False)):
+                    event["prompt_id"] = self.server.save_prompt(prompt_data, prompt_input, prompt_result)
+                events.put(event)
+            except Exception as e:
+                logger.exception("Request %s failed", self.path)
+                events.put({"error": str(e), "done": True})
+            finally:
+                events.put(done)
+
+        threading.Thread(target=work, name="quack2tex-serve-stream", daemon=True).start()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        connected = True
+        while (event := events.get()) is not done:
+            if not connected:
+                # the client left, the request still completes to fill the cache
+                continue
+            line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            try:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                connected = False
+        if connected:
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    def send_json(self, status: HTTPStatus, payload: typing.Any):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
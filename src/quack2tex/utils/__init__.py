@@ -1,7 +1,27 @@
-from .worker import Worker
-from .gui_utils import GuiUtils
-from .image_utils import ImageUtils
+import importlib
+
+from .image_utils import ImageUtils, EncodedImage
+from .prompt_payload import PromptPayload
 from .lib_utils import LibUtils
+from .tracer import Tracer
 from .singleton import Singleton
 from .work_exception import work_exception
-from .treeview_standard_model import TreeViewStandardItemModel
+from .bk_tree import BKTree
+
+# imported on first use, so the headless commands and the inference packages load without Qt and mss
+_LAZY_EXPORTS = {
+    "Worker": ".worker",
+    "ScreenGrabber": ".screen_grabber",
+    "ScreenFrame": ".screen_grabber",
+    "FrameDiffer": ".frame_differ",
+    "GuiUtils": ".gui_utils",
+    "TreeViewStandardItemModel": ".treeview_standard_model",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,67 @@
+import typing
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree indexing keys by a metric distance, e.g. the Hamming distance of perceptual hashes.
+
+    Every child hangs from its parent under its distance to the parent, so by the triangle
+    inequality a search within `max_distance` of a key only visits the children whose edge lies
+    within `max_distance` of the distance between the key and their parent.
+    """
+
+    def __init__(self, distance_fn: typing.Callable[[typing.Any, typing.Any], int]):
+        """
+        Initialize an empty tree.
+        :param distance_fn: Metric between two keys
+        """
+        self.distance_fn = distance_fn
+        # a node is a [key, values, children by distance] list
+        self._root: typing.Optional[list] = None
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, key: typing.Any, value: typing.Any) -> None:
+        """
+        Index a value under a key, values sharing the same key are kept together.
+        :param key:
+        :param value:
+        :return:
+        """
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = self.distance_fn(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: typing.Any, max_distance: int) -> typing.List[typing.Tuple[int, typing.Any]]:
+        """
+        Find the values indexed within a distance of a key.
+        :param key:
+        :param max_distance:
+        :return: (distance, value) tuples sorted by distance
+        """
+        matches = []
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            node_key, values, children = nodes.pop()
+            distance = self.distance_fn(key, node_key)
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in values)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    nodes.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
@@ -0,0 +1,88 @@
+import os
+import typing
+
+import numpy as np
+
+from .screen_grabber import ScreenFrame
+
+
+class FrameDiffer:
+    """
+    Tells when a watched screen region shows new content, from cheap signatures of its frames.
+
+    A signature is the grayscale frame averaged over a grid of at most `grid` x `grid` cells, read
+    from a strided view of the grab buffer, so a few thousand pixels are looked at whatever the size
+    of the region. Two signatures differ by the fraction of cells whose brightness moved by more
+    than `CELL_DELTA`, which ignores compression noise, anti-aliasing and a blinking cursor.
+
+    A frame is new when it differs from the last accepted one by more than the threshold, and has
+    settled, i.e. does not differ from the previous sample, so slide transitions and content still
+    being written are not sent half way.
+    """
+
+    CELL_DELTA = 12.0
+    SAMPLES_PER_CELL = 4
+
+    def __init__(self, threshold: float = None, grid: int = None):
+        """
+        Initialize the differ.
+
+        :param threshold: Fraction of the cells that must change, QUACK2TEX_WATCH_THRESHOLD, 0.02 by default
+        :param grid: Maximum number of cells per side, QUACK2TEX_WATCH_GRID, 64 by default
+        """
+        self.threshold = threshold if threshold is not None else float(os.getenv("QUACK2TEX_WATCH_THRESHOLD", 0.02))
+        self.grid = max(1, grid if grid is not None else int(os.getenv("QUACK2TEX_WATCH_GRID", 64)))
+        self.reference: typing.Optional[np.ndarray] = None
+        self.previous: typing.Optional[np.ndarray] = None
+
+    def signature(self, frame: ScreenFrame) -> np.ndarray:
+        """
+        Get the signature of a frame.
+        :param frame:
+        :return: The mean brightness of every cell, a (rows, columns) array
+        """
+        bgra = frame.bgra
+        height, width = bgra.shape[:2]
+        rows, columns = min(self.grid, height), min(self.grid, width)
+        step_y = max(1, height // (rows * self.SAMPLES_PER_CELL))
+        step_x = max(1, width // (columns * self.SAMPLES_PER_CELL))
+        samples = bgra[::step_y, ::step_x, :3].astype(np.float32)
+        gray = samples[..., 0] * 0.114 + samples[..., 1] * 0.587 + samples[..., 2] * 0.299
+        # the samples left over by the division in cells are dropped
+        cell_height, cell_width = gray.shape[0] // rows, gray.shape[1] // columns
+        gray = gray[:rows * cell_height, :columns * cell_width]
+        return gray.reshape(rows, cell_height, columns, cell_width).mean(axis=(1, 3))
+
+    def difference(self, signature: np.ndarray, other: typing.Optional[np.ndarray]) -> float:
+        """
+        Get the fraction of the cells that changed between two signatures.
+        :param signature:
+        :param other: No signature, or one of a region of another size, is completely different
+        :return: Between 0 and 1
+        """
+        if other is None or other.shape != signature.shape:
+            return 1.0
+        return float(np.mean(np.abs(signature - other) > self.CELL_DELTA))
+
+    def is_new(self, signature: np.ndarray) -> typing.Tuple[bool, float]:
+        """
+        Check a sample shows new content, the sample becomes the previous one.
+        :param signature: The signature of the sample
+        :return: Whether the content is new and settled, and its difference with the last accepted content
+        """
+        score = self.difference(signature, self.reference)
+        settled = self.difference(signature, self.previous) <= self.threshold
+        self.previous = signature
+        return score > self.threshold and settled, score
+
+    def accept(self, signature: np.ndarray) -> None:
+        """
+        Set the content the next samples are compared to, once a sample has been sent.
+        :param signature:
+        :return:
+        """
+        self.reference = signature
+
+    def reset(self) -> None:
+        self.reference = None
+        self.previous = None
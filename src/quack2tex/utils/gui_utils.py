@@ -1,6 +1,6 @@
-import mss
-from PIL import Image
-from quack2tex.pyqt import QLayout, QWidget, QApplication, QRect, QSize, QObject, QMessageBox
+from quack2tex.pyqt import QLayout, QWidget, QApplication, QRect, QSize, QObject, QMessageBox, QScreen
+from .screen_grabber import ScreenGrabber
+from .tracer import Tracer
 
 
 class GuiUtils:
@@ -45,26 +45,60 @@ class GuiUtils:
 
 
     @staticmethod
-    def get_screen_capture_image(screen_region, monitor_index):
+    def get_current_screen(widget: QWidget) -> QScreen:
+        """
+        Get the screen where the widget is located.
+        :param widget: The widget whose screen is needed.
+        :return: The screen containing the widget, the one of the widget if none contains it.
+        """
+        current_monitor_index = GuiUtils.get_current_monitor_index(widget)
+        if current_monitor_index < 0:
+            return widget.screen() or QApplication.primaryScreen()
+        return QApplication.screens()[current_monitor_index]
+
+    @staticmethod
+    def get_screen_monitor(screen: QScreen) -> dict:
+        """
+        Get the mss monitor showing a Qt screen, mss works in physical pixels while Qt geometries are
+        in logical pixels, scaled by the device pixel ratio of the screen, on Windows and Linux mss
+        monitors are physical, on macOS they are logical as Qt.
+        :param screen: The Qt screen
+        :return: left, top, width and height of the monitor, in the coordinates of the grabs
+        """
+        geometry = screen.geometry()
+        ratio = screen.devicePixelRatio()
+        candidates = [
+            (geometry.x(), geometry.y(), geometry.width(), geometry.height()),
+            (
+                round(geometry.x() * ratio), round(geometry.y() * ratio),
+                round(geometry.width() * ratio), round(geometry.height() * ratio)
+            ),
+        ]
+        monitors = ScreenGrabber.get_monitors()[1:]
+        for left, top, width, height in candidates:
+            for monitor in monitors:
+                if (monitor["left"], monitor["top"], monitor["width"], monitor["height"]) == (left, top, width, height):
+                    return dict(monitor)
+        # the positions of scaled monitors may differ between Qt and mss, the size is enough when unique
+        for _, _, width, height in candidates:
+            matches = [monitor for monitor in monitors if (monitor["width"], monitor["height"]) == (width, height)]
+            if len(matches) == 1:
+                return dict(matches[0])
+        left, top, width, height = candidates[1]
+        return {"left": left, "top": top, "width": width, "height": height}
+
+    @staticmethod
+    @Tracer.traced(category="capture")
+    def get_screen_capture_image(screen_region, monitor_index=None):
         """
         Capture the screen region
-        :param screen_region:
-        :param monitor_index:
+        :param screen_region: left, top, width and height of the region, in the coordinates of the grabs, see
+            `get_screen_monitor`
+        :param monitor_index: Unused, the region is absolute on the virtual screen spanning all the monitors
         :return:
         """
-        # TODO: Add support for multiple monitors and DPI scaling factors
-
-        with mss.mss() as sct:
-            monitor = {
-                "top": screen_region[1],
-                "left": screen_region[0],
-                "width": screen_region[2],
-                "height": screen_region[3],
-            }
-            sct_img = sct.grab(monitor)
-            img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-            img.format = "PNG"
-            return img
+        left, top, width, height = screen_region
+        return ScreenGrabber.grab(left, top, width, height).to_image()
 
     @staticmethod
     def move_window_to_center(window: QWidget):
@@ -1,13 +1,50 @@
+from PIL import Image, features
 from PIL.Image import Image as PILImage
 import base64
+import hashlib
+import math
+import typing
 from io import BytesIO
 
+import numpy as np
+
+
+class EncodedImage(typing.NamedTuple):
+    """
+    An image encoded to fit a byte budget, with the image decoded back from the bytes.
+    """
+    data: bytes
+    mime_type: str
+    format: str
+    quality: typing.Optional[int]
+    image: PILImage
+
 
 class ImageUtils:
     """
     Utility functions for images.
     """
 
+    LOSSY_QUALITY_RANGE = (30, 90)
+
+    @staticmethod
+    def image_to_bytes(image: PILImage, image_format: str = None, quality: int = None) -> bytes:
+        """
+        Encode an image.
+        :param image:
+        :param image_format: Defaults to the format of the image, PNG when it has none
+        :param quality: Quality of the lossy formats, defaults to the one the image was encoded with
+        :return:
+        """
+        image_format = (image_format or image.format or "PNG").upper()
+        quality = quality or image.info.get("encoding_quality")
+        save_params = {"quality": quality} if quality and image_format in ("JPEG", "WEBP") else {}
+        if image_format == "JPEG" and image.mode not in ("L", "RGB", "CMYK"):
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        image.save(buffered, format=image_format, **save_params)
+        return buffered.getvalue()
+
     @staticmethod
     def image_to_base64(image: PILImage) -> str:
         """
@@ -15,13 +52,230 @@ class ImageUtils:
         :param image:
         :return:
         """
-        buffered = BytesIO()
-        image.save(
-            buffered, format=image.format or "PNG"
-        )  # Default to 'PNG' if format is None
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        return base64.b64encode(ImageUtils.image_to_bytes(image)).decode("utf-8")
 
     @staticmethod
     def image_to_base64_url(image: PILImage) -> str:
         """Convert an image to a base64 data URL."""
         return f"data:image/{image.format.lower()};base64,{ImageUtils.image_to_base64(image)}"
+
+    @staticmethod
+    def trim_uniform_borders(image: PILImage, tolerance: int = 8, margin: int = 4) -> PILImage:
+        """
+        Crop the borders having the color of the top-left pixel.
+        :param image:
+        :param tolerance: Maximum channel difference still considered as the border color
+        :param margin: Pixels of border kept around the content
+        :return: The cropped image, the image itself when there is nothing to trim
+        """
+        pixels = np.asarray(image.convert("RGB"))
+        border_color = pixels[0, 0]
+        # absolute difference computed in uint8, without widening the whole image
+        content = (np.maximum(pixels, border_color) - np.minimum(pixels, border_color)) > tolerance
+        rows = np.flatnonzero(content.reshape(image.height, -1).any(axis=1))
+        columns = np.flatnonzero(content.any(axis=0).any(axis=-1))
+        if rows.size == 0:
+            return image
+        box = (
+            max(int(columns[0]) - margin, 0),
+            max(int(rows[0]) - margin, 0),
+            min(int(columns[-1]) + margin + 1, image.width),
+            min(int(rows[-1]) + margin + 1, image.height),
+        )
+        if box == (0, 0, image.width, image.height):
+            return image
+        return image.crop(box)
+
+    @staticmethod
+    def downscale_to_pixel_budget(image: PILImage, pixel_budget: int) -> PILImage:
+        """
+        Downscale the image, keeping its aspect ratio, so it holds at most `pixel_budget` pixels.
+        :param image:
+        :param pixel_budget:
+        :return: The resized image, the image itself when it is within the budget
+        """
+        pixels = image.width * image.height
+        if not pixel_budget or pixels <= pixel_budget:
+            return image
+        scale = math.sqrt(pixel_budget / pixels)
+        size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        return image.resize(size, Image.Resampling.LANCZOS)
+
+    @staticmethod
+    def to_grayscale(image: PILImage) -> PILImage:
+        """
+        Convert the image to 8-bit grayscale using the ITU-R 601 luma weights.
+        :param image:
+        :return:
+        """
+        pixels = np.asarray(image.convert("RGB"), dtype=np.float32)
+        luma = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        return Image.fromarray(np.clip(luma + 0.5, 0, 255).astype(np.uint8))
+
+    @staticmethod
+    def binarize(image: PILImage) -> PILImage:
+        """
+        Convert the image to black and white using the Otsu threshold of its grayscale histogram.
+        :param image:
+        :return:
+        """
+        gray = np.asarray(ImageUtils.to_grayscale(image))
+        histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256)
+        background_weight = np.cumsum(histogram)
+        foreground_weight = background_weight[-1] - background_weight
+        background_sum = np.cumsum(histogram * levels)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            background_mean = background_sum / background_weight
+            foreground_mean = (background_sum[-1] - background_sum) / foreground_weight
+            between_variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
+        threshold = int(np.nanargmax(between_variance)) if np.isfinite(between_variance).any() else 127
+        return Image.fromarray(np.where(gray > threshold, 255, 0).astype(np.uint8))
+
+    @staticmethod
+    def hash_image(image: PILImage) -> str:
+        """
+        Hash the decoded pixels of an image, so the same capture hashes the same regardless of how it was encoded.
+        :param image:
+        :return:
+        """
+        digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def perceptual_hash(image: PILImage, hash_size: int = 16) -> int:
+        """
+        Compute the difference hash (dHash) of an image, nearby captures of the same content hash
+        within a few bits of each other even when their margins, scale or encoding differ.
+        The uniform borders are trimmed first so the hash does not depend on the selection margins.
+        :param image:
+        :param hash_size: Side of the hash grid, the hash has hash_size * hash_size bits
+        :return:
+        """
+        gray = ImageUtils.trim_uniform_borders(image).convert("L")
+        pixels = np.asarray(gray.resize((hash_size + 1, hash_size), Image.Resampling.BOX), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    @staticmethod
+    def hamming_distance(first_hash: int, second_hash: int) -> int:
+        """
+        Count the bits that differ between two perceptual hashes.
+        :param first_hash:
+        :param second_hash:
+        :return:
+        """
+        return bin(first_hash ^ second_hash).count("1")
+
+    @staticmethod
+    def content_difference(first: PILImage, second: PILImage, grid: int = 64, max_aspect_change: float = 0.1) -> int:
+        """
+        Compare the content of two images at pixel level, unlike the perceptual hash a single
+        changed symbol stands out. The contents, without their uniform borders, are resized to the
+        same grayscale grid of `grid` cells on their longer side and compared cell by cell.
+        :param first:
+        :param second:
+        :param grid: Number of cells on the longer side of the contents
+        :param max_aspect_change: Relative difference of aspect ratio above which the contents differ
+        :return: The largest brightness difference of a cell, from 0 to 255
+        """
+        first = ImageUtils.trim_uniform_borders(first, tolerance=32, margin=0).convert("L")
+        second = ImageUtils.trim_uniform_borders(second, tolerance=32, margin=0).convert("L")
+        first_ratio, second_ratio = first.width / first.height, second.width / second.height
+        if abs(first_ratio - second_ratio) > max_aspect_change * max(first_ratio, second_ratio):
+            return 255
+        if first_ratio >= 1:
+            size = (grid, max(1, round(grid / first_ratio)))
+        else:
+            size = (max(1, round(grid * first_ratio)), grid)
+        first_cells = np.asarray(first.resize(size, Image.Resampling.BOX), dtype=np.int16)
+        second_cells = np.asarray(second.resize(size, Image.Resampling.BOX), dtype=np.int16)
+        return int(np.abs(first_cells - second_cells).max())
+
+    @staticmethod
+    def is_photo_like(image: PILImage, max_color_ratio: float = 0.25) -> bool:
+        """
+        Check if an image looks like a photo rather than a screenshot of text or drawings,
+        photos have many distinct colors while screenshots use a few flat ones.
+        :param image:
+        :param max_color_ratio: Share of distinct colors over pixels above which the image is a photo
+        :return:
+        """
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((128, 128))
+        pixels = np.asarray(thumbnail, dtype=np.uint32).reshape(-1, 3)
+        colors = np.unique(pixels[:, 0] << 16 | pixels[:, 1] << 8 | pixels[:, 2]).size
+        return colors > max_color_ratio * len(pixels)
+
+    @staticmethod
+    def decode_image(data: bytes, expected_size: typing.Tuple[int, int] = None) -> PILImage:
+        """
+        Decode encoded image bytes, checking that the whole image can be read back.
+        :param data:
+        :param expected_size: optional size the decoded image must have
+        :return:
+        """
+        image = Image.open(BytesIO(data))
+        image.load()
+        if expected_size is not None and image.size != tuple(expected_size):
+            raise ValueError(f"Decoded image size {image.size} does not match {expected_size}")
+        return image
+
+    @classmethod
+    def encode_to_budget(cls, image: PILImage, max_bytes: int, lossless: bool = None) -> EncodedImage:
+        """
+        Encode an image within a byte budget.
+        Screenshots are kept lossless in PNG when they fit, photos and the screenshots too large
+        for PNG use WebP, or JPEG without WebP support, at the highest quality fitting the budget.
+        The image is downscaled when even the lowest quality does not fit.
+        The output is validated by decoding it back.
+        :param image:
+        :param max_bytes: Byte budget, 0 for no budget
+        :param lossless: Try PNG first, defaults to True for images that do not look like photos
+        :return:
+        """
+        if lossless is None:
+            lossless = not cls.is_photo_like(image)
+        if lossless:
+            data = cls.image_to_bytes(image, "PNG")
+            if not max_bytes or len(data) <= max_bytes:
+                return cls._encoded_image(data, "PNG", None, image.size)
+
+        lossy_format = "WEBP" if features.check("webp") else "JPEG"
+        if image.mode not in ("L", "RGB") and not (lossy_format == "WEBP" and image.mode == "RGBA"):
+            image = image.convert("RGBA" if lossy_format == "WEBP" and "A" in image.getbands() else "RGB")
+        low, high = cls.LOSSY_QUALITY_RANGE
+        while True:
+            # binary search of the highest quality within the budget, the top quality often fits
+            best = None
+            data = cls.image_to_bytes(image, lossy_format, high)
+            if not max_bytes or len(data) <= max_bytes:
+                best, low = (data, high), high + 1
+            else:
+                high -= 1
+            while low <= high:
+                quality = (low + high) // 2
+                data = cls.image_to_bytes(image, lossy_format, quality)
+                if not max_bytes or len(data) <= max_bytes:
+                    best = (data, quality)
+                    low = quality + 1
+                else:
+                    high = quality - 1
+            if best is not None:
+                return cls._encoded_image(best[0], lossy_format, best[1], image.size)
+            if image.width <= 16 or image.height <= 16:
+                raise ValueError(f"The image can not be encoded within {max_bytes} bytes")
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.Resampling.LANCZOS)
+            low, high = cls.LOSSY_QUALITY_RANGE
+
+    @classmethod
+    def _encoded_image(
+        cls, data: bytes, image_format: str, quality: typing.Optional[int], size: typing.Tuple[int, int]
+    ) -> EncodedImage:
+        decoded = cls.decode_image(data, expected_size=size)
+        decoded.format = image_format
+        if quality:
+            # re-encoding the decoded image keeps the chosen quality, see image_to_bytes
+            decoded.info["encoding_quality"] = quality
+        return EncodedImage(data, f"image/{image_format.lower()}", image_format, quality, decoded)
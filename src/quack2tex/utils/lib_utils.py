@@ -35,3 +35,39 @@ class LibUtils:
             "QUACK2TEX_SYNC_DB_CONNECTION_STRING", default_db_sync_connection_string
         )
         return db_sync_connections_string, db_async_connections_string
+
+    @classmethod
+    def get_response_cache_file(cls):
+        """
+        Get the location of the model response cache, stored next to the database
+        :return:
+        """
+        default_cache_file = cls.get_lib_home() / "response_cache.db"
+        return Path(os.getenv("QUACK2TEX_RESPONSE_CACHE_FILE", default_cache_file))
+
+    @classmethod
+    def get_cassette_file(cls):
+        """
+        Get the location of the recorded model calls replayed without API keys
+        :return:
+        """
+        default_cassette_file = cls.get_lib_home() / "cassette.jsonl"
+        return Path(os.getenv("QUACK2TEX_CASSETTE_FILE", default_cassette_file))
+
+    @classmethod
+    def get_traces_dir(cls):
+        """
+        Get the folder receiving the latency traces of the sessions
+        :return:
+        """
+        default_traces_dir = cls.get_lib_home() / "traces"
+        return Path(os.getenv("QUACK2TEX_TRACES_DIR", default_traces_dir))
+
+    @classmethod
+    def get_latex_store_file(cls):
+        """
+        Get the location of the LaTeX generated for the latified functions, keyed by their source
+        :return:
+        """
+        default_store_file = cls.get_lib_home() / "latex.db"
+        return Path(os.getenv("QUACK2TEX_LATEX_STORE_FILE", default_store_file))
@@ -0,0 +1,158 @@
+import base64
+import typing
+from functools import cached_property
+from threading import Lock
+
+from PIL.Image import Image as PILImage
+
+from .image_utils import ImageUtils, EncodedImage
+
+
+class PromptPayload:
+    """
+    An image prompt input encoded at most once and shared read-only by every consumer.
+
+    The model calls send `data` or its base64 view as is, the response cache is keyed on
+    `content_hash` and the prompt history stores `data`, so a capture is never encoded again
+    whatever the number of models it is sent to. A payload made from a captured image keeps the
+    image and encodes it only when `data` is first read: hashing and preprocessing work on the
+    pixels, and a capture that preprocessing changes is encoded once, after it, instead of being
+    encoded in full resolution first. The decoded image, the base64 view and the content hash are
+    computed on first use only.
+    """
+
+    SUPPORTED_MIME_TYPES: typing.ClassVar[typing.Tuple[str, ...]] = (
+        "image/png", "image/jpeg", "image/webp", "image/gif"
+    )
+
+    def __init__(
+        self,
+        data: bytes = None,
+        mime_type: str = None,
+        width: int = None,
+        height: int = None,
+        image: PILImage = None,
+    ):
+        """
+        Initialize the payload from encoded bytes, or from an image encoded on first use.
+
+        :param data: The encoded image
+        :param mime_type: The mime type of the encoded image
+        :param width:
+        :param height:
+        :param image: The image, decoded from the data on first use when not given
+        """
+        if data is None and image is None:
+            raise ValueError("A payload needs encoded data or an image")
+        self._data = data
+        self._mime_type = mime_type
+        self.width = width if width is not None else image.width
+        self.height = height if height is not None else image.height
+        self._lock = Lock()
+        if image is not None:
+            # cached properties are stored in the instance dict
+            self.__dict__["image"] = image
+
+    @classmethod
+    def from_encoded(cls, encoded: EncodedImage, content_hash: str = None) -> "PromptPayload":
+        """
+        Wrap an encoded image.
+        :param encoded:
+        :param content_hash: Content hash of the source image, computed from the decoded image otherwise
+        :return:
+        """
+        payload = cls(encoded.data, encoded.mime_type, encoded.image.width, encoded.image.height, encoded.image)
+        if content_hash is not None:
+            payload.__dict__["content_hash"] = content_hash
+        return payload
+
+    @classmethod
+    def from_image(cls, image: PILImage, max_bytes: int = 0) -> "PromptPayload":
+        """
+        Wrap a captured image, encoded on first use, losslessly for screenshots and in high quality for photos.
+        :param image:
+        :param max_bytes: optional byte budget, the image is then encoded right away
+        :return:
+        """
+        if max_bytes:
+            return cls.from_encoded(ImageUtils.encode_to_budget(image, max_bytes), ImageUtils.hash_image(image))
+        return cls(image=image)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PromptPayload":
+        """
+        Wrap an already encoded image, e.g. an uploaded file, re-encoding it only when its format
+        is not accepted by the providers.
+        :param data:
+        :return:
+        """
+        image = ImageUtils.decode_image(data)
+        mime_type = f"image/{(image.format or 'PNG').lower()}"
+        if mime_type not in cls.SUPPORTED_MIME_TYPES:
+            return cls.from_image(image)
+        return cls(data, mime_type, image.width, image.height, image)
+
+    @property
+    def is_encoded(self) -> bool:
+        return self._data is not None
+
+    def _encode(self) -> None:
+        with self._lock:
+            if self._data is None:
+                encoded = ImageUtils.encode_to_budget(self.image, 0)
+                self._mime_type = encoded.mime_type
+                self._data = encoded.data
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._encode()
+        return self._data
+
+    @property
+    def mime_type(self) -> str:
+        if self._data is None:
+            self._encode()
+        return self._mime_type
+
+    @property
+    def format(self) -> str:
+        if not self.is_encoded:
+            return (self.image.format or "PNG").upper()
+        return self.mime_type.split("/")[-1].upper()
+
+    @cached_property
+    def image(self) -> PILImage:
+        """
+        The decoded image, for the consumers working on pixels.
+        """
+        image = ImageUtils.decode_image(self.data)
+        image.format = self.format
+        return image
+
+    @cached_property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+    @property
+    def base64_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @cached_property
+    def content_hash(self) -> str:
+        """
+        Hash of the decoded pixels, the same capture hashes the same regardless of its encoding.
+        """
+        return ImageUtils.hash_image(self.image)
+
+    @cached_property
+    def perceptual_hash(self) -> int:
+        """
+        Perceptual hash of the image, close for captures of the same content, see `ImageUtils.perceptual_hash`.
+        """
+        return ImageUtils.perceptual_hash(self.image)
+
+    def __repr__(self) -> str:
+        if not self.is_encoded:
+            return f"<{self.__class__.__name__}(not encoded, {self.width}x{self.height})>"
+        return f"<{self.__class__.__name__}({self.mime_type}, {self.width}x{self.height}, {len(self.data)} bytes)>"
@@ -0,0 +1,132 @@
+import threading
+import typing
+
+import mss
+import numpy as np
+from PIL import Image
+
+from .tracer import Tracer
+
+
+class ScreenFrame:
+    """
+    A grabbed screen area, kept as the BGRA buffer filled by mss.
+
+    `bgra` is a NumPy view over that buffer and `crop` returns frames sharing it, so inspecting or
+    cropping a frame copies nothing. The only copy, the conversion to an RGB image, happens in
+    `to_image`, once, when a consumer needs an image.
+    """
+
+    __slots__ = ("buffer", "left", "top", "x", "y", "width", "height", "_image")
+
+    def __init__(self, buffer: np.ndarray, left: int = 0, top: int = 0, box: typing.Tuple[int, int, int, int] = None):
+        """
+        Initialize the frame.
+
+        :param buffer: The (height, width, 4) BGRA array of the whole grab
+        :param left: Screen position of the grab, in physical pixels
+        :param top:
+        :param box: (x, y, width, height) of the frame within the buffer, all of it by default
+        """
+        self.buffer = buffer
+        self.left = left
+        self.top = top
+        self.x, self.y, self.width, self.height = box or (0, 0, buffer.shape[1], buffer.shape[0])
+        self._image: typing.Optional[Image.Image] = None
+
+    @property
+    def size(self) -> typing.Tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def bgra(self) -> np.ndarray:
+        """
+        The (height, width, 4) BGRA pixels of the frame, a view over the grab buffer.
+        """
+        return self.buffer[self.y:self.y + self.height, self.x:self.x + self.width]
+
+    def crop(self, x: int, y: int, width: int, height: int) -> "ScreenFrame":
+        """
+        Get a part of the frame sharing its buffer, the box is clamped to the frame.
+        :param x: Left of the part within the frame, in pixels
+        :param y:
+        :param width:
+        :param height:
+        :return:
+        """
+        x0, y0 = min(max(x, 0), self.width), min(max(y, 0), self.height)
+        x1, y1 = min(max(x + width, x0), self.width), min(max(y + height, y0), self.height)
+        return ScreenFrame(
+            self.buffer, self.left, self.top, (self.x + x0, self.y + y0, x1 - x0, y1 - y0)
+        )
+
+    def to_image(self) -> Image.Image:
+        """
+        Convert the frame to an RGB image, decoded straight from the grab buffer with its row stride.
+        :return:
+        """
+        if self._image is None:
+            with Tracer.span("PIL conversion", "capture", width=self.width, height=self.height):
+                stride = self.buffer.strides[0]
+                offset = self.y * stride + self.x * 4
+                data = memoryview(self.buffer.reshape(-1))[offset:]
+                self._image = Image.frombuffer("RGB", self.size, data, "raw", "BGRX", stride, 1)
+                self._image.format = "PNG"
+        return self._image
+
+
+class ScreenGrabber:
+    """
+    Screen grabs through one long-lived mss instance per thread.
+
+    Opening mss connects to the display server and allocates its resources, so the instance is
+    kept for the lifetime of the thread instead of being opened on every capture. mss instances can
+    not be shared between threads, hence one per thread.
+    """
+
+    _local = threading.local()
+
+    @classmethod
+    def get_mss(cls) -> "mss.base.MSSBase":
+        """
+        Get the mss instance of the calling thread, opening it on first use.
+        :return:
+        """
+        sct = getattr(cls._local, "sct", None)
+        if sct is None:
+            sct = cls._local.sct = mss.mss()
+        return sct
+
+    @classmethod
+    def grab(cls, left: int, top: int, width: int, height: int) -> ScreenFrame:
+        """
+        Grab a screen area.
+        :param left: Position and size of the area, in physical pixels
+        :param top:
+        :param width:
+        :param height:
+        :return:
+        """
+        with Tracer.span("mss grab", "capture", width=width, height=height):
+            shot = cls.get_mss().grab({"left": left, "top": top, "width": width, "height": height})
+        buffer = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return ScreenFrame(buffer, shot.left, shot.top)
+
+    @classmethod
+    def get_monitors(cls) -> typing.List[dict]:
+        """
+        Get the monitors, the first one spans all of them, see mss.
+        :return:
+        """
+        return cls.get_mss().monitors
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Close the mss instance of the calling thread.
+        :return:
+        """
+        sct = getattr(cls._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            cls._local.sct = None
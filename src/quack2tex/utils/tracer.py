@@ -0,0 +1,248 @@
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+import typing
+from collections import deque
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+from .lib_utils import LibUtils
+
+
+class Span:
+    """
+    A timed section, recorded as a Chrome trace complete event when it exits.
+    """
+
+    __slots__ = ("name", "category", "args", "started_at")
+
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started_at = 0
+
+    def set(self, **args) -> None:
+        """
+        Attach values known once the section started, e.g. the size of a result.
+        :param args:
+        :return:
+        """
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        self.started_at = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        Tracer.add_event({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": Tracer.to_timestamp(self.started_at),
+            "dur": (time.perf_counter_ns() - self.started_at) / 1000,
+            "args": self.args,
+        })
+
+
+class NoopSpan:
+    """
+    The span returned while tracing is disabled, shared so a disabled span allocates nothing.
+    """
+
+    __slots__ = ()
+
+    def set(self, **args) -> None:
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+class Tracer:
+    """
+    Process-wide span recorder writing a Chrome trace, readable in chrome://tracing or ui.perfetto.dev.
+
+    Tracing is enabled with QUACK2TEX_TRACE=1, the events of the session are then written to
+    `LibUtils.get_traces_dir()` when the process exits. While disabled, `span` returns a shared
+    no-op context manager and the other calls return right away, so the instrumentation can stay
+    in the hot paths.
+
+    Only the last QUACK2TEX_TRACE_MAX_EVENTS events (100000 by default) are kept, so a long session
+    does not grow the memory without bound.
+    """
+
+    enabled: bool = os.getenv("QUACK2TEX_TRACE", "0").lower() in ("1", "true", "yes", "on")
+    _NOOP_SPAN = NoopSpan()
+    _events: typing.Deque[dict] = deque(maxlen=int(os.getenv("QUACK2TEX_TRACE_MAX_EVENTS", 100_000)))
+    _thread_names: typing.Dict[int, str] = {}
+    _async_ids = itertools.count(1)
+    _origin = time.perf_counter_ns()
+    _lock = threading.Lock()
+    _exit_hook_registered = False
+
+    @classmethod
+    def enable(cls) -> None:
+        """
+        Start recording, the trace is written when the process exits.
+        :return:
+        """
+        with cls._lock:
+            cls.enabled = True
+            if not cls._exit_hook_registered:
+                atexit.register(cls.save)
+                cls._exit_hook_registered = True
+
+    @classmethod
+    def disable(cls) -> None:
+        cls.enabled = False
+
+    @classmethod
+    def span(cls, name: str, category: str = "app", **args) -> typing.Union[Span, NoopSpan]:
+        """
+        Time a section of code, to be used as a context manager.
+        :param name:
+        :param category: Group of the span, e.g. gui, capture, inference or db
+        :param args: Values shown with the span
+        :return:
+        """
+        if not cls.enabled:
+            return cls._NOOP_SPAN
+        return Span(name, category, args)
+
+    @classmethod
+    def traced(cls, name: str = None, category: str = "app") -> typing.Callable:
+        """
+        Decorator timing every call of a function.
+        :param name: Name of the span, the qualified name of the function by default
+        :param category:
+        :return:
+        """
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not cls.enabled:
+                    return function(*args, **kwargs)
+                with Span(span_name, category, {}):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @classmethod
+    def instant(cls, name: str, category: str = "app", **args) -> None:
+        """
+        Mark a point in time, e.g. the first token of a response.
+        :param name:
+        :param category:
+        :param args:
+        :return:
+        """
+        if cls.enabled:
+            cls.add_event({
+                "name": name, "cat": category, "ph": "i", "s": "t",
+                "ts": cls.to_timestamp(time.perf_counter_ns()), "args": args,
+            })
+
+    @classmethod
+    def begin_async(cls, name: str, category: str = "app", **args) -> int:
+        """
+        Start a span ending in another call or thread, e.g. a render finished by a callback.
+        :param name:
+        :param category:
+        :param args:
+        :return: The id to pass to `end_async`, 0 while tracing is disabled
+        """
+        if not cls.enabled:
+            return 0
+        span_id = next(cls._async_ids)
+        cls.add_event({
+            "name": name, "cat": category, "ph": "b", "id": span_id,
+            "ts": cls.to_timestamp(time.perf_counter_ns()), "args": args,
+        })
+        return span_id
+
+    @classmethod
+    def end_async(cls, span_id: int, name: str, category: str = "app", **args) -> None:
+        """
+        End a span started with `begin_async`.
+        :param span_id:
+        :param name: The name and category given to `begin_async`
+        :param category:
+        :param args:
+        :return:
+        """
+        if cls.enabled and span_id:
+            cls.add_event({
+                "name": name, "cat": category, "ph": "e", "id": span_id,
+                "ts": cls.to_timestamp(time.perf_counter_ns()), "args": args,
+            })
+
+    @classmethod
+    def to_timestamp(cls, perf_counter_ns: int) -> float:
+        """
+        Convert a performance counter reading to microseconds since the start of the session.
+        :param perf_counter_ns:
+        :return:
+        """
+        return (perf_counter_ns - cls._origin) / 1000
+
+    @classmethod
+    def add_event(cls, event: dict) -> None:
+        """
+        Record an event on the calling thread.
+        :param event:
+        :return:
+        """
+        thread_id = threading.get_native_id()
+        if thread_id not in cls._thread_names:
+            cls._thread_names[thread_id] = threading.current_thread().name
+        event["pid"] = os.getpid()
+        event["tid"] = thread_id
+        # appending to a deque is atomic, the hot path takes no lock, the oldest event is dropped when full
+        cls._events.append(event)
+
+    @classmethod
+    def save(cls, trace_file: typing.Union[str, Path] = None) -> typing.Optional[Path]:
+        """
+        Write the events recorded so far as a Chrome trace.
+        :param trace_file: Destination, a new file of the traces directory by default
+        :return: The written file, None when no event was recorded
+        """
+        with cls._lock:
+            events = list(cls._events)
+            thread_names = dict(cls._thread_names)
+        if not events:
+            return None
+        if trace_file is None:
+            timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            trace_file = LibUtils.get_traces_dir() / f"trace-{timestamp}-{os.getpid()}.json"
+        trace_file = Path(trace_file)
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "quack2tex"}},
+            *(
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}}
+                for thread_id, thread_name in thread_names.items()
+            ),
+        ]
+        with open(trace_file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, default=str)
+        return trace_file
+
+
+if Tracer.enabled:
+    Tracer.enable()
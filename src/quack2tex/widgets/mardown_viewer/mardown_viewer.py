@@ -1,9 +1,12 @@
 import sys
+from collections import deque
 
 from quack2tex.pyqt import (
-    QUrl, QWebChannel, QApplication, QWebEngineView, QObject, Signal, Slot, Property, QWebEnginePage, QWebEngineSettings
+    QUrl, QWebChannel, QApplication, QWebEngineView, QObject, Signal, Slot, Property, QWebEnginePage, QWebEngineSettings,
+    QTimer
 )
 from quack2tex.resources import *  # noqa: F401
+from quack2tex.utils import Tracer
 
 class MarkdownViewerDoc(QObject):
     """
@@ -15,6 +18,8 @@ class MarkdownViewerDoc(QObject):
     def __init__(self, parent=None):
         super().__init__(parent)
         self._content = ""
+        # the page renders the updates in order, each render ends the oldest pending span
+        self._render_spans = deque()
 
     @Slot(str)
     def log(self, msg):
@@ -24,6 +29,14 @@ class MarkdownViewerDoc(QObject):
         #print(msg)
         ...
 
+    @Slot()
+    def rendered(self):
+        """
+        Called by the page once it rendered an update of the content
+        """
+        if self._render_spans:
+            Tracer.end_async(self._render_spans.popleft(), "markdown render", "gui")
+
     @Slot(str)
     def send_to_clipboard(self, text):
         """
@@ -48,6 +61,8 @@ class MarkdownViewerDoc(QObject):
         if self._content == content:
             return
         self._content = content
+        if Tracer.enabled:
+            self._render_spans.append(Tracer.begin_async("markdown render", "gui", length=len(content)))
         self.contentChanged.emit(content)
 
     content = Property(str, fget=get_content, fset=set_content, notify=contentChanged)
@@ -96,8 +111,17 @@ class MarkdownViewer(QWebEngineView):
         # Load the index.html file
         #QUrl.fromLocalFile(str(Path(__file__).parent / "files/index.html"))
         local_url = QUrl("qrc:/files/index.html")
+        load_span = Tracer.begin_async("WebEngine load", "gui")
+        self.loadFinished.connect(lambda _: Tracer.end_async(load_span, "WebEngine load", "gui"))
         self.load(local_url)
 
+        # Batch the re-renders of streamed chunks arriving in quick succession
+        self._pending_chunks = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(50)
+        self._flush_timer.timeout.connect(self.flush_pending_chunks)
+
     @property
     def content(self):
         """
@@ -113,8 +137,31 @@ class MarkdownViewer(QWebEngineView):
         :return:
         """
         # Convert markdown to HTML
+        self._pending_chunks.clear()
+        self._flush_timer.stop()
         self.doc.set_content(content)
 
+    def append_content(self, chunk: str):
+        """
+        Append a chunk to the content of the markdown viewer
+        :param chunk:
+        :return:
+        """
+        self._pending_chunks.append(chunk)
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def flush_pending_chunks(self):
+        """
+        Render the chunks appended since the last update
+        :return:
+        """
+        if not self._pending_chunks:
+            return
+        chunks = "".join(self._pending_chunks)
+        self._pending_chunks.clear()
+        self.doc.set_content(self.doc.get_content() + chunks)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
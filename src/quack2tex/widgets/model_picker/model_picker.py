@@ -23,6 +23,8 @@ class ModelPicker(QWidget):
         self.list_widget.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
         self.list_widget.itemSelectionChanged.connect(self.on_selection_changed)
 
+        # the models in the order they were picked, the cascade strategy tries them in this order
+        self.selection_order = []
         self.selected_models_label = QLabel()
         self.layout.addWidget(self.list_widget)
         self.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
@@ -39,6 +41,14 @@ class ModelPicker(QWidget):
             "anthropic": QIcon(":/icons/anthropic.png"),
             "groq": QIcon(":/icons/groq.png"),
         }
+        # picks the fastest healthy model at each request, among the other selected models if any
+        auto_item = QListWidgetItem("Auto (fastest healthy model)")
+        auto_item.setData(Qt.ItemDataRole.UserRole, "auto")
+        auto_item.setToolTip(
+            "Pick the fastest model with a low error rate on the recent requests of the action, "
+            "among the other selected models, or among all the models used before when none is selected"
+        )
+        self.list_widget.addItem(auto_item)
         for model in models:
             model_item = QListWidgetItem(model.display_name)
             model_item.setData(Qt.ItemDataRole.UserRole, model.name)
@@ -52,7 +62,7 @@ class ModelPicker(QWidget):
         """
         if not self.list_widget.selectedItems():
             return ""
-        return ",".join([item.data(Qt.ItemDataRole.UserRole) for item in self.list_widget.selectedItems()])
+        return ",".join(self.selection_order)
 
     def set_selected_models(self, models: str):
         """
@@ -60,9 +70,14 @@ class ModelPicker(QWidget):
         :param models: The models to select.
         """
         models_list = models.split(",") if models else []
-        for item in self.list_widget.findItems("", Qt.MatchFlag.MatchContains):
-            if item.data(Qt.ItemDataRole.UserRole) in models_list:
-                item.setSelected(True)
+        items = {
+            item.data(Qt.ItemDataRole.UserRole): item
+            for item in self.list_widget.findItems("", Qt.MatchFlag.MatchContains)
+        }
+        # selected one by one so the saved order is kept
+        for model in models_list:
+            if model in items:
+                items[model].setSelected(True)
 
     models = Property(str, get_selected_models, set_selected_models)
 
@@ -83,6 +98,9 @@ class ModelPicker(QWidget):
         selected_models = [
             item.data(Qt.ItemDataRole.UserRole) for item in self.list_widget.selectedItems()
         ]
-        self.selected_models_label.setText(', '.join(selected_models))
+        self.selection_order = [model for model in self.selection_order if model in selected_models] + [
+            model for model in selected_models if model not in self.selection_order
+        ]
+        self.selected_models_label.setText(', '.join(self.selection_order))
         self.selected_models_label.adjustSize()
         self.layout.addWidget(self.selected_models_label)
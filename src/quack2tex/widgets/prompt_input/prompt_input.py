@@ -15,6 +15,7 @@ from quack2tex.pyqt import (
     QPushButton,
     Property
 )
+from quack2tex.inference import LLMClientPool
 from quack2tex.resources import *  # noqa
 from quack2tex.utils import Worker
 from string import Template
@@ -24,7 +25,7 @@ Please enhance the following prompt to make it more effective and precise
 for AI interpretation. Ensure clarity, specificity, and include any necessary 
 context or constraints to guide the AI towards the desired output.
 Original Prompt:
-{prompt}
+${prompt}
 Instructions:
 - Clarify ambiguous terms or phrases.
 - Specify the desired format or structure of the response.
@@ -119,9 +120,9 @@ class PromptInput(QWidget):
         :param prompt:
         :return:
         """
-        system_instruction = self.prompt_template.safe_substitute(prompt=prompt)
-        llm = LLM.create(model_name, system_instruction=system_instruction)
-        return llm(prompt)
+        # the prompt goes in the message, the pooled client of the model without system instruction is reused
+        llm = LLMClientPool().get(model_name, None)
+        return llm(self.prompt_template.safe_substitute(prompt=prompt))
 
     def done_enhance_prompt(self, enhanced_prompt: str):
         """
@@ -1,3 +1,4 @@
 from .screen_capture import ScreenCaptureWindow
+from .region_watch_window import RegionWatchWindow
 from .main_window import MainWindow
 
@@ -1,25 +1,26 @@
+import logging
 import typing
-from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
 
 from PIL.Image import Image as PILImage
-from tqdm import tqdm
 
-from modihub.llm import LLM
 from quack2tex.pyqt import (
     Qt,
     QThreadPool,
     QMainWindow,
     QMessageBox,
 )
-from quack2tex.utils import GuiUtils, Worker, work_exception, LibUtils
+from quack2tex.inference import ResponseCache, RequestCoalescer, PromptProcessor, NearDuplicateIndex
+from quack2tex.utils import GuiUtils, Worker, work_exception, LibUtils, Tracer, ScreenGrabber
 from quack2tex.widgets import DuckMenu
 from .ouput_dialog import OutputDialog
 from .screen_capture import ScreenCaptureWindow
+from .region_watch_window import RegionWatchWindow
 from quack2tex.windows.setting_window.settings_window import SettingsWindow
 from quack2tex.widgets import PromptDialog
 from ..widgets.audio_recorder import AudioRecorderDialog
 
+logger = logging.getLogger(__name__)
+
 
 class MainWindow(QMainWindow):
     """
@@ -40,6 +41,11 @@ class MainWindow(QMainWindow):
         self.menu.item_clicked.connect(self.handle_menu_item_click)
         self.setCentralWidget(self.menu)
         self.threadpool = QThreadPool()
+        self.prompt_processor = PromptProcessor()
+        self.scheduler = self.prompt_processor.scheduler
+        self.request_coalescer = RequestCoalescer()
+        self.near_duplicate_index = NearDuplicateIndex()
+        self.region_watch_windows = []
 
         # drag and drop variables
         self.is_moving = False
@@ -68,12 +74,7 @@ class MainWindow(QMainWindow):
             w.exec()
         elif menu_item_data:
             capture_mode = menu_item_data.capture_mode
-            prompt_data = {
-                "system_instruction": menu_item_data.system_instruction,
-                "guidance_prompt": menu_item_data.guidance_prompt,
-                "models": menu_item_data.models,
-                "capture_mode": capture_mode
-            }
+            prompt_data = PromptProcessor.get_prompt_data(menu_item_data)
 
             not_models_selected = menu_item_data.models is None or menu_item_data.models == ""
             no_capture_mode = capture_mode is None or capture_mode == ""
@@ -81,6 +82,10 @@ class MainWindow(QMainWindow):
             if any([not_models_selected, no_capture_mode]):
                 return
 
+            if capture_mode in ("screen", "text", "voice", "watch"):
+                # the clients connect while the user selects a region, types or speaks
+                self.prompt_processor.warm_up(prompt_data)
+
             if capture_mode == "screen":
                 self.start_screen_capture(prompt_data)
             elif capture_mode == "clipboard":
@@ -89,6 +94,8 @@ class MainWindow(QMainWindow):
                 self.start_text_prompt_capture(prompt_data)
             elif capture_mode == "voice":
                 self.start_voice_prompt_capture(prompt_data)
+            elif capture_mode == "watch":
+                self.start_region_watch(prompt_data)
             else:
                 self.make_prompt_request(prompt_data, prompt_input="")
 
@@ -137,18 +144,25 @@ class MainWindow(QMainWindow):
                 self.make_prompt_request(prompt_data, prompt_input=transcribed_text)
 
 
-    def pick_screen_region(self):
+    def pick_screen_region(self) -> ScreenCaptureWindow:
         """
-        Pick the screen region
-        :return:
+        Pick the screen region on a frozen frame of the current monitor, grabbed before the overlay opens
+        :return: The closed overlay, with the selected region and, when the frame could be grabbed, its image
         """
-        screen_capture = ScreenCaptureWindow()
-        monitor_geometry = GuiUtils.get_current_monitor_geometry(self)
-        screen_capture.setGeometry(monitor_geometry)
-        screen_capture.exec()
-        return screen_capture.selected_region
-
-
+        screen = GuiUtils.get_current_screen(self)
+        monitor, frame = None, None
+        try:
+            monitor = GuiUtils.get_screen_monitor(screen)
+            with Tracer.span("freeze frame", "capture"):
+                frame = ScreenGrabber.grab(monitor["left"], monitor["top"], monitor["width"], monitor["height"])
+        except Exception as e:
+            logger.warning("Could not freeze the screen, capturing after the selection: %s", e)
+        with Tracer.span("screen capture overlay", "gui"):
+            screen_capture = ScreenCaptureWindow(frame, monitor)
+            # the whole screen, as the monitor the selection is mapped to
+            screen_capture.setGeometry(screen.geometry())
+            screen_capture.exec()
+        return screen_capture
 
     def start_screen_capture(self, prompt_data):
         """
@@ -156,30 +170,51 @@ class MainWindow(QMainWindow):
         :param prompt_data:
         :return:
         """
-        monitor_index = GuiUtils.get_current_monitor_index(self)
-        screen_region = self.pick_screen_region()
-        if screen_region:
-            @work_exception
-            def do_work():
-                """
-                Perform the screen capture
-                :return:
-                """
-                return GuiUtils.get_screen_capture_image(screen_region, monitor_index)
-            def done(result):
-                """
-                Handle the completion of the screen capture
-                :param result:
-                :return:
-                """
-                screen_capture, error = result
-                if error:
-                    GuiUtils.show_error(str(error))
-                    return
-                self.make_prompt_request(prompt_data, prompt_input=screen_capture)
-            worker = Worker(do_work)
-            worker.signals.result.connect(done)
-            self.threadpool.start(worker)
+        screen_capture = self.pick_screen_region()
+        screen_region = screen_capture.selected_region
+        if not screen_region or not screen_region[2] or not screen_region[3]:
+            return
+        if screen_capture.selected_image is not None:
+            # cropped from the frozen frame, nothing left to grab
+            self.make_prompt_request(prompt_data, prompt_input=screen_capture.selected_image)
+            return
+
+        @work_exception
+        def do_work():
+            """
+            Perform the screen capture
+            :return:
+            """
+            return GuiUtils.get_screen_capture_image(screen_region)
+        def done(result):
+            """
+            Handle the completion of the screen capture
+            :param result:
+            :return:
+            """
+            screen_image, error = result
+            if error:
+                GuiUtils.show_error(str(error))
+                return
+            self.make_prompt_request(prompt_data, prompt_input=screen_image)
+        worker = Worker(do_work)
+        worker.signals.result.connect(done)
+        self.threadpool.start(worker)
+
+    def start_region_watch(self, prompt_data):
+        """
+        Start watching a screen region, the action runs every time the content of the region changes
+        :param prompt_data:
+        :return:
+        """
+        screen_region = self.pick_screen_region().selected_region
+        if not screen_region or not screen_region[2] or not screen_region[3]:
+            return
+        watch_window = RegionWatchWindow(prompt_data, screen_region, self.prompt_processor)
+        # not deleted on close, the sample being processed keeps the window alive until it is done
+        watch_window.finished.connect(lambda _: self.region_watch_windows.remove(watch_window))
+        self.region_watch_windows.append(watch_window)
+        watch_window.show()
 
     def start_clipboard_text_capture(self, prompt_data):
         """
@@ -194,101 +229,174 @@ class MainWindow(QMainWindow):
         self.make_prompt_request(prompt_data, prompt_input=clipboard_text)
 
     @work_exception
-    def make_prompt_request_do_work(self, prompt_data: dict, prompt_input: typing.Union[str,PILImage]):
+    def make_prompt_request_do_work(
+            self,
+            progress_callback,
+            prompt_data: dict,
+            prompt_input: typing.Union[str,PILImage],
+            find_near_duplicates: bool = True
+    ):
         """
         Start the prompt data capture process
+        :param progress_callback: signal emitting a (model name, chunk) tuple for every streamed chunk
         :param prompt_data:
         :param prompt_input:
-        :param kwargs:
+        :param find_near_duplicates: answer a capture close to a saved one with the saved responses
         :return:
         """
-        prompt_result = self.process_prompt_request(prompt_data, prompt_input)
+        # captures are encoded once, the payload is shared by the models, the cache and the history
+        with Tracer.span("encode capture", "capture"):
+            prompt_input = PromptProcessor.to_payload(prompt_input)
+        if find_near_duplicates:
+            with Tracer.span("near-duplicate lookup", "db"):
+                near_duplicate = self.near_duplicate_index.lookup(prompt_data.get("action"), prompt_input)
+            if near_duplicate is not None:
+                return {
+                    "prompt_data": prompt_data,
+                    "prompt_input": prompt_input,
+                    "prompt_result": near_duplicate["prompt_result"],
+                    "coalesced": False,
+                    "near_duplicate": near_duplicate
+                }
+
+        def run_request():
+            # routed by the first request only, the requests attached to it share its picked model
+            routed_prompt_data, route = self.prompt_processor.route_models(prompt_data, prompt_input)
+            prompt_result = self.prompt_processor.process_prompt_request(
+                routed_prompt_data,
+                prompt_input,
+                on_chunk=lambda model_name, chunk: progress_callback.emit((model_name, chunk)),
+                input_hash=input_hash
+            )
+            return prompt_result, route
+
+        # the same action on the same input while it is still running shares the first request
+        input_hash = ResponseCache.hash_input(prompt_input)
+        (prompt_result, route), coalesced = self.request_coalescer.run(
+            RequestCoalescer.make_key(prompt_data, input_hash), run_request
+        )
         return {
             "prompt_data": prompt_data,
             "prompt_input": prompt_input,
-            "prompt_result": prompt_result
+            "prompt_result": prompt_result,
+            "coalesced": coalesced,
+            "route": route
         }
-    def make_prompt_request_done(self, result):
+
+    def make_prompt_request_progress(self, progress, output_dialog: OutputDialog):
+        """
+        Append a streamed chunk to the output dialog, opening it on the first chunk
+        :param progress:
+        :param output_dialog:
+        :return:
+        """
+        model_name, chunk = progress
+        output_dialog.append_model_output(model_name, chunk)
+        if not output_dialog.opened:
+            self.show_output_dialog(output_dialog)
+
+    def make_prompt_request_done(self, result, output_dialog: OutputDialog):
         """
         Handle the completion of the screen capture and description generation
         :param result:
+        :param output_dialog:
         :return:
         """
         prompt_info, error = result
+        self.menu.loading_indicator.close()
+        output_dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
         if error:
+            output_dialog.deleteLater()
             GuiUtils.show_error(str(error))
             return
-        self.menu.loading_indicator.close()
-        self.create_output_dialog(prompt_info)
-
-    def make_prompt_request(self, prompt_data: dict, prompt_input: typing.Union[str,PILImage]):
+        output_dialog.prompt_info["prompt_input"] = prompt_info["prompt_input"]
+        if prompt_info.get("coalesced"):
+            # the output is already shown by the dialog of the request it was attached to
+            output_dialog.deleteLater()
+            return
+        output_dialog.set_prompt_result(prompt_info["prompt_result"])
+        near_duplicate = prompt_info.get("near_duplicate")
+        if near_duplicate is not None:
+            output_dialog.show_near_duplicate_notice(
+                near_duplicate["distance"],
+                lambda: self.make_prompt_request(
+                    prompt_info["prompt_data"], prompt_info["prompt_input"], find_near_duplicates=False
+                )
+            )
+        route = prompt_info.get("route")
+        if route is not None:
+            output_dialog.show_route_notice(route)
+        if not output_dialog.opened:
+            self.show_output_dialog(output_dialog)
+        elif not output_dialog.isVisible():
+            # closed by the user while the other models were still running
+            output_dialog.deleteLater()
+
+    def make_prompt_request(
+            self,
+            prompt_data: dict,
+            prompt_input: typing.Union[str,PILImage],
+            find_near_duplicates: bool = True
+    ):
         """
         Start the prompt data capture process
         :param prompt_data:
         :param prompt_input:
-        :param kwargs:
+        :param find_near_duplicates: answer a capture close to a saved one with the saved responses
         :return:
         """
         self.menu.loading_indicator.show()
-
-        worker = Worker(self.make_prompt_request_do_work, prompt_data, prompt_input)
-        worker.signals.result.connect(self.make_prompt_request_done)
+        request_span = Tracer.begin_async("prompt request", "gui", action=prompt_data.get("action"))
+        output_dialog = self.create_output_dialog({
+            "prompt_data": prompt_data,
+            "prompt_input": prompt_input,
+            "prompt_result": {}
+        })
+
+        worker = Worker(
+            self.make_prompt_request_do_work,
+            prompt_data,
+            prompt_input,
+            find_near_duplicates=find_near_duplicates,
+            progress_callback=True
+        )
+        worker.signals.progress.connect(lambda progress: self.make_prompt_request_progress(progress, output_dialog))
+        worker.signals.result.connect(lambda result: self.make_prompt_request_done(result, output_dialog))
+        worker.signals.finished.connect(lambda: Tracer.end_async(request_span, "prompt request", "gui"))
         self.threadpool.start(worker)
 
-    def create_output_dialog(self, prompt_info: dict):
+    def create_output_dialog(self, prompt_info: dict) -> OutputDialog:
         """
-        Create an output window
-        :param text:
+        Create an output window, it is shown once the first model output arrives
+        :param prompt_info:
         :return:
         """
-        dialog = OutputDialog(prompt_info, parent=self)
-        dialog.setWindowTitle("Output")
-        dialog.adjustSize()
-        GuiUtils.move_window_to_center(dialog)
-        dialog.activateWindow()
-        dialog.exec()
+        with Tracer.span("OutputDialog construction", "gui"):
+            dialog = OutputDialog(prompt_info, parent=self)
+            dialog.setWindowTitle("Output")
+        return dialog
 
-    @staticmethod
-    def call_llm(model, system_instruction, multimodal_prompt):
+    def show_output_dialog(self, dialog: OutputDialog):
         """
-        Standalone function to call the language model
-        :param model:
-        :param system_instruction:
-        :param multimodal_prompt:
+        Show an output window without blocking the streaming of the remaining models
+        :param dialog:
         :return:
         """
-        llm = LLM.create(model, system_instruction=system_instruction)
-        return llm(multimodal_prompt)
+        with Tracer.span("show OutputDialog", "gui"):
+            dialog.opened = True
+            dialog.adjustSize()
+            GuiUtils.move_window_to_center(dialog)
+            dialog.show()
+            dialog.activateWindow()
 
-
-    def process_prompt_request(self, prompt_data: dict, prompt_input:  typing.Union[str,PILImage]) -> dict:
+    def closeEvent(self, event):
         """
-        Call the language model
-        :param prompt_data:
-        :param prompt_input:
+        Stop the inference workers when the application window is closed.
+        :param event:
         :return:
         """
-        models = prompt_data.get("models")
-        system_instruction = prompt_data.get("system_instruction")
-        guidance_prompt = prompt_data.get("guidance_prompt")
-        multimodal_prompt = [guidance_prompt, prompt_input]
-
-        models  = models.split(",") if models else []
-        results = {}
-        with ThreadPoolExecutor() as executor:
-            futures = {
-                executor.submit(self.call_llm, model, system_instruction, multimodal_prompt): model
-                for model in models
-            }
-            for future in tqdm(as_completed(futures), total=len(futures)):
-                model_name = futures[future]
-                try:
-                    results[model_name] = future.result()
-                except Exception as e:
-                    results[model_name] = f"Error by running inference on model {model_name}: {e}"
-        return results
-
-
+        self.scheduler.shutdown(wait=False, cancel_pending=True)
+        super().closeEvent(event)
 
     def mousePressEvent(self, event):
         """
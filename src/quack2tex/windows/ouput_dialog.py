@@ -4,9 +4,10 @@ import time
 from PyQt6.QtWidgets import QMessageBox
 
 from quack2tex.pyqt import (
-    QToolBox, QDialog, QVBoxLayout, QWidget, QPushButton,
+    QToolBox, QDialog, QVBoxLayout, QHBoxLayout, QWidget, QPushButton, QLabel,
     QApplication, QIcon, QCursor, Qt, QSplitter, QThreadPool, Slot
 )
+from quack2tex.inference import NearDuplicateIndex
 from quack2tex.repository import PromptRepository
 from quack2tex.resources import *  # noqa: F401
 from quack2tex.utils import Worker
@@ -25,7 +26,10 @@ class OutputDialog(QDialog):
 
         self.threadpool = QThreadPool()
         self.prompt_info = prompt_info
+        self.prompt_info.setdefault("prompt_result", {})
         self.prompt_id = None  # Optional placeholder
+        self.viewers = {}
+        self.opened = False
 
         self.toolbox = QToolBox()
         self.layout = QVBoxLayout(self)
@@ -37,10 +41,13 @@ class OutputDialog(QDialog):
     def populate_toolbox(self):
         prompt_result = self.prompt_info.get("prompt_result", {})
         for model_name, model_output in prompt_result.items():
-            self.toolbox.addItem(
-                self.create_toolbox_page(model_name, model_output),
-                model_name
-            )
+            self.add_model_page(model_name, model_output)
+
+    def add_model_page(self, model_name: str, model_output: str = ""):
+        self.toolbox.addItem(
+            self.create_toolbox_page(model_name, model_output),
+            model_name
+        )
 
     def create_toolbox_page(self, model_name: str, model_output: str) -> QWidget:
         widget = QWidget()
@@ -50,11 +57,14 @@ class OutputDialog(QDialog):
 
         viewer = MarkdownViewer()
         viewer.content = model_output
+        self.viewers[model_name] = viewer
 
         toolbar = QSplitter(Qt.Orientation.Horizontal)
 
         btn_copy = self._make_icon_button(":icons/copy-clipboard.png", "Copy to clipboard")
-        btn_copy.clicked.connect(lambda _, content=model_output: self.on_copy_text(content))
+        btn_copy.clicked.connect(
+            lambda _, model=model_name: self.on_copy_text(self.prompt_info["prompt_result"][model])
+        )
 
         btn_save = self._make_icon_button(":icons/save.png", "Save to database")
         btn_save.clicked.connect(lambda _, model=model_name: self.on_save_to_db(model))
@@ -66,6 +76,71 @@ class OutputDialog(QDialog):
         layout.addWidget(viewer)
         return widget
 
+    def append_model_output(self, model_name: str, chunk: str):
+        """
+        Append a streamed chunk to the page of the model, creating the page on its first chunk.
+        """
+        prompt_result = self.prompt_info["prompt_result"]
+        if model_name not in self.viewers:
+            prompt_result[model_name] = ""
+            self.add_model_page(model_name)
+        prompt_result[model_name] += chunk
+        self.viewers[model_name].append_content(chunk)
+
+    def set_prompt_result(self, prompt_result: dict):
+        """
+        Set the final output of every model, adding the pages of models that did not stream any output.
+        """
+        for model_name, model_output in prompt_result.items():
+            if model_name not in self.viewers:
+                self.add_model_page(model_name, model_output)
+            elif self.prompt_info["prompt_result"].get(model_name) != model_output:
+                self.viewers[model_name].content = model_output
+            self.prompt_info["prompt_result"][model_name] = model_output
+
+    def show_near_duplicate_notice(self, distance: int, on_rerun: typing.Callable[[], None]):
+        """
+        Tell that the output shown is the saved one of a similar capture, with a button to run the models anyway.
+        :param distance: Hamming distance between the perceptual hashes of the captures
+        :param on_rerun: Called once the dialog is closed when the user asks to run the models
+        :return:
+        """
+        notice = QWidget()
+        layout = QHBoxLayout(notice)
+        layout.setContentsMargins(0, 0, 0, 0)
+        label = QLabel(f"Saved responses of a similar capture (distance {distance}).")
+        btn_rerun = QPushButton("Re-run")
+        btn_rerun.setToolTip("Run the models on this capture")
+        btn_rerun.setCursor(QCursor(Qt.CursorShape.PointingHandCursor))
+
+        def rerun():
+            self.close()
+            on_rerun()
+
+        btn_rerun.clicked.connect(rerun)
+        layout.addWidget(label, 1)
+        layout.addWidget(btn_rerun)
+        self.layout.insertWidget(0, notice)
+
+    def show_route_notice(self, route: dict):
+        """
+        Tell which model the auto model of the action picked and why, see `ModelRouter.route`.
+        :param route:
+        :return:
+        """
+        model_name = route["model"]
+        stats = route.get("stats") or {}
+        label = QLabel(f"Auto model: {model_name} ({route['reason']}).")
+        if stats.get("calls"):
+            label.setToolTip(
+                f"{stats['calls']} recent calls, {stats['error_rate']:.0%} errors"
+                + (f", median latency {stats['latency_p50']:.2f}s" if stats.get("latency_p50") is not None else "")
+            )
+        self.layout.insertWidget(0, label)
+        for index in range(self.toolbox.count()):
+            if self.toolbox.itemText(index) == model_name:
+                self.toolbox.setItemText(index, f"{model_name} (auto)")
+
     def _make_icon_button(self, icon_path: str, tooltip: str) -> QPushButton:
         btn = QPushButton()
         btn.setIcon(QIcon(icon_path))
@@ -104,6 +179,7 @@ class OutputDialog(QDialog):
                 try:
                     session.begin()  # Begin a new transaction
 
+                    prompt_id = None
                     if self.prompt_id is None:
                         # Save prompt
                         prompt_id = PromptRepository.add_prompt(
@@ -111,7 +187,8 @@ class OutputDialog(QDialog):
                             system_instruction=prompt_info["prompt_data"].get("system_instruction", ""),
                             guidance_prompt=prompt_info["prompt_data"].get("guidance_prompt", ""),
                             input_data=self.prompt_info["prompt_input"],
-                            capture_mode=prompt_info["prompt_data"].get("capture_mode", "")
+                            capture_mode=prompt_info["prompt_data"].get("capture_mode", ""),
+                            action=prompt_info["prompt_data"].get("action")
                         )
                         self.prompt_id = prompt_id
 
@@ -126,6 +203,8 @@ class OutputDialog(QDialog):
                     )
 
                     session.commit()
+                    if prompt_id is not None:
+                        self.index_prompt(prompt_id, prompt_info)
                     progress_callback.emit("✅ Prompt and response saved successfully.")
                     return "Prompt and response saved"
 
@@ -139,6 +218,18 @@ class OutputDialog(QDialog):
             raise
 
 
+    @staticmethod
+    def index_prompt(prompt_id: int, prompt_info: dict):
+        """
+        Make a saved capture available to the near-duplicate lookup.
+        :param prompt_id:
+        :param prompt_info:
+        :return:
+        """
+        prompt_input = prompt_info["prompt_input"]
+        perceptual_hash = getattr(prompt_input, "perceptual_hash", None)
+        NearDuplicateIndex().add(prompt_info["prompt_data"].get("action"), perceptual_hash, prompt_id)
+
     def save_prompt_done(self, result: str):
         print(f"✅ Done: {result}")
         QMessageBox.information(
@@ -0,0 +1,179 @@
+import logging
+import os
+import time
+import typing
+
+from quack2tex.inference import PromptProcessor
+from quack2tex.pyqt import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QFileDialog, QTimer, QThreadPool, Qt
+)
+from quack2tex.utils import FrameDiffer, GuiUtils, ScreenGrabber, Tracer, Worker, work_exception
+from quack2tex.widgets import MarkdownViewer
+
+logger = logging.getLogger(__name__)
+
+
+class RegionWatchWindow(QDialog):
+    """
+    Watches a screen region and runs an action every time its content changes, e.g. the slides of a lecture.
+
+    The region is sampled periodically, each sample is compared to the content last sent with a
+    `FrameDiffer`, and the action runs only on new content. Unchanged samples are never converted
+    to images nor sent. The outputs are appended to a running document, which can be saved.
+    """
+
+    def __init__(
+            self,
+            prompt_data: dict,
+            screen_region: typing.Tuple[int, int, int, int],
+            prompt_processor: PromptProcessor,
+            interval: float = None,
+            parent=None
+    ):
+        """
+        Initialize the window, the sampling starts once it is shown.
+
+        :param prompt_data: The action run on the new content
+        :param screen_region: left, top, width and height of the region, see `GuiUtils.get_screen_capture_image`
+        :param prompt_processor: The inference pipeline of the application
+        :param interval: Seconds between two samples, QUACK2TEX_WATCH_INTERVAL, 1 by default
+        :param parent:
+        """
+        super().__init__(parent)
+        self.setWindowTitle(f"Watching - {prompt_data.get('action') or 'region'}")
+        self.setGeometry(100, 100, 800, 600)
+        self.setWindowFlags(self.windowFlags() | Qt.WindowType.WindowStaysOnTopHint)
+
+        self.prompt_data = prompt_data
+        self.screen_region = screen_region
+        self.prompt_processor = prompt_processor
+        self.differ = FrameDiffer()
+        self.threadpool = QThreadPool()
+        self.sampling = False
+        self.samples = 0
+        self.sent = 0
+        self.document: typing.List[str] = []
+
+        interval = interval if interval is not None else float(os.getenv("QUACK2TEX_WATCH_INTERVAL", 1.0))
+        self.timer = QTimer(self)
+        self.timer.setInterval(max(100, int(interval * 1000)))
+        self.timer.timeout.connect(self.sample)
+
+        self.viewer = MarkdownViewer()
+        self.lbl_status = QLabel("Waiting for the first frame")
+        self.btn_pause = QPushButton("Pause")
+        self.btn_pause.clicked.connect(self.on_pause)
+        btn_save = QPushButton("Save")
+        btn_save.clicked.connect(self.on_save)
+        btn_stop = QPushButton("Stop")
+        btn_stop.clicked.connect(self.close)
+
+        toolbar = QHBoxLayout()
+        toolbar.addWidget(self.lbl_status, 1)
+        toolbar.addWidget(self.btn_pause)
+        toolbar.addWidget(btn_save)
+        toolbar.addWidget(btn_stop)
+        layout = QVBoxLayout(self)
+        layout.addLayout(toolbar)
+        layout.addWidget(self.viewer)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
+
+    def on_pause(self):
+        """
+        Pause or resume the sampling, the content shown while paused is compared to the last one sent on resume
+        :return:
+        """
+        if self.timer.isActive():
+            self.timer.stop()
+            self.btn_pause.setText("Resume")
+        else:
+            self.timer.start()
+            self.btn_pause.setText("Pause")
+
+    def on_save(self):
+        """
+        Save the running document as markdown
+        :return:
+        """
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save document", "", "Markdown (*.md)")
+        if not file_path:
+            return
+        try:
+            with open(file_path, "w", encoding="utf-8") as file:
+                file.write("\n\n".join(self.document) + "\n")
+        except OSError as e:
+            GuiUtils.show_error(str(e))
+
+    @work_exception
+    def sample_do_work(self):
+        """
+        Grab the region and run the action when its content is new
+        :return: The difference with the last content sent, and the outputs of the models when it was sent
+        """
+        frame = ScreenGrabber.grab(*self.screen_region)
+        with Tracer.span("frame difference", "capture"):
+            signature = self.differ.signature(frame)
+            is_new, score = self.differ.is_new(signature)
+        if not is_new:
+            return {"score": score, "prompt_result": None}
+        # accepted before the call, a failed call is not retried on the same content
+        self.differ.accept(signature)
+        prompt_result = self.prompt_processor.process_prompt_request(self.prompt_data, frame.to_image())
+        return {"score": score, "prompt_result": prompt_result}
+
+    def sample_done(self, result):
+        """
+        Append the outputs of new content to the document
+        :param result:
+        :return:
+        """
+        self.sampling = False
+        sample, error = result
+        if error:
+            self.lbl_status.setText(f"Error: {error}")
+            logger.warning("Watching the region failed: %s", error)
+            return
+        self.samples += 1
+        prompt_result = sample["prompt_result"]
+        if prompt_result is not None:
+            self.sent += 1
+            self.append_result(prompt_result)
+        self.lbl_status.setText(
+            f"{self.samples} samples, {self.sent} sent, last change {sample['score']:.0%}"
+        )
+
+    def sample(self):
+        """
+        Take a sample, unless the previous one is still being processed
+        :return:
+        """
+        if self.sampling:
+            return
+        self.sampling = True
+        worker = Worker(self.sample_do_work)
+        worker.signals.result.connect(self.sample_done)
+        self.threadpool.start(worker)
+
+    def append_result(self, prompt_result: dict):
+        """
+        Append the outputs of the models to the document, under the time of the capture
+        :param prompt_result:
+        :return:
+        """
+        parts = [f"### {time.strftime('%H:%M:%S')}"]
+        if len(prompt_result) == 1:
+            parts.extend(prompt_result.values())
+        else:
+            for model_name, model_output in prompt_result.items():
+                parts.append(f"**{model_name}**")
+                parts.append(model_output)
+        section = "\n\n".join(parts)
+        self.document.append(section)
+        self.viewer.append_content(("\n\n" if len(self.document) > 1 else "") + section)
@@ -1,21 +1,74 @@
+import typing
+
+from PIL.Image import Image as PILImage
+
 from quack2tex.pyqt import (
-    Qt, QPoint, QRect, QSize,QDialog, QRubberBand
+    Qt, QPoint, QRect, QSize, QDialog, QRubberBand, QImage, QPainter, QColor
 )
+from quack2tex.utils import ScreenFrame
+
 
 class ScreenCaptureWindow(QDialog):
     """
-    A semi-transparent window that allows the user to select a region to capture
+    A full screen window that allows the user to select a region to capture.
+
+    When given a frame of the monitor grabbed as it opens, the window shows it dimmed as its
+    background and crops the selection from it on mouse release, so the capture is ready at once
+    and matches what the user saw. Without frame the window is semi-transparent and only gives
+    the region to grab once it is closed.
     """
 
-    def __init__(self):
+    def __init__(self, frame: ScreenFrame = None, monitor: dict = None):
+        """
+        Initialize the window, its geometry must be set to the geometry of the monitor.
+
+        :param frame: The frozen monitor, in physical pixels
+        :param monitor: left, top, width and height of the monitor in the coordinates of the grabs
+        """
         super().__init__()
         self.setWindowTitle("Select Region to Capture")
-        self.setWindowOpacity(0.3)
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint)
+        self.frame = frame
+        self.monitor = monitor
+        self.background = None
+        if frame is not None:
+            # Format_RGB32 is BGRA in memory on little-endian machines, the frame buffer is drawn as is
+            bgra = frame.bgra
+            self.background = QImage(
+                bgra.data, frame.width, frame.height, bgra.strides[0], QImage.Format.Format_RGB32
+            )
+        else:
+            self.setWindowOpacity(0.3)
         self.start_point = QPoint()
         self.end_point = QPoint()
         self.rubber_band = QRubberBand(QRubberBand.Shape.Rectangle, self)
         self.selected_region = None
+        self.selected_image: typing.Optional[PILImage] = None
+
+    def paintEvent(self, event):
+        """
+        Draw the frozen monitor, dimmed outside of the selection
+        :param event:
+        :return:
+        """
+        if self.background is None:
+            return super().paintEvent(event)
+        painter = QPainter(self)
+        painter.drawImage(self.rect(), self.background)
+        dimmed = QColor(0, 0, 0, 90)
+        if self.rubber_band.isVisible():
+            selection = self.rubber_band.geometry()
+            outside = [
+                QRect(0, 0, self.width(), selection.top()),
+                QRect(0, selection.bottom() + 1, self.width(), self.height() - selection.bottom() - 1),
+                QRect(0, selection.top(), selection.left(), selection.height()),
+                QRect(selection.right() + 1, selection.top(), self.width() - selection.right() - 1, selection.height()),
+            ]
+            for rect in outside:
+                painter.fillRect(rect, dimmed)
+        else:
+            painter.fillRect(self.rect(), dimmed)
+        painter.end()
 
     def mousePressEvent(self, event):
         """
@@ -34,6 +87,8 @@ class ScreenCaptureWindow(QDialog):
         :return:
         """
         self.rubber_band.setGeometry(QRect(self.start_point, event.pos()).normalized())
+        if self.background is not None:
+            self.update()
 
     def mouseReleaseEvent(self, event):
         """
@@ -43,6 +98,11 @@ class ScreenCaptureWindow(QDialog):
         """
         self.end_point = event.pos()
         self.selected_region = self.capture_region()
+        if self.frame is not None and self.selected_region[2] > 0 and self.selected_region[3] > 0:
+            left, top, width, height = self.selected_region
+            self.selected_image = self.frame.crop(
+                left - self.frame.left, top - self.frame.top, width, height
+            ).to_image()
         self.close()
 
     def keyPressEvent(self, event):
@@ -58,17 +118,19 @@ class ScreenCaptureWindow(QDialog):
     def capture_region(self):
         """
         Capture the selected region
-        :return:
+        :return: left, top, width and height of the region in the coordinates of the grabs
         """
         x1 = min(self.start_point.x(), self.end_point.x())
         y1 = min(self.start_point.y(), self.end_point.y())
         x2 = max(self.start_point.x(), self.end_point.x())
         y2 = max(self.start_point.y(), self.end_point.y())
+        if self.monitor is None:
+            # no monitor to map to, the logical position of the window is the best guess
+            return (self.x() + x1, self.y() + y1, x2 - x1, y2 - y1)
 
-        # # relative to the screen
-        # left_percent = x1 / self.screen().geometry().width()
-        # top_percent = y1 / self.screen().geometry().height()
-        # width_percent = (x2 - x1) / self.screen().geometry().width()
-        # height_percent = (y2 - y1) / self.screen().geometry().height()
-
-        return (x1, y1, x2 - x1, y2 - y1)
+        # the window is in logical pixels, the grabs in physical pixels on scaled displays
+        scale_x = self.monitor["width"] / max(self.width(), 1)
+        scale_y = self.monitor["height"] / max(self.height(), 1)
+        left = self.monitor["left"] + round(x1 * scale_x)
+        top = self.monitor["top"] + round(y1 * scale_y)
+        return (left, top, round(x2 * scale_x) - round(x1 * scale_x), round(y2 * scale_y) - round(y1 * scale_y))
@@ -1,13 +1,14 @@
 from typing import Any
 
 from quack2tex import LLM
-from quack2tex.enums import CaptureMode
+from quack2tex.enums import CaptureMode, InferenceStrategy
+from quack2tex.inference import OutputValidator
 from quack2tex.utils import GuiUtils, Worker, work_exception
 from quack2tex.widgets import FileUploader, ModelPicker, PromptInput
 from quack2tex.pyqt import (
     QDialog, QVBoxLayout, QFormLayout, QTextEdit, QSizePolicy,
     QDialogButtonBox, QComboBox, Qt, QObject, Signal, QLabel,
-    QThreadPool, Property
+    QThreadPool, Property, QCheckBox
 )
 
 
@@ -34,6 +35,35 @@ class CaptureModeComboBox(QComboBox):
     capture_mode = Property(str, get_capture_mode, set_capture_mode)
 
 
+class InferenceStrategyComboBox(QComboBox):
+    """
+    A combo box for selecting how the models of an action are run.
+    """
+
+    descriptions = {
+        InferenceStrategy.ALL: "Wait for all the models",
+        InferenceStrategy.RACE: "Race: first acceptable answer wins",
+        InferenceStrategy.CASCADE: "Cascade: try the models in order until an answer is acceptable",
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        for strategy in InferenceStrategy:
+            self.addItem(self.descriptions[strategy], userData=strategy.value)
+
+    def get_strategy(self) -> str:
+        return self.currentData(Qt.ItemDataRole.UserRole)
+
+    def set_strategy(self, strategy: str) -> None:
+        strategy = strategy or InferenceStrategy.ALL.value
+        for i in range(self.count()):
+            if self.itemData(i, Qt.ItemDataRole.UserRole) == strategy:
+                self.setCurrentIndex(i)
+                break
+
+    strategy = Property(str, get_strategy, set_strategy)
+
+
 class MenuItemForm(QDialog, QObject):
     """
     A form dialog for editing or creating a menu item.
@@ -44,6 +74,9 @@ class MenuItemForm(QDialog, QObject):
     guidance_prompt = GuiUtils.bind("txt_guidance_prompt", "plainText", str)
     models = GuiUtils.bind("list_model_picker", "models", str)
     capture_mode = GuiUtils.bind("cbx_capture_mode", "capture_mode", str)
+    use_cache = GuiUtils.bind("chk_use_cache", "checked", bool)
+    strategy = GuiUtils.bind("cbx_strategy", "strategy", str)
+    validators = GuiUtils.bind("txt_validators", "plainText", str)
 
     on_widget_loaded = Signal(dict)
 
@@ -72,7 +105,10 @@ class MenuItemForm(QDialog, QObject):
             "system_instruction": self.system_instruction,
             "guidance_prompt": self.guidance_prompt,
             "models": self.models,
-            "capture_mode": self.capture_mode
+            "capture_mode": self.capture_mode,
+            "use_cache": self.use_cache,
+            "strategy": self.strategy,
+            "validators": self.validators
         }
 
     @form_values.setter
@@ -83,6 +119,9 @@ class MenuItemForm(QDialog, QObject):
         self.guidance_prompt = data.get("guidance_prompt", "")
         self.models = data.get("models", [])
         self.capture_mode = data.get("capture_mode", None)
+        self.use_cache = data.get("use_cache") is not False
+        self.strategy = data.get("strategy", None)
+        self.validators = data.get("validators") or ""
 
 
     def load_form(self) -> None:
@@ -140,6 +179,24 @@ class MenuItemForm(QDialog, QObject):
         self._set_expandable(self.cbx_capture_mode)
         form_layout.addRow("Capture Mode:", self.cbx_capture_mode)
 
+        self.cbx_strategy = InferenceStrategyComboBox(self)
+        self.cbx_strategy.setFixedHeight(30)
+        self.cbx_strategy.setObjectName("cbx_strategy")
+        self._set_expandable(self.cbx_strategy)
+        form_layout.addRow("Strategy:", self.cbx_strategy)
+
+        self.txt_validators = self._create_text_edit(
+            "txt_validators",
+            "Acceptance checks, one per line: latex, latex_parsable, min_length:<n>, max_length:<n>, regex:<pattern>",
+            height=60
+        )
+        form_layout.addRow("Validators:", self.txt_validators)
+
+        self.chk_use_cache = QCheckBox("Reuse cached responses for identical inputs", self)
+        self.chk_use_cache.setObjectName("chk_use_cache")
+        self.chk_use_cache.setChecked(True)
+        form_layout.addRow("Cache:", self.chk_use_cache)
+
         buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         buttons.accepted.connect(self.accept)
         buttons.rejected.connect(self.reject)
@@ -178,10 +235,18 @@ class MenuItemForm(QDialog, QObject):
         self.setTabOrder(self.txt_system_instructions, self.txt_guidance_prompt)
         self.setTabOrder(self.txt_guidance_prompt, self.list_model_picker)
         self.setTabOrder(self.list_model_picker, self.cbx_capture_mode)
-        self.setTabOrder(self.cbx_capture_mode, button_box)
+        self.setTabOrder(self.cbx_capture_mode, self.cbx_strategy)
+        self.setTabOrder(self.cbx_strategy, self.txt_validators)
+        self.setTabOrder(self.txt_validators, self.chk_use_cache)
+        self.setTabOrder(self.chk_use_cache, button_box)
 
     def accept(self) -> None:
         if not self.name:
             GuiUtils.show_error("Name and icon are required.")
             return
+        try:
+            OutputValidator.from_spec(self.validators)
+        except ValueError as e:
+            GuiUtils.show_error(str(e))
+            return
         super().accept()
@@ -6,7 +6,7 @@ from typing import Optional
 from PIL import Image
 from PIL import Image as PILImage
 
-from quack2tex import GuiUtils
+from quack2tex.utils import GuiUtils
 from quack2tex.pyqt import (
     QModelIndex, QThreadPool, QSize, Signal, QIcon, QStandardItem, QPushButton, QToolBar,
     QTreeView,
@@ -135,6 +135,9 @@ class MenuManager(QFrame):
                 capture_mode=edit_item_form.capture_mode,
                 system_instruction=edit_item_form.system_instruction,
                 guidance_prompt=edit_item_form.guidance_prompt,
+                use_cache=edit_item_form.use_cache,
+                strategy=edit_item_form.strategy,
+                validators=edit_item_form.validators or None,
                 parent_id=tree_item_data.parent_id,
                 is_root=tree_item_data.is_root,
             )
@@ -262,6 +265,9 @@ class MenuManager(QFrame):
                 capture_mode=new_item_form.capture_mode,
                 system_instruction=new_item_form.system_instruction,
                 guidance_prompt=new_item_form.guidance_prompt,
+                use_cache=new_item_form.use_cache,
+                strategy=new_item_form.strategy,
+                validators=new_item_form.validators or None,
                 parent_id=parent_item.tag.id if parent_item else None
             )
             self.save_or_update_item(new_item)
@@ -0,0 +1,17 @@
+import pytest
+
+from quack2tex.utils import Singleton
+
+
+@pytest.fixture(autouse=True)
+def quack_home(tmp_path, monkeypatch):
+    """
+    Run every test with its own library home and fresh singletons, so the caches, cassettes and
+    databases of a test never leak into another one or into the home of the user.
+    """
+    home = tmp_path / "quack_home"
+    monkeypatch.setenv("QUACK_HOME", str(home))
+    for variable in ("QUACK2TEX_RESPONSE_CACHE_FILE", "QUACK2TEX_CASSETTE_FILE", "QUACK2TEX_CASSETTE_MODE"):
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr(Singleton, "_instances", {})
+    return home
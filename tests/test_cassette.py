@@ -0,0 +1,75 @@
+import pytest
+
+from quack2tex.inference import Cassette, CassetteMiss, LLMClientPool, PromptProcessor, RateLimiter, ReplayedError
+
+
+def record(cassette_file, calls):
+    """
+    Record calls, each one a (model, prompt, chunks, error) tuple.
+    """
+    cassette = Cassette(mode="record", cassette_file=cassette_file)
+    for model, prompt, chunks, error in calls:
+        def generate(chunks=chunks, error=error):
+            yield from chunks
+            if error is not None:
+                raise error
+
+        try:
+            for _ in cassette.iter_chunks(model, "system", [prompt], generate):
+                pass
+        except RuntimeError:
+            pass
+
+
+def replay_cassette(cassette_file) -> Cassette:
+    # the cassette is a singleton, the recording one is replaced
+    Cassette._instances.pop(Cassette, None)
+    return Cassette(mode="replay", cassette_file=cassette_file, latency_scale=0)
+
+
+def never_called():
+    raise AssertionError("a replayed call reached the model")
+
+
+def test_replay_serves_the_recorded_chunks(tmp_path):
+    cassette_file = tmp_path / "cassette.jsonl"
+    record(cassette_file, [("model-a", "x + y", ["$x", " + y$"], None)])
+    cassette = replay_cassette(cassette_file)
+    assert list(cassette.iter_chunks("model-a", "system", ["x + y"], never_called)) == ["$x", " + y$"]
+    # the last recording is served again once all were replayed
+    assert list(cassette.iter_chunks("model-a", "system", ["x + y"], never_called)) == ["$x", " + y$"]
+
+
+def test_replay_raises_the_recorded_error(tmp_path):
+    cassette_file = tmp_path / "cassette.jsonl"
+    record(cassette_file, [("model-a", "x", ["partial"], RuntimeError("boom"))])
+    cassette = replay_cassette(cassette_file)
+    chunks = []
+    with pytest.raises(ReplayedError, match="boom"):
+        for chunk in cassette.iter_chunks("model-a", "system", ["x"], never_called):
+            chunks.append(chunk)
+    assert chunks == ["partial"]
+
+
+def test_unrecorded_calls_miss(tmp_path):
+    cassette_file = tmp_path / "cassette.jsonl"
+    record(cassette_file, [("model-a", "x", ["$x$"], None)])
+    cassette = replay_cassette(cassette_file)
+    with pytest.raises(CassetteMiss):
+        list(cassette.iter_chunks("model-b", "system", ["x"], never_called))
+    with pytest.raises(CassetteMiss):
+        list(cassette.iter_chunks("model-a", "system", ["y"], never_called))
+
+
+def test_call_llm_replays_without_client_nor_rate_limiter(tmp_path, monkeypatch):
+    cassette_file = tmp_path / "cassette.jsonl"
+    record(cassette_file, [
+        ("gemini-test", "x", [], RuntimeError("429 Resource has been exhausted")),
+        ("gemini-test", "x", ["$x$"], None),
+    ])
+    replay_cassette(cassette_file)
+    monkeypatch.setattr(LLMClientPool, "get", lambda *args, **kwargs: never_called())
+    monkeypatch.setattr(RateLimiter, "call", lambda *args, **kwargs: never_called())
+    monkeypatch.setattr(RateLimiter, "consume", lambda *args, **kwargs: never_called())
+    # the recorded rate limit error is followed by the recorded retry
+    assert PromptProcessor.call_llm("gemini-test", "system", ["x"]) == "$x$"
@@ -0,0 +1,118 @@
+import base64
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from PIL import Image
+
+from quack2tex.server import InferenceServer
+from quack2tex.utils import PromptPayload
+
+
+class StubPromptProcessor:
+    """
+    Answers every model with a description of the prompt input, and records the requests.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def process_prompt_request(self, prompt_data, prompt_input, on_chunk=None, input_hash=None):
+        self.requests.append((prompt_data, prompt_input))
+        if isinstance(prompt_input, PromptPayload):
+            output = f"image {prompt_input.width}x{prompt_input.height}"
+        else:
+            output = f"text {prompt_input}"
+        models = prompt_data["models"].split(",")
+        for model in models:
+            if on_chunk is not None:
+                on_chunk(model, output)
+        return {model: output for model in models}
+
+
+@pytest.fixture
+def server():
+    server = InferenceServer(("127.0.0.1", 0), prompt_processor=StubPromptProcessor())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def post(server, path, body: bytes, content_type: str = "application/json"):
+    request = urllib.request.Request(
+        server.url + path, data=body, headers={"Content-Type": content_type}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def post_json(server, payload: dict, path: str = "/prompt"):
+    status, body = post(server, path, json.dumps(payload).encode("utf-8"))
+    return status, json.loads(body)
+
+
+def test_text_prompt(server):
+    status, response = post_json(server, {"models": "model-a,model-b", "text": "x^2"})
+    assert status == 200
+    assert response == {"action": None, "results": {"model-a": "text x^2", "model-b": "text x^2"}}
+    prompt_data, _ = server.prompt_processor.requests[0]
+    assert prompt_data["capture_mode"] == "api"
+    assert prompt_data["use_cache"] is True
+
+
+def test_image_prompt(server):
+    buffer = io.BytesIO()
+    Image.new("RGB", (30, 20), "white").save(buffer, format="PNG")
+    image = base64.b64encode(buffer.getvalue()).decode("ascii")
+    status, response = post_json(server, {"models": "model-a", "image": f"data:image/png;base64,{image}"})
+    assert status == 200
+    assert response["results"] == {"model-a": "image 30x20"}
+
+
+def test_raw_text_body(server):
+    status, body = post(server, "/prompt?models=model-a&use_cache=0", "a + b".encode("utf-8"), "text/plain")
+    assert status == 200
+    assert json.loads(body)["results"] == {"model-a": "text a + b"}
+    prompt_data, _ = server.prompt_processor.requests[0]
+    assert prompt_data["use_cache"] is False
+
+
+def test_streamed_prompt(server):
+    status, body = post(server, "/prompt", json.dumps({"models": "model-a", "text": "x", "stream": True}).encode())
+    assert status == 200
+    events = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+    assert events[0] == {"model": "model-a", "chunk": "text x"}
+    assert events[-1]["done"] is True
+    assert events[-1]["results"] == {"model-a": "text x"}
+
+
+@pytest.mark.parametrize(
+    "payload, status",
+    [
+        ({"text": "x"}, 400),
+        ({"models": "model-a"}, 400),
+        ({"models": "model-a", "image": "not base64!"}, 400),
+        ({"models": "model-a", "image": base64.b64encode(b"not an image").decode()}, 400),
+        ({"models": "model-a", "text": "x", "validators": "unknown"}, 400),
+    ],
+)
+def test_invalid_requests(server, payload, status):
+    response_status, response = post_json(server, payload)
+    assert response_status == status
+    assert "error" in response
+    assert not server.prompt_processor.requests
+
+
+def test_unknown_endpoint(server):
+    status, response = post_json(server, {"models": "model-a", "text": "x"}, path="/unknown")
+    assert status == 404
+    assert "error" in response
@@ -0,0 +1,51 @@
+import pytest
+
+from quack2tex.inference import OutputValidator
+
+
+@pytest.mark.parametrize(
+    "output, expected",
+    [
+        ("$$x^2$$", True),
+        ("The root is $\\sqrt{2}$.", True),
+        ("\\begin{aligned} a &= b \\end{aligned}", True),
+        ("x squared", False),
+        ("", False),
+        (None, False),
+    ],
+)
+def test_default_check_requires_latex(output, expected):
+    assert OutputValidator.from_spec(None)(output) is expected
+
+
+def test_latex_parsable():
+    check = OutputValidator.from_spec("latex_parsable")
+    assert check("$$\\frac{a}{b}$$ and $\\left( x \\right)$")
+    assert not check("$$\\frac{a}{b$$")
+    assert not check("$$\\begin{aligned} x \\end{cases}$$")
+    assert not check("$$\\left( x$$")
+    assert not check("no math at all")
+
+
+def test_escaped_braces_are_not_counted():
+    assert OutputValidator.from_spec("latex_parsable")("$\\{ x \\}$ and $a \\\\ b$")
+
+
+def test_length_bounds():
+    check = OutputValidator.from_spec("min_length: 3\nmax_length: 5")
+    assert not check("ab")
+    assert check("  abcd  ")
+    assert not check("abcdef")
+
+
+def test_all_validators_must_pass():
+    check = OutputValidator.from_spec("latex\nregex: \\\\frac")
+    assert check("$\\frac{1}{2}$")
+    assert not check("$x$")
+    assert not check("\\frac{1}{2}")
+
+
+@pytest.mark.parametrize("spec", ["unknown", "min_length: few", "regex: ("])
+def test_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        OutputValidator.from_spec(spec)
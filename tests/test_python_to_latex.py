@@ -0,0 +1,53 @@
+import pytest
+
+from quack2tex.latex.python_to_latex import PythonToLatex, UnsupportedSyntax
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("def area(r):\n    return math.pi * r ** 2", "\\operatorname{area}\\left(r\\right) = \\pi \\cdot r^{2}"),
+        ("def f(a, b):\n    return (a / b) ** 2", "f\\left(a, b\\right) = \\left(\\frac{a}{b}\\right)^{2}"),
+        ("def f(a, b):\n    return a / b * 2", "f\\left(a, b\\right) = \\frac{a}{b} \\cdot 2"),
+        (
+            "def f(x, n):\n    return sum(x[i] for i in range(1, n + 1)) + 1",
+            "f\\left(x, n\\right) = \\left(\\sum_{i=1}^{n} x_{i}\\right) + 1",
+        ),
+        (
+            "def f(x, n):\n    return sum(k for k in range(n)) * 2",
+            "f\\left(x, n\\right) = \\left(\\sum_{k=0}^{n - 1} k\\right) \\cdot 2",
+        ),
+    ],
+)
+def test_single_equation(source, expected):
+    assert PythonToLatex.translate(source) == f"$$\n{expected}\n$$"
+
+
+def test_assignments_are_aligned():
+    source = 'def hyp(a, b):\n    """Hypotenuse."""\n    c2 = a**2 + b**2\n    return math.sqrt(c2)'
+    assert PythonToLatex.translate(source) == (
+        "$$\n\\begin{aligned}\n"
+        "\\mathit{c2} &= a^{2} + b^{2} \\\\\n"
+        "\\operatorname{hyp}\\left(a, b\\right) &= \\sqrt{\\mathit{c2}}\n"
+        "\\end{aligned}\n$$"
+    )
+
+
+def test_decorators_are_ignored():
+    source = "@quack2tex.latify()\ndef double(x):\n    return 2 * x"
+    assert PythonToLatex.translate(source) == "$$\n\\operatorname{double}\\left(x\\right) = 2 \\cdot x\n$$"
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "def f(x):\n    for i in x:\n        pass\n    return x",
+        "def f(*args):\n    return 1",
+        "def f(x):\n    print(x)",
+        "def f(x):\n    return x\ndef g(x):\n    return x",
+        "def f(x:\n",
+    ],
+)
+def test_unsupported_sources(source):
+    with pytest.raises(UnsupportedSyntax):
+        PythonToLatex.translate(source)
@@ -0,0 +1,80 @@
+import pytest
+from PIL import Image
+
+from quack2tex.inference import ResponseCache, response_cache
+from quack2tex.utils import PromptPayload
+
+
+class Clock:
+    """
+    A clock moving one second per read, so the LRU order of the entries does not depend on timing.
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        self.now += 1
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock.time)
+    return clock
+
+
+def make_cache(tmp_path, **kwargs) -> ResponseCache:
+    return ResponseCache(cache_file=tmp_path / "cache.db", **kwargs)
+
+
+def test_put_and_get(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.put("key", "model", "$x$")
+    assert cache.get("key") == "$x$"
+    assert cache.get("missing") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=10)
+    cache.put("a", "model", "aaaa")
+    cache.put("b", "model", "bbbb")
+    # reading a makes b the least recently used entry
+    assert cache.get("a") == "aaaa"
+    cache.put("c", "model", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+
+
+def test_zero_bytes_keeps_nothing(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=0)
+    cache.put("a", "model", "a")
+    assert cache.get("a") is None
+
+
+def test_expired_entries_are_dropped(tmp_path, clock):
+    cache = make_cache(tmp_path, max_age=60)
+    cache.put("a", "model", "a")
+    assert cache.get("a") == "a"
+    clock.advance(120)
+    assert cache.get("a") is None
+
+
+def test_zero_age_expires_at_once(tmp_path, clock):
+    cache = make_cache(tmp_path, max_age=0)
+    cache.put("a", "model", "a")
+    assert cache.get("a") is None
+
+
+def test_input_hash_does_not_depend_on_the_encoding():
+    image = Image.new("RGB", (40, 20), "white")
+    image.putpixel((10, 10), (0, 0, 0))
+    payload = PromptPayload.from_image(image)
+    assert ResponseCache.hash_input(payload) == ResponseCache.hash_input(image)
+    assert ResponseCache.hash_input(PromptPayload.from_bytes(payload.data)) == ResponseCache.hash_input(image)
+    assert ResponseCache.hash_input("a\r\nb ") == ResponseCache.hash_input("a\nb")